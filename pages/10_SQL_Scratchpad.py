@@ -0,0 +1,43 @@
+import streamlit as st
+from utils import duck
+from utils.config import SQL_SCRATCHPAD_MAX_ROWS
+from utils.db import TABLE_NAMES, load_tables
+from utils.formatters import format_number
+
+st.title("🧮 SQL Scratchpad")
+
+if st.session_state.get("role") != "admin":
+    st.error("The SQL scratchpad is available to admins only.")
+    st.stop()
+
+if not duck.available():
+    st.info("Install the optional `duckdb` package to enable the SQL scratchpad.")
+    st.stop()
+
+st.caption(
+    "Read-only SELECT / WITH queries, run in embedded DuckDB over the tables as the dashboards "
+    "load them. Your SQL never runs against the production database, but loading the tables reads "
+    "from it when a table's local snapshot is missing or stale (or snapshots are off). "
+    f"Results are capped at {SQL_SCRATCHPAD_MAX_ROWS:,} rows."
+)
+
+dfs = load_tables(list(TABLE_NAMES))
+
+with st.expander("Tables"):
+    for name, df in dfs.items():
+        st.markdown(f"**{name}** ({format_number(len(df))} rows): " + ", ".join(f"`{c}`" for c in df.columns))
+
+sql = st.text_area(
+    "Query",
+    value="SELECT utm_source, count(*) AS sessions\nFROM website_sessions\nGROUP BY 1\nORDER BY 2 DESC",
+    height=200,
+)
+
+if st.button("Run"):
+    try:
+        result = duck.readonly_query(sql, dfs, SQL_SCRATCHPAD_MAX_ROWS)
+    except Exception as e:
+        st.error(f"Query failed: {e}")
+    else:
+        st.caption(f"{format_number(len(result))} rows")
+        st.dataframe(result, use_container_width=True)
@@ -2,11 +2,11 @@ import streamlit as st
 import plotly.express as px
 import pandas as pd
 import os
-from utils.db import load_tables
+from utils.memo import filtered_tables
+from utils.cube import cube_query
+from utils.timeseries import bucket_totals
 from utils.filters import sidebar_filters
 from utils.agg import (
-    filter_sessions, filter_pageviews, rollup,
-    compute_bounce_rate, compute_conversion_rate,
     hour_weekday_session_volume
 )
 from utils.formatters import  format_percent, format_number, format_km
@@ -16,20 +16,25 @@ st.title("🌐 Traffic & Acquisition")
 
 F = sidebar_filters()
 
-dfs = load_tables(["website_sessions", "website_pageviews", "orders"])
-sessions = filter_sessions(dfs["website_sessions"], F)
-pageviews = filter_pageviews(dfs["website_pageviews"], F)
+COLUMNS = {
+    "website_sessions": ["website_session_id", "created_at", "is_repeat_session",
+                         "utm_source", "utm_campaign", "device_type", "hour", "weekday"],
+    "orders": ["order_id", "website_session_id", "created_at", "price_usd"],
+}
+dfs = filtered_tables(["website_sessions", "orders"], F, columns=COLUMNS)
+sessions = dfs["website_sessions"]
 orders = dfs["orders"]
-orders = orders[(orders["created_at"] >= F["start_ts"]) & (orders["created_at"] <= F["end_ts"])]
 
-# KPI
-bounce = compute_bounce_rate(sessions, pageviews)
-conv = compute_conversion_rate(sessions, orders)
-repeat_rate = (sessions["is_repeat_session"] == True).sum() / len(sessions) if len(sessions) > 0 else None
+# KPI (served from the daily session cube)
+kpi = cube_query(F).iloc[0]
+bounce = kpi["bounce_rate"]
+conv = kpi["conversion_rate"]
+by_repeat = cube_query(F, by=["is_repeat_session"])
+repeat_rate = by_repeat.loc[by_repeat["is_repeat_session"] == True, "sessions"].sum() / kpi["sessions"] if kpi["sessions"] > 0 else None
 
 
 k1, k2, k3, k4 = st.columns(4)
-k1.metric("👥 Sessions", format_number(len(sessions)))
+k1.metric("👥 Sessions", format_number(kpi["sessions"]))
 k2.metric("↩️ Bounce Rate", format_percent(bounce))
 k3.metric("🎯 Conversion Rate", format_percent(conv))
 k4.metric("🔁 Repeat Sessions Rate", format_percent(repeat_rate))
@@ -38,8 +43,7 @@ st.markdown("---")
 
 
 st.markdown("### Traffic Trend")
-s_roll = rollup(sessions, "created_at", F["granularity"])
-trend = s_roll.groupby("bucket").size().rename("sessions").reset_index()
+trend = cube_query(F, granularity=F["granularity"])[["bucket", "sessions"]]
 fig_trend = px.line(trend, x="bucket", y="sessions")
 fig_trend.update_layout(xaxis_title="Time", yaxis_title="Sessions")
 st.plotly_chart(fig_trend, use_container_width=True)
@@ -47,7 +51,7 @@ st.plotly_chart(fig_trend, use_container_width=True)
 st.markdown("---")  
 
 st.markdown("### Site Traffic Breakdown by Source")
-src_break = sessions.groupby("utm_source").size().rename("sessions").reset_index().sort_values("sessions", ascending=False)
+src_break = cube_query(F, by=["utm_source"])[["utm_source", "sessions"]].sort_values("sessions", ascending=False)
 src_break["label"] = src_break["sessions"].apply(format_km)
 fig_src = px.bar(src_break, x="utm_source", y="sessions", text="label")
 fig_src.update_layout(xaxis_title="UTM Source", yaxis_title="Sessions")
@@ -58,7 +62,7 @@ st.markdown("---")
 
 
 st.markdown("### Device Mix")
-dev_break = sessions.groupby("device_type").size().rename("sessions").reset_index()
+dev_break = cube_query(F, by=["device_type"])[["device_type", "sessions"]]
 legend_map = {"desktop": "Desktop", "mobile": "Mobile"}
 dev_break["Device Type"] = dev_break["device_type"].map(legend_map)
 fig_dev = px.pie(dev_break, names="Device Type", values="sessions")
@@ -68,40 +72,51 @@ st.plotly_chart(fig_dev, use_container_width=True)
 st.markdown("---")  
 
 st.markdown("### Average Session Volume")
-by_hour, by_weekday = hour_weekday_session_volume(sessions)
-by_hour["label"] = by_hour["sessions"].apply(format_km)
+by_hour, by_weekday, hour_weekday = hour_weekday_session_volume(sessions, F["start_ts"], F["end_ts"])
+by_hour["label"] = by_hour["avg_sessions"].map("{:,.1f}".format)
 fig_hr = px.bar(
     by_hour,
     x="hour",
-    y="sessions",
+    y="avg_sessions",
     title="Average Session Volume by Hour of Day",
-    text="label"
+    text="label",
+    hover_data=["sessions"]
 )
-fig_hr.update_layout(xaxis_title="Hour", yaxis_title="Sessions")
+fig_hr.update_layout(xaxis_title="Hour", yaxis_title="Sessions per Day")
 fig_hr.update_traces(textposition="outside", texttemplate="%{text}")
 st.plotly_chart(fig_hr, use_container_width=True)
 
 
-by_weekday["label"] = by_weekday["sessions"].apply(format_km)
+by_weekday["label"] = by_weekday["avg_sessions"].map("{:,.1f}".format)
 fig_wd = px.bar(
     by_weekday,
     x="weekday",
-    y="sessions",
+    y="avg_sessions",
     title="Average Session Volume by Day of Week",
-    text="label"
+    text="label",
+    hover_data=["sessions"]
 )
-fig_wd.update_layout(xaxis_title="Day of Week", yaxis_title="Sessions")
+fig_wd.update_layout(xaxis_title="Day of Week", yaxis_title="Sessions per Day")
 fig_wd.update_traces(textposition="outside", texttemplate="%{text}")
 st.plotly_chart(fig_wd, use_container_width=True)
 
+fig_hw = px.imshow(
+    hour_weekday,
+    labels=dict(x="Day of Week", y="Hour", color="Sessions per Day"),
+    title="Average Session Volume by Hour and Day of Week",
+    color_continuous_scale="Blues",
+    aspect="auto",
+    text_auto=".1f"
+)
+st.plotly_chart(fig_hw, use_container_width=True)
+
 
 st.markdown("---")  
 
 st.markdown("### Traffic Seasonality")
 
-s_roll_month = rollup(sessions, "created_at", "Monthly")
-s_roll_month["year"] = pd.to_datetime(s_roll_month["bucket"]).dt.year
-monthly_sessions = s_roll_month.groupby(["year","bucket"]).size().reset_index(name="sessions")
+monthly_sessions = cube_query(F, granularity="Monthly")[["bucket", "sessions"]]
+monthly_sessions.insert(0, "year", monthly_sessions["bucket"].dt.year)
 monthly_sessions["row_num"] = monthly_sessions.groupby("year").cumcount()
 monthly_sessions["label"] = monthly_sessions["sessions"].apply(format_km)
 monthly_sessions["label"] = monthly_sessions["label"].where(monthly_sessions["row_num"] % 3 == 0, None)
@@ -111,8 +126,7 @@ fig_monthly.update_layout(xaxis_title="Month", yaxis_title="Sessions", legend_ti
 st.plotly_chart(fig_monthly, use_container_width=True)
 
 # Yearly totals
-s_roll_year = rollup(sessions, "created_at", "Yearly")
-yearly_sessions = s_roll_year.groupby("bucket").size().reset_index(name="sessions")
+yearly_sessions = cube_query(F, granularity="Yearly")[["bucket", "sessions"]]
 yearly_sessions["year"] = pd.to_datetime(yearly_sessions["bucket"]).dt.year
 yearly_sessions["label"] = yearly_sessions["sessions"].apply(format_km)
 fig_yearly = px.bar(yearly_sessions, x="bucket", y="sessions", title="Yearly Sessions", text="label")
@@ -121,9 +135,8 @@ fig_yearly.update_traces(textposition="outside", texttemplate="%{text}")
 st.plotly_chart(fig_yearly, use_container_width=True)
 
 # Orders vs Sessions
-o_roll_month = rollup(orders, "created_at", "Monthly")
-o_roll_month["year"] = pd.to_datetime(o_roll_month["bucket"]).dt.year
-monthly_orders = o_roll_month.groupby(["year","bucket"]).size().reset_index(name="orders")
+monthly_orders = bucket_totals(orders, "created_at", "Monthly", count="orders")
+monthly_orders.insert(0, "year", monthly_orders["bucket"].dt.year)
 monthly_orders["row_num"] = monthly_orders.groupby("year").cumcount()
 monthly_orders["label"] = monthly_orders["orders"].apply(format_km)
 monthly_orders["label"] = monthly_orders["label"].where(monthly_orders["row_num"] % 3 == 0, None)
@@ -147,17 +160,10 @@ def classify_campaign(camp):
     else:
         return "Other"
 
-sessions["traffic_type"] = sessions["utm_campaign"].apply(classify_campaign)
-
-traffic_summary = sessions.groupby("traffic_type")["website_session_id"].nunique().reset_index(name="sessions")
-
-orders_type = orders.merge(sessions[["website_session_id", "traffic_type"]], on="website_session_id", how="left")
-orders_summary = orders_type.groupby("traffic_type").agg(
-    orders=("order_id", "nunique"),
-    revenue=("price_usd", "sum")
-).reset_index()
+by_campaign = cube_query(F, by=["utm_campaign"], dropna=False)
+by_campaign["traffic_type"] = by_campaign["utm_campaign"].apply(classify_campaign)
 
-traffic_summary = traffic_summary.merge(orders_summary, on="traffic_type", how="left").fillna(0)
+traffic_summary = by_campaign.groupby("traffic_type")[["sessions", "orders", "revenue"]].sum().reset_index()
 traffic_summary["conversion_rate"] = traffic_summary["orders"] / traffic_summary["sessions"]
 
 def safe_value(df, traffic_type, col, default=0.0):
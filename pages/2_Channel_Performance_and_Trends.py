@@ -2,33 +2,17 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import os
-from utils.db import load_tables
+from utils.cube import cube_query
 from utils.filters import sidebar_filters
-from utils.agg import filter_sessions, filter_orders
 from utils.formatters import format_currency, format_percent, format_km
 
 st.title("📈 Channel Performance & Trends")   
 
 F = sidebar_filters()
-dfs = load_tables(["website_sessions","orders"])
-sessions = filter_sessions(dfs["website_sessions"], F)
-orders = filter_orders(dfs["orders"], F)
 
 
-sess_summary = sessions.groupby("utm_source").agg(
-    sessions=("website_session_id","nunique"),
-    bounce_rate=("is_bounce","mean") if "is_bounce" in sessions.columns else ("website_session_id","count")
-).reset_index()
-
-ord_summary = orders.merge(sessions[["website_session_id","utm_source"]], on="website_session_id", how="left")
-ord_summary = ord_summary.groupby("utm_source").agg(
-    orders=("order_id","nunique"),
-    revenue=("price_usd","sum"),
-    avg_order_value=("price_usd","mean")
-).reset_index()
-
-portfolio = sess_summary.merge(ord_summary, on="utm_source", how="outer").fillna(0)
-portfolio["conversion_rate"] = portfolio["orders"] / portfolio["sessions"]
+# Channel totals and monthly trends come from the daily session cube
+portfolio = cube_query(F, by=["utm_source"])
 
 
 st.markdown("### Sessions Distribution by Channel")
@@ -75,8 +59,6 @@ st.plotly_chart(fig_conv, use_container_width=True)
 
 st.markdown("---")  
 
-portfolio["avg_order_value"] = portfolio["revenue"] / portfolio["orders"]
-
 st.markdown("### Average Order Value by Channel")
 fig_aov = px.bar(portfolio, x="utm_source", y="avg_order_value", text="avg_order_value")
 fig_aov.update_layout(xaxis=dict(title="UTM Source"), yaxis=dict(title="Average Order Value ($)"))
@@ -113,14 +95,10 @@ st.dataframe(comp_table.set_index("UTM Source"))
 st.markdown("---")  
 
 st.markdown("### Trends Over Time")
-sessions["month"] = pd.to_datetime(sessions["created_at"]).dt.to_period("M").dt.to_timestamp()
-orders["month"] = pd.to_datetime(orders["created_at"]).dt.to_period("M").dt.to_timestamp()
-
-sess_trend = sessions.groupby(["utm_source","month"]).size().reset_index(name="sessions")
-ord_trend = orders.merge(sessions[["website_session_id","utm_source"]], on="website_session_id", how="left")
-ord_trend = ord_trend.groupby(["utm_source","month"]).size().reset_index(name="orders")
-rev_trend = orders.merge(sessions[["website_session_id","utm_source"]], on="website_session_id", how="left")
-rev_trend = rev_trend.groupby(["utm_source","month"])["price_usd"].sum().reset_index(name="revenue")
+trends = cube_query(F, by=["utm_source"], granularity="Monthly").rename(columns={"bucket": "month"})
+sess_trend = trends[["utm_source", "month", "sessions"]]
+ord_trend = trends.loc[trends["orders"] > 0, ["utm_source", "month", "orders"]]
+rev_trend = trends.loc[trends["orders"] > 0, ["utm_source", "month", "revenue"]]
 
 st.markdown("#### Sessions Trend by Channel")
 fig_sess = px.line(sess_trend, x="month", y="sessions", color="utm_source",
@@ -2,58 +2,18 @@ import streamlit as st
 import pandas as pd
 import os
 import plotly.express as px
-from utils.db import load_tables
+from utils.cube import cube_query
 from utils.filters import sidebar_filters
-from utils.agg import filter_sessions, filter_orders
 
 st.title("🧪 Channel Quality Metrics")
 
 F = sidebar_filters()
-dfs = load_tables(["website_sessions", "orders", "website_pageviews"])
-sessions = filter_sessions(dfs["website_sessions"], F)
-orders = filter_orders(dfs["orders"], F)
-pageviews = dfs["website_pageviews"]
 
-sessions["month"] = pd.to_datetime(sessions["created_at"]).dt.to_period("M").dt.to_timestamp()
-orders["month"]   = pd.to_datetime(orders["created_at"]).dt.to_period("M").dt.to_timestamp()
-pageviews["month"] = pd.to_datetime(pageviews["created_at"]).dt.to_period("M").dt.to_timestamp()
-
-
-pv_counts = (
-    pageviews.groupby("website_session_id")
-    .size().rename("pageviews_per_session")
-    .reset_index()
-)
-pv_counts["is_bounce"] = (pv_counts["pageviews_per_session"] == 1).astype(int)
-
-sess_min = sessions[["website_session_id", "utm_source", "month"]].copy()
-sess_with_bounce = sess_min.merge(pv_counts[["website_session_id", "is_bounce"]], on="website_session_id", how="left")
-sess_with_bounce["is_bounce"] = sess_with_bounce["is_bounce"].fillna(0).astype(int)
-
-
-sess_month = sess_with_bounce.groupby(["utm_source", "month"]).agg(
-    sessions=("website_session_id", "nunique"),
-    bounces=("is_bounce", "sum")
-).reset_index()
-sess_month = sess_month[sess_month["sessions"] > 0].copy()
-sess_month["bounce_rate"] = (sess_month["bounces"] / sess_month["sessions"]).clip(0, 1)
-
-
-ord_month = orders.merge(
-    sessions[["website_session_id", "utm_source"]],
-    on="website_session_id", how="left"
-).groupby(["utm_source", "month"]).agg(
-    orders=("order_id", "nunique"),
-    revenue=("price_usd", "sum"),
-    avg_order_value=("price_usd", "mean")
-).reset_index()
-
-
-char_trends = sess_month.merge(ord_month, on=["utm_source", "month"], how="left")
-char_trends[["orders", "revenue", "avg_order_value"]] = char_trends[["orders", "revenue", "avg_order_value"]].fillna(0)
-char_trends["conversion_rate"] = (
-    (char_trends["orders"] / char_trends["sessions"]).replace([float("inf")], 0).clip(0, 1)
-)
+# Monthly channel quality straight from the daily session cube
+char_trends = cube_query(F, by=["utm_source"], granularity="Monthly").rename(columns={"bucket": "month"})
+char_trends["bounce_rate"] = char_trends["bounce_rate"].clip(0, 1)
+char_trends["conversion_rate"] = char_trends["conversion_rate"].clip(0, 1)
+char_trends["avg_order_value"] = char_trends["avg_order_value"].fillna(0)
 
 
 st.markdown("### Bounce Rate Trend by Channel")
@@ -2,65 +2,61 @@ import streamlit as st
 import pandas as pd
 import os
 import plotly.express as px
-from utils.db import load_tables
+from utils.memo import filtered_tables, memoized
 from utils.filters import sidebar_filters
-from utils.agg import filter_sessions, filter_orders
-from utils.formatters import format_currency, format_km
+from utils.attribution import MODELS, attribute_revenue, markov_attribution
+from utils.config import ATTRIBUTION_HALF_LIFE_DAYS, ATTRIBUTION_LOOKBACK_DAYS, MARKOV_CHANNEL
+from utils.formatters import format_currency, format_km, format_percent
 
 st.title("🧭 Attribution Analysis")  
 
 
 
 F = sidebar_filters()
-dfs = load_tables(["website_sessions","orders"])
-sessions = filter_sessions(dfs["website_sessions"], F)
-orders = filter_orders(dfs["orders"], F)
-
+COLUMNS = {
+    "website_sessions": ["website_session_id", "created_at", "user_id",
+                         "utm_source", "utm_campaign", "device_type"],
+    "orders": ["order_id", "website_session_id", "user_id", "created_at", "price_usd"],
+}
+dfs = filtered_tables(["website_sessions","orders"], F, columns=COLUMNS)
+sessions = dfs["website_sessions"]
+orders = dfs["orders"]
 
-sess_orders = sessions.merge(
-    orders[["order_id","created_at","price_usd","website_session_id","user_id"]],
-    on="website_session_id", how="right"
-)
 
-# First-touch attribution
-first_touch = sessions.sort_values("created_at").groupby("user_id").first().reset_index()
-orders_first = orders.merge(first_touch[["user_id","utm_source","utm_campaign"]], on="user_id", how="left")
-ft_rev = orders_first.groupby("utm_source")["price_usd"].sum().reset_index(name="first_touch_revenue")
+c1, c2 = st.columns(2)
+lookback = c1.slider("Lookback window (days before the order)", 1, 365, ATTRIBUTION_LOOKBACK_DAYS, key="attribution_lookback")
+half_life = c2.slider("Time-decay half-life (days)", 1, 60, ATTRIBUTION_HALF_LIFE_DAYS, key="attribution_half_life")
 
-# Last-touch attribution
-last_touch = sessions.sort_values("created_at").groupby("user_id").last().reset_index()
-orders_last = orders.merge(last_touch[["user_id","utm_source","utm_campaign"]], on="user_id", how="left")
-lt_rev = orders_last.groupby("utm_source")["price_usd"].sum().reset_index(name="last_touch_revenue")
+# Revenue per source under each model, from the buyer's sessions in the lookback window
+attrib = attribute_revenue(sessions, orders, by="utm_source", lookback_days=lookback, half_life_days=half_life)
 
-# Linear attribution
-linear_pairs = sessions.merge(orders[["order_id","user_id","price_usd"]], on="user_id", how="inner")
-linear_pairs["share"] = linear_pairs.groupby("order_id")["user_id"].transform("count")
-linear_pairs["rev_share"] = linear_pairs["price_usd"] / linear_pairs["share"]
-lin_rev = linear_pairs.groupby("utm_source")["rev_share"].sum().reset_index(name="linear_revenue")
+# Removal-effect attribution over source / campaign paths, kept per filters and data version
+markov = memoized(("markov", tuple(MARKOV_CHANNEL)), F, ["website_sessions", "orders"],
+                  lambda: markov_attribution(sessions, orders))
+markov_by_source = markov.groupby("utm_source", observed=True)["markov_revenue"].sum()
+attrib["markov_revenue"] = attrib["utm_source"].astype(str).map(
+    markov_by_source.set_axis(markov_by_source.index.astype(str))).fillna(0)
 
-attrib = ft_rev.merge(lt_rev, on="utm_source", how="outer").merge(lin_rev, on="utm_source", how="outer").fillna(0)
+legend_map = {f"{m}_revenue": f"{label} Revenue" for m, label in MODELS.items()}
+legend_map["markov_revenue"] = "Markov Revenue"
 
 st.markdown("### Top Sources by Attribution Model")
-col1, col2, col3 = st.columns(3)
+cols = st.columns(len(MODELS))
 if not attrib.empty:
-    top_ft = attrib.sort_values("first_touch_revenue", ascending=False).iloc[0]
-    top_lt = attrib.sort_values("last_touch_revenue", ascending=False).iloc[0]
-    top_lin = attrib.sort_values("linear_revenue", ascending=False).iloc[0]
-    col1.metric("👆 Top First-Touch Source", top_ft["utm_source"], format_currency(top_ft["first_touch_revenue"]))
-    col2.metric("👇 Top Last-Touch Source", top_lt["utm_source"], format_currency(top_lt["last_touch_revenue"]))
-    col3.metric("➗ Top Linear Source", top_lin["utm_source"], format_currency(top_lin["linear_revenue"]))
+    for col, (m, label) in zip(cols, MODELS.items()):
+        top = attrib.sort_values(f"{m}_revenue", ascending=False).iloc[0]
+        col.metric(f"🏅 Top {label} Source", top["utm_source"], format_currency(top[f"{m}_revenue"]))
+
+unattributed = float(orders["price_usd"].sum()) - float(attrib["linear_revenue"].sum())
+st.caption(f"Revenue of orders with no session in their {lookback}-day lookback window: {format_currency(unattributed)}. "
+           f"Not credited by the Markov model (buyer has no filtered session up to their first order): "
+           f"{format_currency(markov.attrs['unattributed_revenue'])}")
 
 st.markdown("---")  
 
 
 st.markdown("### Revenue Attribution Comparison")
 attrib_melt = attrib.melt(id_vars="utm_source", var_name="model", value_name="revenue")
-
-legend_map = {
-    "first_touch_revenue": "First Touch Revenue",
-    "last_touch_revenue": "Last Touch Revenue",
-    "linear_revenue": "Linear Revenue"
-}
 attrib_melt["model"] = attrib_melt["model"].map(legend_map)
 attrib_melt["label"] = attrib_melt["revenue"].apply(format_km)
 
@@ -75,22 +71,33 @@ st.plotly_chart(fig_attrib, use_container_width=True)
 st.markdown("---")  
 
 
-st.markdown("### Attribution Comparison Table")
-attrib_friendly = attrib.rename(columns={
-    "utm_source": "UTM Source",
-    "first_touch_revenue": "First Touch Revenue",
-    "last_touch_revenue": "Last Touch Revenue",
-    "linear_revenue": "Linear Revenue"
-})
-
-attrib_friendly["Total Revenue"] = (
-    attrib_friendly["First Touch Revenue"]
-    + attrib_friendly["Last Touch Revenue"]
-    + attrib_friendly["Linear Revenue"]
+st.markdown("### Data-Driven Attribution (Markov Removal Effect)")
+st.metric("🔗 Path Conversion Probability", format_percent(markov.attrs["conversion_probability"]))
+markov_view = markov.sort_values("removal_effect", ascending=False)
+fig_markov = px.bar(
+    markov_view, x="removal_effect", y="channel", orientation="h",
+    text=markov_view["removal_effect"].apply(lambda x: f"{x:.1%}"),
+    title="Share of Conversions Lost Without Each Channel"
 )
+fig_markov.update_xaxes(tickformat=".0%")
+fig_markov.update_layout(xaxis_title="Removal Effect", yaxis_title="Source / Campaign")
+st.plotly_chart(fig_markov, use_container_width=True)
+
+markov_table = pd.DataFrame({
+    "Source / Campaign": markov_view["channel"],
+    "Removal Effect": markov_view["removal_effect"].apply(format_percent),
+    "Markov Revenue": markov_view["markov_revenue"].apply(format_currency),
+}).set_index("Source / Campaign")
+st.dataframe(markov_table)
+
+st.markdown("---")
+
+
+st.markdown("### Attribution Comparison Table")
+attrib_friendly = attrib.rename(columns={"utm_source": "UTM Source", **legend_map})
 
-revenue_cols = ["First Touch Revenue","Last Touch Revenue","Linear Revenue","Total Revenue"]
+revenue_cols = list(legend_map.values())
 attrib_friendly[revenue_cols] = attrib_friendly[revenue_cols].applymap(format_currency)
 
 attrib_friendly = attrib_friendly.set_index("UTM Source")
-st.dataframe(attrib_friendly)
\ No newline at end of file
+st.dataframe(attrib_friendly)
@@ -3,28 +3,42 @@ import plotly.express as px
 import pandas as pd
 import numpy as np
 import os
-from utils.db import load_tables
+from utils.memo import filtered_tables
+from utils.mart import session_facts
+from utils.config import EXPERIMENT_CONFIDENCE, FUNNEL_GROUPS
+from utils.cube import cube_query
+from utils.funnel import session_steps
+from utils.experiments import assign_variants, summarize_experiment
 from utils.filters import sidebar_filters
-from utils.agg import (
-    filter_sessions, filter_pageviews, filter_orders,
-    revenue_metrics, gsearch_metrics, rollup
-)
+from utils.agg import revenue_metrics, gsearch_metrics
 from utils.formatters import format_currency, format_currency_precise, format_percent, format_number, format_km
 
 st.title("🛤️ Conversion Journey")   
 
 
 F = sidebar_filters()
-dfs = load_tables(["website_sessions", "website_pageviews", "orders", "order_item_refunds"])
-sessions = filter_sessions(dfs["website_sessions"], F)
-pageviews = filter_pageviews(dfs["website_pageviews"], F)
-orders = filter_orders(dfs["orders"], F)
-refunds = dfs["order_item_refunds"]
-refunds = refunds[(refunds["created_at"] >= F["start_ts"]) & (refunds["created_at"] <= F["end_ts"])]
+COLUMNS = {
+    "website_sessions": ["website_session_id", "created_at", "is_repeat_session",
+                         "utm_source", "utm_campaign", "device_type"],
+    "website_pageviews": ["website_session_id", "created_at", "pageview_url"],
+}
+dfs = filtered_tables(["website_sessions", "website_pageviews"], F, columns=COLUMNS)
+sessions = dfs["website_sessions"]
+pageviews = dfs["website_pageviews"]
+facts = session_facts(sessions, ["converted", "revenue", "refunds"])
+
+# Visited steps of every filtered session, for all funnels on this page
+product_urls = [u for u in pageviews["pageview_url"].dropna().unique() if str(u).startswith("/the-")]
+JOURNEY_STEPS = {
+    **FUNNEL_GROUPS,
+    "Lander-1": ["/lander-1"],
+    "Product": product_urls,
+}
+steps = session_steps(pageviews, JOURNEY_STEPS).within(sessions)
 
 
-rev = revenue_metrics(orders, refunds, sessions)
-gsearch = gsearch_metrics(sessions, orders)
+rev = revenue_metrics(facts)
+gsearch = gsearch_metrics(facts)
 
 k1, k2, k3, k4 = st.columns(4)
 k1.metric("💵 Gross Revenue", format_currency(rev['gross_revenue']))
@@ -45,9 +59,7 @@ st.markdown("---")
 
 # Gsearch volume trend
 st.markdown("### Gsearch Volume Trend")
-g_sess = sessions[sessions["utm_source"] == "gsearch"]
-g_roll = rollup(g_sess, "created_at", F["granularity"])
-g_trend = g_roll.groupby("bucket").size().rename("sessions").reset_index()
+g_trend = cube_query(F, granularity=F["granularity"], where={"utm_source": ["gsearch"]})[["bucket", "sessions"]]
 fig_g = px.line(g_trend, x="bucket", y="sessions")
 fig_g.update_layout(xaxis_title="Date", yaxis_title="Number of Sessions", showlegend=False)
 
@@ -57,25 +69,10 @@ st.markdown("---")
 
 # Funnel Analysis
 st.subheader("G-Search Non-brand Funnel: /lander-1 → /thank-you-for-your-order")
-f_sess = g_sess[g_sess["utm_campaign"] == "nonbrand"]
-f_pv = pageviews[pageviews["website_session_id"].isin(f_sess["website_session_id"])]
-
-lander_sessions = set(f_pv[f_pv["pageview_url"] == "/lander-1"]["website_session_id"])
-product_sessions = set(f_pv[f_pv["pageview_url"].str.startswith("/the-")]["website_session_id"])
-cart_sessions = set(f_pv[f_pv["pageview_url"] == "/cart"]["website_session_id"])
-billing_sessions = set(f_pv[f_pv["pageview_url"].isin(["/billing","/billing-2"])]["website_session_id"])
-thankyou_sessions = set(f_pv[f_pv["pageview_url"] == "/thank-you-for-your-order"]["website_session_id"])
-
-funnel_counts = pd.DataFrame({
-    "step": ["Lander-1","Product","Cart","Billing","Thank You"],
-    "sessions": [
-        len(lander_sessions),
-        len(lander_sessions & product_sessions),
-        len(lander_sessions & product_sessions & cart_sessions),
-        len(lander_sessions & product_sessions & cart_sessions & billing_sessions),
-        len(lander_sessions & product_sessions & cart_sessions & billing_sessions & thankyou_sessions),
-    ]
-})
+f_sess = sessions[(sessions["utm_source"] == "gsearch") & (sessions["utm_campaign"] == "nonbrand")]
+f_steps = steps.within(f_sess)
+
+funnel_counts = f_steps.funnel(["Lander-1", "Product", "Cart", "Billing", "Thank You"])
 funnel_counts["label"] = funnel_counts["sessions"].apply(format_km)
 
 fig_fun = px.funnel(funnel_counts, x="sessions", y="step", title="Conversion Funnel", text="label")
@@ -86,48 +83,67 @@ st.plotly_chart(fig_fun, use_container_width=True)
 st.markdown("---") 
 
 
-st.markdown("### Billing Test: /billing vs /billing-2")
-bill_df = f_pv[f_pv["pageview_url"].isin(["/billing","/billing-2"])]
-bill_df = bill_df.rename(columns={"pageview_url":"variant"})
+def show_experiment(assigned: pd.DataFrame, name: str, axis_title: str):
+    """Conversion per variant with intervals, daily and per-channel rates, and a results table."""
+    if assigned.empty:
+        st.info(f"No sessions saw a {name} variant in the current filter window.")
+        return
+    summary = summarize_experiment(assigned)
+    summary["label"] = summary["conversion_rate"].apply(lambda x: f"{x:.1%}")
+    fig = px.bar(summary, x="variant", y="conversion_rate", text="label",
+                 error_y=summary["ci_high"] - summary["conversion_rate"],
+                 error_y_minus=summary["conversion_rate"] - summary["ci_low"],
+                 title=f"Conversion Rate by {name.title()} Variant ({EXPERIMENT_CONFIDENCE:.0%} Wilson interval)")
+    fig.update_yaxes(tickformat=".0%")
+    fig.update_traces(textfont=dict(color="black", size=14))
+    fig.update_layout(xaxis_title=axis_title, yaxis_title="Conversion Rate")
+    st.plotly_chart(fig, use_container_width=True)
+
+    table = pd.DataFrame({
+        "Variant": summary["variant"].astype(str),
+        "Sessions": summary["sessions"].apply(format_number),
+        "Conversions": summary["conversions"].apply(format_number),
+        "Conversion Rate": summary["conversion_rate"].apply(format_percent),
+        "Wilson Interval": [f"{lo:.1%} – {hi:.1%}" for lo, hi in zip(summary["ci_low"], summary["ci_high"])],
+        "Bootstrap Interval": [f"{lo:.1%} – {hi:.1%}" for lo, hi in zip(summary["boot_low"], summary["boot_high"])],
+        "Lift vs Control": summary["lift"].apply(lambda x: f"{x:+.1%}" if pd.notna(x) else "–"),
+        "P(Beats Control)": summary["p_beats_control"].apply(lambda x: f"{x:.1%}" if pd.notna(x) else "–"),
+    })
+    st.dataframe(table.set_index("Variant"))
+
+    daily = summarize_experiment(assigned.assign(day=assigned["created_at"].dt.normalize()), by="day", resamples=0)
+    fig_day = px.line(daily, x="day", y="conversion_rate", color="variant", title="Daily Conversion Rate by Variant")
+    fig_day.update_yaxes(tickformat=".0%")
+    fig_day.update_layout(xaxis_title="Date", yaxis_title="Conversion Rate")
+    st.plotly_chart(fig_day, use_container_width=True)
+
+    channel = summarize_experiment(assigned, by="utm_source", resamples=0)
+    fig_ch = px.bar(channel, x="utm_source", y="conversion_rate", color="variant", barmode="group",
+                    error_y=channel["ci_high"] - channel["conversion_rate"],
+                    error_y_minus=channel["conversion_rate"] - channel["ci_low"],
+                    title="Conversion Rate by Channel and Variant")
+    fig_ch.update_yaxes(tickformat=".0%")
+    fig_ch.update_layout(xaxis_title="UTM Source", yaxis_title="Conversion Rate")
+    st.plotly_chart(fig_ch, use_container_width=True)
 
-by_variant = bill_df.groupby("variant")["website_session_id"].nunique().rename("billing_sessions").reset_index()
-ty_after_billing = f_pv[f_pv["website_session_id"].isin(bill_df["website_session_id"]) & (f_pv["pageview_url"] == "/thank-you-for-your-order")]
 
-conv_by_variant = ty_after_billing.merge(bill_df[["website_session_id","variant"]].drop_duplicates(), on="website_session_id", how="left")
-conv_rate = conv_by_variant.groupby("variant")["website_session_id"].nunique() / by_variant.set_index("variant")["billing_sessions"]
+st.markdown("### Billing Test: /billing vs /billing-2")
+show_experiment(assign_variants(pageviews, f_sess, ["/billing", "/billing-2"], "/thank-you-for-your-order"),
+                "billing", "Billing Page Variant")
 
-rate_df = conv_rate.reset_index().rename(columns={0:"conversion_rate"})
-rate_df["label"] = rate_df["conversion_rate"].apply(lambda x: f"{x:.1%}")
+st.markdown("---")
 
-fig_bill = px.bar(rate_df, x="variant", y="conversion_rate", title="Conversion Rate by Billing Variant", text="label")
-fig_bill.update_yaxes(tickformat=".0%")
-fig_bill.update_traces(textfont=dict(color="black", size=14))
-fig_bill.update_layout(xaxis_title="Billing Page Variant", yaxis_title="Conversion Rate")
-st.plotly_chart(fig_bill, use_container_width=True)
+st.markdown("### Lander Test")
+show_experiment(assign_variants(pageviews, sessions, FUNNEL_GROUPS["Landers"], "/thank-you-for-your-order"),
+                "lander", "Landing Page Variant")
 
-st.markdown("---")  
+st.markdown("---")
 
 
 st.markdown("### Advanced Funnel Drop-off Analysis")
-funnel_groups = {
-    "Landers": ["/lander-1","/lander-2","/lander-3","/lander-4","/lander-5","/home"],
-    "Products": ["/products",
-                 "/the-birthday-sugar-panda",
-                 "/the-forever-love-bear",
-                 "/the-hudson-river-mini-bear",
-                 "/the-original-mr-fuzzy"],
-    "Cart": ["/cart"],
-    "Shipping": ["/shipping"],
-    "Billing": ["/billing","/billing-2"],
-    "Thank You": ["/thank-you-for-your-order"]
-}
 
-funnel_counts = []
-for step_name, urls in funnel_groups.items():
-    reached = pageviews[pageviews["pageview_url"].isin(urls)]["website_session_id"].nunique()
-    funnel_counts.append({"step": step_name, "sessions": reached})
-
-funnel_df = pd.DataFrame(funnel_counts)
+strict = st.toggle("Count a step only when every earlier step was visited before it", key="strict_funnel")
+funnel_df = steps.funnel(list(FUNNEL_GROUPS), cumulative=strict, strict=strict)
 funnel_df["conversion_rate"] = funnel_df["sessions"] / funnel_df["sessions"].iloc[0]
 funnel_df["label"] = funnel_df["sessions"].apply(format_km)
 
@@ -136,6 +152,11 @@ fig_funnel.update_traces(texttemplate="%{text}", textposition="inside", textfont
 fig_funnel.update_layout(xaxis_title="Sessions", yaxis_title="Funnel Step")
 st.plotly_chart(fig_funnel, use_container_width=True)
 
+device_df = steps.funnel(list(FUNNEL_GROUPS), cumulative=strict, strict=strict, by="device_type")
+fig_device = px.funnel(device_df, x="sessions", y="step", color="device_type", title="Sessions Funnel by Device")
+fig_device.update_layout(xaxis_title="Sessions", yaxis_title="Funnel Step")
+st.plotly_chart(fig_device, use_container_width=True)
+
 
 funnel_df["drop_off"] = funnel_df["sessions"].shift(1) - funnel_df["sessions"]
 funnel_df.loc[0,"drop_off"] = 0
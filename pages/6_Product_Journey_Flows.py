@@ -2,63 +2,43 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from utils.db import load_tables
+from utils.memo import filtered_tables
 from utils.filters import sidebar_filters
-from utils.agg import filter_sessions, filter_orders
+from utils.config import FUNNEL_GROUPS
+from utils.funnel import session_steps
+from utils.ids import id_flags
+from utils.paths import clickstream
 from utils.formatters import format_percent
 
 
 st.title("📦 Product Journey Flows")
 
 
-dfs = load_tables(["website_pageviews", "orders"])
+F = sidebar_filters()
+COLUMNS = {
+    "website_sessions": ["website_session_id", "created_at", "device_type"],
+    "website_pageviews": ["website_pageview_id", "website_session_id", "created_at", "pageview_url"],
+}
+dfs = filtered_tables(["website_sessions", "website_pageviews"], F, columns=COLUMNS)
+sessions = dfs["website_sessions"]
 pageviews = dfs["website_pageviews"]
-orders = dfs["orders"]
 st.markdown("---")
 
-product_pages = pageviews[pageviews["pageview_url"].str.contains("/products")]
-paths = product_pages.groupby("website_session_id")["pageview_url"].apply(list).reset_index(name="product_path")
-paths_orders = paths.merge(orders[["order_id", "website_session_id", "price_usd"]], on="website_session_id", how="left")
-
-
-# Funnel groups definition
-funnel_groups = {
-    "Landers": ["/lander-1", "/lander-2", "/lander-3", "/lander-4", "/lander-5", "/home"],
-    "Products": [
-        "/products",
-        "/the-birthday-sugar-panda",
-        "/the-forever-love-bear",
-        "/the-hudson-river-mini-bear",
-        "/the-original-mr-fuzzy",
-    ],
-    "Cart": ["/cart"],
-    "Shipping": ["/shipping"],
-    "Billing": ["/billing", "/billing-2"],
-    "Thank You": ["/thank-you-for-your-order"],
-}
+# Funnel groups plus one step per product page, for the filtered sessions
+steps = session_steps(pageviews, {**FUNNEL_GROUPS, **{p: [p] for p in FUNNEL_GROUPS["Products"]}}).within(sessions)
+products = [p for p in FUNNEL_GROUPS["Products"] if p != "/products"]
 
 # --- Product-level funnels ---
 st.header("Product Conversion Funnels")
-funnels = []
-for prod in funnel_groups["Products"]:
-    if prod == "/products":
-        continue
+strict = st.toggle("Count a step only when every earlier step was visited before it", key="strict_product_funnel")
+STAGES = ["Cart", "Shipping", "Billing", "Thank You"]
 
-    sess_prod = pageviews[pageviews["pageview_url"] == prod]["website_session_id"].unique()
-    step_cart = pageviews[(pageviews["website_session_id"].isin(sess_prod)) & (pageviews["pageview_url"].isin(funnel_groups["Cart"]))]["website_session_id"].nunique()
-    step_ship = pageviews[(pageviews["website_session_id"].isin(sess_prod)) & (pageviews["pageview_url"].isin(funnel_groups["Shipping"]))]["website_session_id"].nunique()
-    step_bill = pageviews[(pageviews["website_session_id"].isin(sess_prod)) & (pageviews["pageview_url"].isin(funnel_groups["Billing"]))]["website_session_id"].nunique()
-    step_thank = pageviews[(pageviews["website_session_id"].isin(sess_prod)) & (pageviews["pageview_url"].isin(funnel_groups["Thank You"]))]["website_session_id"].nunique()
-
-    funnels.append({
-        "Product": prod,
-        "Cart": step_cart,
-        "Shipping": step_ship,
-        "Billing": step_bill,
-        "Thank You": step_thank,
-    })
+funnels = []
+for prod in products:
+    counts = steps.funnel([prod] + STAGES, strict=strict).set_index("step")["sessions"]
+    funnels.append({"Product": prod, **{s: int(counts[s]) for s in STAGES}})
 
-funnels_df = pd.DataFrame(funnels)
+funnels_df = pd.DataFrame(funnels, columns=["Product"] + STAGES)
 
 # Render funnels
 for _, row in funnels_df.iterrows():
@@ -105,25 +85,17 @@ st.markdown("---")
 
 st.header("Product wise Pathing Sankeys")
 
-url_to_group = {url: group for group, urls in funnel_groups.items() for url in urls}
-pageviews = pageviews.copy()
-pageviews["next_page"] = pageviews.groupby("website_session_id")["pageview_url"].shift(-1)
-pageviews["page_group"] = pageviews["pageview_url"].map(url_to_group)
-pageviews["next_group"] = pageviews["next_page"].map(url_to_group)
+# Transitions between page groups, for the sessions of every product page, in one pass
+url_to_group = {url: group for group, urls in FUNNEL_GROUPS.items() for url in urls}
+cs = clickstream(pageviews)
+viewers = {prod: id_flags(steps.codes[steps.has(prod)], "website_session_id")[cs.sessions]
+           for prod in FUNNEL_GROUPS["Products"]}
+all_flows = cs.transitions(nodes=url_to_group, slices=viewers).rename(
+    columns={"source": "page_group", "target": "next_group"})
 
 # --- Sankey per product (only product detail pages, including /products listing if present) ---
-product_pages_list = funnel_groups["Products"]
-
-for prod in product_pages_list:
-    prod_sessions = pageviews[pageviews["pageview_url"] == prod]["website_session_id"].unique()
-    prod_views = pageviews[pageviews["website_session_id"].isin(prod_sessions)]
-
-    flows = (
-        prod_views.dropna(subset=["page_group", "next_group"])
-        .groupby(["page_group", "next_group"])
-        .size()
-        .reset_index(name="count")
-    )
+for prod in FUNNEL_GROUPS["Products"]:
+    flows = all_flows[all_flows["slice"] == prod]
 
     if flows.empty:
         st.info(f"No navigation flows captured for {prod}")
@@ -1,11 +1,15 @@
 import streamlit as st
 import plotly.express as px
 import pandas as pd
+import numpy as np
 import os
-from utils.db import load_tables
+from utils.memo import filtered_tables
 from utils.filters import sidebar_filters
-from utils.agg import filter_order_items, filter_orders, rollup
-from utils.formatters import format_currency, format_number, format_km
+from utils.timeseries import bucket_totals
+from utils.ids import id_codes, id_space
+from utils.basket import Baskets
+from utils.config import CROSS_SELL_TOP_K
+from utils.formatters import format_currency, format_number, format_km, format_percent
 
 st.title("💰 Product Performance")
 
@@ -13,11 +17,15 @@ st.title("💰 Product Performance")
 F = sidebar_filters()
 
 
-dfs = load_tables(["order_items", "products", "orders", "order_item_refunds"])
-items = filter_order_items(dfs["order_items"], dfs["products"], F)
-orders = filter_orders(dfs["orders"], F)
+COLUMNS = {
+    "order_items": ["order_item_id", "order_id", "product_id", "created_at", "price_usd"],
+    "orders": ["order_id", "created_at", "price_usd"],
+    "order_item_refunds": ["order_id", "created_at", "refund_amount_usd"],
+}
+dfs = filtered_tables(["order_items", "orders", "order_item_refunds"], F, columns=COLUMNS)
+items = dfs["order_items"]
+orders = dfs["orders"]
 refunds = dfs["order_item_refunds"]
-refunds = refunds[(refunds["created_at"] >= F["start_ts"]) & (refunds["created_at"] <= F["end_ts"])]
 
 
 if "created_at" in orders.columns:
@@ -26,6 +34,11 @@ if "created_at" in items.columns:
     items["created_at"] = pd.to_datetime(items["created_at"], errors="coerce")
 refunds["created_at"] = pd.to_datetime(refunds["created_at"], errors="coerce")
 
+# Money is stored as float32 (compact schema); sum it as float64 cents so totals stay exact to the cent
+orders["price_usd"] = orders["price_usd"].astype("float64").round(2)
+items["price_usd"] = items["price_usd"].astype("float64").round(2)
+refunds["refund_amount_usd"] = refunds["refund_amount_usd"].astype("float64").round(2)
+
 
 orders["order_date"] = orders["created_at"].dt.normalize()
 items["item_date"] = items["created_at"].dt.normalize()
@@ -33,12 +46,12 @@ refunds["refund_date"] = refunds["created_at"].dt.normalize()
 
 
 gross_rev_total = float(orders["price_usd"].sum()) if "price_usd" in orders.columns else 0.0
-gross_by_date = orders.groupby("order_date")["price_usd"].sum(min_count=1).reset_index(name="revenue_usd").sort_values("order_date")
-refunds_by_date = refunds.groupby("refund_date")["refund_amount_usd"].sum(min_count=1).reset_index(name="refunds_usd").sort_values("refund_date")
+gross_by_date = orders.groupby("order_date")["price_usd"].sum(min_count=1).round(2).reset_index(name="revenue_usd").sort_values("order_date")
+refunds_by_date = refunds.groupby("refund_date")["refund_amount_usd"].sum(min_count=1).round(2).reset_index(name="refunds_usd").sort_values("refund_date")
 
 rev_merged = gross_by_date.merge(refunds_by_date, left_on="order_date", right_on="refund_date", how="left")
 rev_merged["refunds_usd"] = rev_merged["refunds_usd"].fillna(0.0)
-rev_merged["net_revenue"] = rev_merged["revenue_usd"] - rev_merged["refunds_usd"]
+rev_merged["net_revenue"] = (rev_merged["revenue_usd"] - rev_merged["refunds_usd"]).round(2)
 
 refunds_total = float(refunds["refund_amount_usd"].sum()) if "refund_amount_usd" in refunds.columns else 0.0
 net_rev_total = gross_rev_total - refunds_total
@@ -73,7 +86,7 @@ st.markdown("---")
 # --- Product revenue bar ---
 st.subheader("Product Revenue Distribution")
 if "product_name" in items.columns and "price_usd" in items.columns:
-    prod_rev = items.groupby("product_name")["price_usd"].sum(min_count=1).reset_index(name="revenue_usd").sort_values("revenue_usd", ascending=False)
+    prod_rev = items.groupby("product_name", observed=True)["price_usd"].sum(min_count=1).round(2).reset_index(name="revenue_usd").sort_values("revenue_usd", ascending=False)
     if not prod_rev.empty:
         prod_rev["label"] = prod_rev["revenue_usd"].apply(format_km)
         fig_prod = px.bar(
@@ -95,10 +108,14 @@ st.markdown("---")
 
 st.subheader("Refund Rate by Product")
 if "order_id" in refunds.columns and "order_id" in items.columns:
-    ref_by_order = refunds[["order_id", "refund_amount_usd"]].groupby("order_id").sum().reset_index()
-    items_with_ref = items.merge(ref_by_order, on="order_id", how="left").fillna({"refund_amount_usd": 0.0})
+    refund_orders = id_codes(refunds["order_id"])
+    refunded = refund_orders >= 0
+    ref_by_order = np.bincount(refund_orders[refunded], minlength=len(id_space("order_id")),
+                               weights=refunds["refund_amount_usd"].fillna(0).to_numpy(dtype="float64")[refunded])
+    item_orders = id_codes(items["order_id"])
+    items_with_ref = items.assign(refund_amount_usd=np.where(item_orders >= 0, ref_by_order[item_orders], 0.0))
     if not items_with_ref.empty:
-        ref_rate = items_with_ref.groupby("product_name").agg(
+        ref_rate = items_with_ref.groupby("product_name", observed=True).agg(
             revenue_usd=("price_usd", "sum"),
             refunds_usd=("refund_amount_usd", "sum"),
         ).reset_index()
@@ -125,14 +142,8 @@ st.markdown("---")
 
 st.subheader("Product Seasonality")
 if not items.empty:
-    items_roll = rollup(items, "created_at", "Monthly")
-    items_roll["year"] = pd.to_datetime(items_roll["bucket"], errors="coerce").dt.year
-
-    monthly_prod_rev = (
-        items_roll.groupby(["year", "bucket", "product_name"])["price_usd"]
-        .sum(min_count=1)
-        .reset_index()
-    )
+    monthly_prod_rev = bucket_totals(items, "created_at", "Monthly", values=["price_usd"], by=["product_name"]).drop(columns="count").round({"price_usd": 2})
+    monthly_prod_rev.insert(0, "year", monthly_prod_rev["bucket"].dt.year)
 
     if not monthly_prod_rev.empty:
         fig_monthly_prod = px.line(
@@ -162,8 +173,7 @@ if not items.empty:
         st.info("No monthly product revenue available for the selected filters.")
 
     # Yearly totals
-    items_roll_year = rollup(items, "created_at", "Yearly")
-    yearly_prod_rev = items_roll_year.groupby(["bucket", "product_name"])["price_usd"].sum(min_count=1).reset_index().rename(columns={"bucket": "year"})
+    yearly_prod_rev = bucket_totals(items, "created_at", "Yearly", values=["price_usd"], by=["product_name"]).drop(columns="count").round({"price_usd": 2}).rename(columns={"bucket": "year"})
     if not yearly_prod_rev.empty:
         yearly_prod_rev["label"] = yearly_prod_rev["price_usd"].apply(format_km)
         fig_yearly_prod = px.bar(
@@ -187,37 +197,13 @@ else:
 st.subheader("Cross-Sell Analysis")
 
 if "order_id" in items.columns and "product_name" in items.columns:
-    pairs = (
-        items.groupby("order_id")["product_name"]
-        .apply(lambda x: sorted(set(x)))
-        .reset_index()
-    )
-
-
-    pair_list = []
-    for _, row in pairs.iterrows():
-        prods = row["product_name"]
-        if isinstance(prods, list) and len(prods) > 1:
-            for i in range(len(prods)):
-                for j in range(i + 1, len(prods)):
-                    pair_list.append((prods[i], prods[j]))
-
-    pair_df = pd.DataFrame(pair_list, columns=["product_a", "product_b"])
+    baskets = Baskets(items)
+    pair_counts = baskets.pairs()
 
-    if not pair_df.empty:
-        pair_counts = (
-            pair_df.value_counts()
-            .reset_index(name="count")
-            .sort_values("count", ascending=False)
-        )
-
-
-        top_pair_str = "—"
-        top_pair_count = 0
-        if not pair_counts.empty:
-            top_pair = pair_counts.iloc[0]
-            top_pair_str = f"{top_pair['product_a']} + {top_pair['product_b']}"
-            top_pair_count = int(top_pair["count"])
+    if not pair_counts.empty:
+        top_pair = pair_counts.iloc[0]
+        top_pair_str = f"{top_pair['product_a']} + {top_pair['product_b']}"
+        top_pair_count = int(top_pair["orders"])
         st.metric("🤝 Top Cross-Sell Pair", top_pair_str, f"{format_number(top_pair_count)} orders")
 
         st.markdown("---")
@@ -225,14 +211,14 @@ if "order_id" in items.columns and "product_name" in items.columns:
         # Bar chart of top pairs
         st.subheader("Top 10 Cross-Sell Product Pairs")
         top10 = pair_counts.head(10).copy()
-        top10["pair_label"] = top10.apply(lambda r: f"{r['product_a']} + {r['product_b']}", axis=1)
+        top10["pair_label"] = top10["product_a"].astype(str) + " + " + top10["product_b"].astype(str)
 
         fig_pairs = px.bar(
             top10,
-            x="count",
+            x="orders",
             y="pair_label",
             orientation="h",
-            text="count"
+            text="orders"
         )
         fig_pairs.update_traces(texttemplate="%{text}", textposition="outside")
         fig_pairs.update_layout(xaxis_title="Orders", yaxis_title="Product Pair")
@@ -242,11 +228,8 @@ if "order_id" in items.columns and "product_name" in items.columns:
 
         # Heatmap of product co-purchases
         st.subheader("Cross-Sell Heatmap")
-        heatmap_data = pair_df.groupby(["product_a", "product_b"]).size().reset_index(name="count")
-        heatmap_pivot = heatmap_data.pivot(index="product_a", columns="product_b", values="count").fillna(0)
-
         fig_heat = px.imshow(
-            heatmap_pivot,
+            baskets.heatmap(),
             text_auto=True,
             aspect="auto",
             color_continuous_scale="Blues",
@@ -254,7 +237,26 @@ if "order_id" in items.columns and "product_name" in items.columns:
         fig_heat.update_layout(xaxis_title="Product A", yaxis_title="Product B")
         st.plotly_chart(fig_heat, use_container_width=True)
 
+        st.markdown("---")
+
+        # Association metrics per product
+        st.subheader(f"Top {CROSS_SELL_TOP_K} Complements per Product")
+        comp = baskets.complements()
+        comp_display = comp.drop(columns="rank").rename(columns={
+            "product": "Product",
+            "complement": "Complement",
+            "orders": "Orders Together",
+            "support": "Support",
+            "confidence": "Confidence",
+            "lift": "Lift",
+        })
+        comp_display["Orders Together"] = comp_display["Orders Together"].apply(format_number)
+        comp_display["Support"] = comp_display["Support"].apply(format_percent)
+        comp_display["Confidence"] = comp_display["Confidence"].apply(format_percent)
+        comp_display["Lift"] = comp_display["Lift"].map("{:.2f}".format)
+        st.dataframe(comp_display.set_index("Product"))
+
     else:
         st.info("No cross-sell pairs found for the selected filters.")
 else:
-    st.warning("Items are missing required columns: order_id, product_name.")
\ No newline at end of file
+    st.warning("Items are missing required columns: order_id, product_name.")
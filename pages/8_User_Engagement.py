@@ -3,24 +3,32 @@ import plotly.express as px
 import pandas as pd
 import plotly.graph_objects as go
 import os
-from utils.db import load_tables
+from utils.memo import filtered_tables
+from utils.mart import session_facts
 from utils.filters import sidebar_filters
-from utils.agg import filter_sessions, filter_pageviews
+from utils.query import table_predicates
+from utils.stream import pageview_engagement
+from utils.paths import Clickstream, exit_pages, path_prefixes
 from utils.formatters import  format_percent, format_number, format_km
 st.title("👥 User Engagement")
 
 F = sidebar_filters()
 
-dfs = load_tables(["website_sessions", "website_pageviews"])
-sessions = filter_sessions(dfs["website_sessions"], F)
-pageviews = filter_pageviews(dfs["website_pageviews"], F)
+COLUMNS = {
+    "website_sessions": ["website_session_id", "created_at", "user_id", "is_repeat_session",
+                         "utm_source", "utm_campaign", "device_type"],
+}
+dfs = filtered_tables(["website_sessions"], F, columns=COLUMNS)
+sessions = session_facts(dfs["website_sessions"], ["is_bounce", "entry_url"])
 
-total_views = len(pageviews)
+# Pageviews of the filtered sessions are folded in one ordered pass (streamed in
+# chunks for tables in STREAM_TABLES), so every figure covers the same sessions
+engagement = pageview_engagement(table_predicates("website_pageviews", F), table_predicates("website_sessions", F))
+
+total_views = engagement["views"]
 total_sessions = len(sessions)
 
-pv_counts = pageviews.groupby("website_session_id").size().rename("pv_count").reset_index()
-sess_with_pv = sessions.merge(pv_counts, on="website_session_id", how="left").fillna({"pv_count": 0})
-bounce_rate = (sess_with_pv["pv_count"] == 1).sum() / len(sess_with_pv) if len(sess_with_pv) > 0 else None
+bounce_rate = sessions["is_bounce"].mean() if len(sessions) > 0 else None
 
 
 k1, k2, k3 = st.columns(3)
@@ -32,7 +40,7 @@ st.markdown("---")
 
 # --- Top website pages ---
 st.subheader("Top Website Pages")
-top_pages = pageviews.groupby("pageview_url").size().rename("views").reset_index().sort_values("views", ascending=False)
+top_pages = engagement["views_by_url"].rename_axis("pageview_url").rename("views").reset_index().sort_values("views", ascending=False)
 top_pages["label"] = top_pages["views"].apply(format_km)
 fig_pages = px.bar(top_pages, x="pageview_url", y="views", text="label")
 fig_pages.update_traces(textposition="outside", texttemplate="%{text}")
@@ -43,8 +51,8 @@ st.markdown("---")
 
 # --- Top entry pages ---
 st.subheader(" Top Entry Pages")
-first_pv = pageviews.sort_values("created_at").groupby("website_session_id").first().reset_index()
-entry_pages = first_pv.groupby("pageview_url").size().rename("entries").reset_index().sort_values("entries", ascending=False)
+first_pv = sessions.rename(columns={"entry_url": "pageview_url"})
+entry_pages = first_pv.groupby("pageview_url", observed=True).size().rename("entries").reset_index().sort_values("entries", ascending=False)
 entry_pages["label"] = entry_pages["entries"].apply(format_km)
 fig_entry = px.bar(entry_pages, x="pageview_url", y="entries", text="label")
 fig_entry.update_traces(textposition="outside", texttemplate="%{text}")
@@ -55,14 +63,7 @@ st.markdown("---")
 
 # --- Bounce rate ---
 st.subheader("Bounce Rate by Entry Page")
-pv_counts = pageviews.groupby("website_session_id").size().rename("pv_count").reset_index()
-sess_with_pv = sessions.merge(pv_counts, on="website_session_id", how="left").fillna({"pv_count":0})
-first_pv = pageviews.sort_values("created_at").groupby("website_session_id").first().reset_index()
-sess_with_entry = sess_with_pv.merge(first_pv[["website_session_id","pageview_url"]], on="website_session_id", how="left")
-
-bounce_by_entry = sess_with_entry.groupby("pageview_url").apply(
-    lambda g: (g["pv_count"]==1).sum()/len(g) if len(g)>0 else None
-).reset_index().rename(columns={0:"bounce_rate"}).sort_values("bounce_rate", ascending=False)
+bounce_by_entry = first_pv.groupby("pageview_url", observed=True)["is_bounce"].mean().rename("bounce_rate").reset_index().sort_values("bounce_rate", ascending=False)
 bounce_by_entry["label"] = bounce_by_entry["bounce_rate"].apply(lambda x: f"{x:.1%}")
 fig_bounce = px.bar(bounce_by_entry, x="pageview_url", y="bounce_rate", text="label")
 fig_bounce.update_traces(textposition="outside", texttemplate="%{text}")
@@ -109,15 +110,8 @@ st.markdown("---")
 
 # --- Pathing Analysis ---
 st.subheader("Pathing Analysis")
-pv_sorted = pageviews.sort_values(["website_session_id","created_at"])
-paths = (
-    pv_sorted.groupby("website_session_id")["pageview_url"]
-    .apply(lambda x: " → ".join(x.tolist()))
-    .reset_index()
-)
-
-path_counts = paths["pageview_url"].value_counts().reset_index()
-path_counts.columns = ["path","count"]
+path_counts = engagement["paths"].sort_values(ascending=False, kind="stable")
+path_counts = pd.DataFrame({"path": [" → ".join(p) for p in path_counts.index], "count": path_counts.to_numpy()})
 
 if not path_counts.empty:
     top_path = path_counts.iloc[0]
@@ -136,30 +130,39 @@ fig_paths.update_traces(textposition="outside", texttemplate="%{text}")
 fig_paths.update_layout(xaxis_title="Sessions", yaxis_title="Path")
 st.plotly_chart(fig_paths, use_container_width=True)
 
+prefixes = path_prefixes(engagement["paths"], 3).head(10)
+top_prefixes = pd.DataFrame({"path": [" → ".join(p) for p in prefixes.index], "count": prefixes.to_numpy()})
+top_prefixes["label"] = top_prefixes["count"].apply(format_km)
+fig_prefixes = px.bar(
+    top_prefixes,
+    x="count", y="path",
+    orientation="h",
+    title="Top 10 Path Openings (First 3 Pages)",
+    text="label"
+)
+fig_prefixes.update_traces(textposition="outside", texttemplate="%{text}")
+fig_prefixes.update_layout(xaxis_title="Sessions", yaxis_title="Path")
+st.plotly_chart(fig_prefixes, use_container_width=True)
+
+exits = exit_pages(engagement["paths"]).rename("exits").reset_index()
+exits["label"] = exits["exits"].apply(format_km)
+fig_exits = px.bar(exits, x="pageview_url", y="exits", title="Exit Pages", text="label")
+fig_exits.update_traces(textposition="outside", texttemplate="%{text}")
+fig_exits.update_layout(xaxis_title="Page URL", yaxis_title="Exits")
+st.plotly_chart(fig_exits, use_container_width=True)
+
 st.markdown("---")
 
 # Sankey diagram for first 3 steps
-pv_first3 = (
-    pv_sorted.groupby("website_session_id")["pageview_url"]
-    .apply(lambda x: x.tolist()[:3])
-    .reset_index()
-)
-
-links = []
-for steps in pv_first3["pageview_url"]:
-    for i in range(len(steps) - 1):
-        links.append((steps[i], steps[i+1]))
+flows = Clickstream.from_paths(engagement["paths"]).transitions(max_depth=3)
 
-nodes = sorted(set([src for src, tgt in links] + [tgt for src, tgt in links]))
+nodes = sorted(set(flows["source"]) | set(flows["target"]))
 node_index = {name: i for i, name in enumerate(nodes)}
 
-import collections
-link_counts = collections.Counter(links)
-
-sources = [node_index[src] for src, tgt in link_counts.keys()]
-targets = [node_index[tgt] for src, tgt in link_counts.keys()]
-values  = list(link_counts.values())
-labels  = [f"{src} → {tgt}: {val}" for (src, tgt), val in link_counts.items()]
+sources = flows["source"].map(node_index).tolist()
+targets = flows["target"].map(node_index).tolist()
+values  = flows["count"].tolist()
+labels  = [f"{src} → {tgt}: {val}" for src, tgt, val in zip(flows["source"], flows["target"], values)]
 
 fig_sankey = go.Figure(go.Sankey(
     node=dict(
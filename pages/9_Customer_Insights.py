@@ -1,12 +1,14 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 import os
-from utils.db import load_tables
+from utils.memo import filtered_tables
+from utils.cube import cube_query
+from utils.ids import id_codes, id_space
 from utils.filters import sidebar_filters
-from utils.agg import filter_sessions, filter_orders, compute_conversion_rate
 from utils.formatters import format_number, format_currency, format_percent, format_km
 
 st.title("🧠 Customer Insights")
@@ -14,14 +16,20 @@ st.title("🧠 Customer Insights")
 
 
 F = sidebar_filters()
-dfs = load_tables(["website_sessions","orders"])
-sessions = filter_sessions(dfs["website_sessions"], F)
-orders = filter_orders(dfs["orders"], F)
+COLUMNS = {
+    "website_sessions": ["website_session_id", "created_at", "user_id",
+                         "utm_source", "utm_campaign", "device_type"],
+    "orders": ["order_id", "website_session_id", "user_id", "created_at", "price_usd"],
+}
+dfs = filtered_tables(["website_sessions","orders"], F, columns=COLUMNS)
+sessions = dfs["website_sessions"]
+orders = dfs["orders"]
 
 st.markdown("---")
 
-total_sessions = len(sessions)
-conv_rate = compute_conversion_rate(sessions, orders)
+totals = cube_query(F).iloc[0]
+total_sessions = totals["sessions"]
+conv_rate = totals["conversion_rate"]
 
 k1, k2 = st.columns(2)
 k1.metric("🖥️ Total Sessions", format_number(total_sessions))
@@ -30,7 +38,7 @@ k2.metric("✅ Overall Conversion Rate", format_percent(conv_rate))
 st.markdown("---")
 
 st.subheader("Device Mix")
-device_mix = sessions.groupby("device_type").size().reset_index(name="sessions")
+device_mix = cube_query(F, by=["device_type"])[["device_type", "sessions"]]
 legend_map = {"desktop": "Desktop", "mobile": "Mobile"}
 device_mix["Device Type"] = device_mix["device_type"].map(legend_map)
 
@@ -42,7 +50,7 @@ st.plotly_chart(fig_device, use_container_width=True)
 st.markdown("---")
 
 st.subheader("Traffic Sources")
-src_break = sessions.groupby("utm_source").size().reset_index(name="sessions").sort_values("sessions", ascending=False)
+src_break = cube_query(F, by=["utm_source"])[["utm_source", "sessions"]].sort_values("sessions", ascending=False)
 src_break["label"] = src_break["sessions"].apply(format_km)
 fig_src = px.bar(src_break, x="utm_source", y="sessions", text="label")
 fig_src.update_traces(texttemplate="%{text}", textposition="outside", textfont=dict(color="white", size=14))
@@ -52,7 +60,7 @@ st.plotly_chart(fig_src, use_container_width=True)
 st.markdown("---")
 
 st.subheader("Campaign Breakdown")
-camp_break = sessions.groupby("utm_campaign").size().reset_index(name="sessions").sort_values("sessions", ascending=False)
+camp_break = cube_query(F, by=["utm_campaign"])[["utm_campaign", "sessions"]].sort_values("sessions", ascending=False)
 camp_break["label"] = camp_break["sessions"].apply(format_km)
 fig_camp = px.bar(camp_break, x="utm_campaign", y="sessions", text="label")
 fig_camp.update_traces(texttemplate="%{text}", textposition="outside", textfont=dict(color="white", size=14))
@@ -62,9 +70,8 @@ st.plotly_chart(fig_camp, use_container_width=True)
 st.markdown("---")
 
 st.subheader("Conversion Rate by Source & Device")
-sess_orders = sessions.merge(orders[["website_session_id","order_id"]], on="website_session_id", how="left")
-sess_orders["converted"] = sess_orders["order_id"].notna()
-conv_matrix = sess_orders.groupby(["utm_source","device_type"])["converted"].mean().reset_index()
+conv_matrix = cube_query(F, by=["utm_source", "device_type"])
+conv_matrix = conv_matrix[["utm_source", "device_type", "conversion_rate"]].rename(columns={"conversion_rate": "converted"})
 
 fig_conv_matrix = px.density_heatmap(
     conv_matrix, x="utm_source", y="device_type", z="converted",
@@ -80,14 +87,23 @@ st.markdown("---")
 
 
 st.subheader("Customer Segmentation (Revenue vs Sessions)")
-user_sessions = sessions.groupby("user_id")["website_session_id"].nunique().reset_index(name="sessions")
-user_orders = orders.groupby("user_id").agg(
-    orders=("order_id","nunique"),
-    revenue=("price_usd","sum"),
-    avg_order_value=("price_usd","mean")
-).reset_index()
-
-users = user_sessions.merge(user_orders, on="user_id", how="left").fillna(0)
+# Per-user totals over interned user codes
+n_users = len(id_space("user_id"))
+session_users = id_codes(sessions["user_id"])
+order_users = id_codes(orders["user_id"])
+has_user = order_users >= 0
+user_sessions = np.bincount(session_users[session_users >= 0], minlength=n_users)
+user_orders = np.bincount(order_users[has_user], minlength=n_users)
+user_revenue = np.bincount(order_users[has_user], weights=orders["price_usd"].fillna(0).to_numpy(dtype="float64")[has_user], minlength=n_users)
+
+present = np.flatnonzero(user_sessions)
+users = pd.DataFrame({
+    "user_id": id_space("user_id")[present],
+    "sessions": user_sessions[present],
+    "orders": user_orders[present],
+    "revenue": user_revenue[present],
+})
+users["avg_order_value"] = (users["revenue"] / users["orders"].where(users["orders"] > 0)).fillna(0)
 users["conversion_rate"] = users["orders"] / users["sessions"]
 users["repeat_purchase"] = (users["orders"] >= 2).astype(int)
 
@@ -97,6 +113,9 @@ X_scaled = scaler.fit_transform(features)
 
 kmeans = KMeans(n_clusters=4, random_state=42)
 users["segment"] = kmeans.fit_predict(X_scaled)
+# Cluster ids depend on row order; renumber them by mean revenue so the labels follow spend
+spend_rank = users.groupby("segment")["revenue"].mean().rank(method="first").astype(int) - 1
+users["segment"] = users["segment"].map(spend_rank)
 
 segment_map = {0: "Low Spender", 1: "Medium Spender", 2: "High Spender", 3: "VIP Spender"}
 users["Segment"] = users["segment"].map(segment_map)
@@ -2,8 +2,9 @@ import streamlit as st
 import yaml
 from yaml.loader import SafeLoader
 from utils.auth_state import ensure_session_keys, mark_activity, logout_and_redirect, check_timeout
-from utils.db import load_tables
-from utils.agg import compute_conversion_rate
+from utils.db import refresh_tables
+from utils.diagnostics import diagnostics_panel
+from utils.mart import home_kpis
 from utils.formatters import format_number, format_currency
 
 # Role → allowed dashboards mapping
@@ -18,6 +19,7 @@ ROLE_DASHBOARDS = {
         "pages/7_Product_Performance.py",
         "pages/8_User_Engagement.py",
         "pages/9_Customer_Insights.py",
+        "pages/10_SQL_Scratchpad.py",
     ],
     "ceo": [
         "pages/1_Traffic_and_Acquisition.py",
@@ -41,50 +43,16 @@ ROLE_DASHBOARDS = {
     ],
 }
 
-def render(authenticator=None, config=None):
-    """
-    Render the Home page (homepage + role-aware navigation).
-    """
-    ensure_session_keys()
-    check_timeout(threshold_minutes=3)
-    mark_activity()
-
-    # Load config if not passed
-    if config is None:
-        with open("config.yaml") as f:
-            config = yaml.load(f, Loader=SafeLoader)
-
-    authentication_status = st.session_state.get("authentication_status")
-    username = st.session_state.get("username")
-    name = st.session_state.get("name")
-
-    # Guard: must be logged in
-    if not authentication_status:
-        st.warning("⚠️ Session expired or not authenticated. Please log in again.")
-        logout_and_redirect(authenticator=authenticator, target="Login")
-        return
-
-    # Sidebar: welcome + logout
-    st.sidebar.success(f"Welcome {name} 👋")
-
-    if st.sidebar.button("Logout"):
-        logout_and_redirect(authenticator=authenticator, target="Login")
-
-    # Role lookup
-    role = config["credentials"]["usernames"][username]["role"]
-
-    # Data load
-    dfs = load_tables(["website_sessions", "orders"])
-    sessions = dfs["website_sessions"]
-    orders = dfs["orders"]
-
-    # KPIs
-    total_sessions = len(sessions)
-    total_orders = len(orders)
-    total_revenue = orders["price_usd"].sum()
-    conv_rate = compute_conversion_rate(sessions, orders)
-    avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
-    repeat_rate = (orders.groupby("user_id")["order_id"].nunique() >= 2).mean()
+def home_view():
+    """The Home view: title and the role's KPIs, from the cached whole-data summary."""
+    role = st.session_state.get("role")
+    kpis = home_kpis()
+    total_sessions = kpis["sessions"]
+    total_orders = kpis["orders"]
+    total_revenue = kpis["revenue"]
+    conv_rate = kpis["conversion_rate"]
+    avg_order_value = kpis["avg_order_value"]
+    repeat_rate = kpis["repeat_rate"]
 
     # Homepage content
     st.title("🧸 Analytics Hub")
@@ -120,8 +88,45 @@ def render(authenticator=None, config=None):
     else:
         st.error("Your role does not have a configured homepage.")
 
-    st.markdown("---")
-    
+def render(authenticator=None, config=None):
+    """
+    Render the Home page (homepage + role-aware navigation).
+    """
+    ensure_session_keys()
+    check_timeout(threshold_minutes=3)
+    mark_activity()
+
+    # Load config if not passed
+    if config is None:
+        with open("config.yaml") as f:
+            config = yaml.load(f, Loader=SafeLoader)
+
+    authentication_status = st.session_state.get("authentication_status")
+    username = st.session_state.get("username")
+    name = st.session_state.get("name")
+
+    # Guard: must be logged in
+    if not authentication_status:
+        st.warning("⚠️ Session expired or not authenticated. Please log in again.")
+        logout_and_redirect(authenticator=authenticator, target="Login")
+        return
+
+    # Sidebar: welcome + logout
+    st.sidebar.success(f"Welcome {name} 👋")
+
+    if st.sidebar.button("Logout"):
+        logout_and_redirect(authenticator=authenticator, target="Login")
+
+    # Role lookup
+    role = config["credentials"]["usernames"][username]["role"]
+    st.session_state["role"] = role
+
+    # Admins can pull new rows into the local snapshots without waiting for them to go stale
+    if role == "admin" and st.sidebar.button("Refresh Data"):
+        with st.spinner("Fetching new rows..."):
+            refresh_tables()
+        st.rerun()
+
     # Role-aware navigation
     PAGES_MAP = {
         "pages/1_Traffic_and_Acquisition.py": st.Page(
@@ -151,13 +156,22 @@ def render(authenticator=None, config=None):
         "pages/9_Customer_Insights.py": st.Page(
             "pages/9_Customer_Insights.py", title="Customer Insights", icon="🧠"
         ),
+        "pages/10_SQL_Scratchpad.py": st.Page(
+            "pages/10_SQL_Scratchpad.py", title="SQL Scratchpad", icon="🧮"
+        ),
     }
 
     allowed_pages = ROLE_DASHBOARDS.get(role, [])
     role_pages = [PAGES_MAP[p] for p in allowed_pages if p in PAGES_MAP]
 
-    nav = st.navigation({"📂 Dashboards": role_pages})
+    # Home is a page of its own, so its KPIs only render when it is the page being viewed
+    home_page = st.Page(home_view, title="Home", icon="🏠", url_path="home", default=True)
+    nav = st.navigation({"🏠 Home": [home_page], "📂 Dashboards": role_pages})
     nav.run()
+
+    # Rendered after the page so its loads are included
+    if role == "admin":
+        diagnostics_panel()
     
     st.markdown("---")
     
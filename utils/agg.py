@@ -1,109 +1,97 @@
 import pandas as pd
 import numpy as np
 
-def filter_sessions(sessions: pd.DataFrame, F: dict) -> pd.DataFrame:
-    df = sessions.copy()
-    if "created_at" in df.columns:
+from . import duck
+from .funnel import session_steps
+from .ids import id_codes, join_rows
+from .query import table_predicates
+from .timeseries import WEEKDAYS, hour_weekday_counts
+
+def _prefiltered(df: pd.DataFrame, table_key: str, F: dict, product_ids=None) -> bool:
+    """
+    True when df came from load_table restricted to exactly what F selects for
+    this table, so the window and dimension masks can be skipped. Any row subset
+    of such a frame still qualifies.
+    """
+    return df.attrs.get("predicates") == table_predicates(table_key, F, product_ids)
+
+def _window(df: pd.DataFrame, F: dict) -> pd.DataFrame:
+    if "created_at" in df.columns and not pd.api.types.is_datetime64_dtype(df["created_at"]):
         df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
-    df = df.dropna(subset=["website_session_id"])
-    df = df[(df["created_at"] >= F["start_ts"]) & (df["created_at"] <= F["end_ts"])]
+    return df[(df["created_at"] >= F["start_ts"]) & (df["created_at"] <= F["end_ts"])]
 
-    for col, key in [
-        ("utm_source","utm_source"), ("utm_campaign","utm_campaign"),
-        ("utm_content","utm_content"), ("device_type","device_type"),
-        ("http_referer","http_referer")
-    ]:
-        vals = F.get(key, [])
-        if vals and col in df.columns:
-            df = df[df[col].isin(vals)]
+def filter_sessions(sessions: pd.DataFrame, F: dict) -> pd.DataFrame:
+    df = sessions.copy(deep=False)
+    df = df.dropna(subset=["website_session_id"])
+    if not _prefiltered(df, "website_sessions", F):
+        df = _window(df, F)
+        for col, key in [
+            ("utm_source","utm_source"), ("utm_campaign","utm_campaign"),
+            ("utm_content","utm_content"), ("device_type","device_type"),
+            ("http_referer","http_referer")
+        ]:
+            vals = F.get(key, [])
+            if vals and col in df.columns:
+                df = df[df[col].isin(vals)]
 
     df = df.drop_duplicates(subset=["website_session_id"])
     return df
 
 def filter_pageviews(pvs: pd.DataFrame, F: dict) -> pd.DataFrame:
-    df = pvs.copy()
-    if "created_at" in df.columns:
-        df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
+    df = pvs.copy(deep=False)
     df = df.dropna(subset=["website_session_id"])
-    df = df[(df["created_at"] >= F["start_ts"]) & (df["created_at"] <= F["end_ts"])]
-    purls = F.get("pageview_urls", [])
-    if purls and "pageview_url" in df.columns:
-        df = df[df["pageview_url"].isin(purls)]
+    if not _prefiltered(df, "website_pageviews", F):
+        df = _window(df, F)
+        purls = F.get("pageview_urls", [])
+        if purls and "pageview_url" in df.columns:
+            df = df[df["pageview_url"].isin(purls)]
     return df
 
 def filter_orders(orders: pd.DataFrame, F: dict) -> pd.DataFrame:
-    df = orders.copy()
-    if "created_at" in df.columns:
-        df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
-    df = df[(df["created_at"] >= F["start_ts"]) & (df["created_at"] <= F["end_ts"])]
+    df = orders.copy(deep=False)
+    if not _prefiltered(df, "orders", F):
+        df = _window(df, F)
     return df
 
 def filter_order_items(items: pd.DataFrame, products: pd.DataFrame, F: dict) -> pd.DataFrame:
-    df = items.copy()
-    if "created_at" in df.columns:
-        df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
-    df = df[(df["created_at"] >= F["start_ts"]) & (df["created_at"] <= F["end_ts"])]
-    df = df.merge(products[["product_id","product_name"]], on="product_id", how="left")
+    df = items.copy(deep=False)
     prods = F.get("product_names", [])
-    if prods and "product_name" in df.columns:
+    product_ids = products.loc[products["product_name"].isin(prods), "product_id"].tolist() if prods else None
+    prefiltered = _prefiltered(df, "order_items", F, product_ids)
+    if not prefiltered:
+        df = _window(df, F)
+    df = df.merge(products[["product_id","product_name"]], on="product_id", how="left")
+    if prods and not prefiltered and "product_name" in df.columns:
         df = df[df["product_name"].isin(prods)]
     return df
 
-def rollup(df: pd.DataFrame, ts_col: str, granularity: str) -> pd.DataFrame:
-    out = df.copy()
-    out[ts_col] = pd.to_datetime(out[ts_col], errors="coerce")
-    out = out.dropna(subset=[ts_col])
-    out["date"] = out[ts_col].dt.normalize()
-
-    if granularity == "Daily":
-        out["bucket"] = out["date"]
-    elif granularity == "Weekly":
-        out["bucket"] = out["date"] - pd.to_timedelta(out["date"].dt.weekday, unit="d")
-    elif granularity == "Monthly":
-        out["bucket"] = out["date"].values.astype("datetime64[M]")
-        out["bucket"] = pd.to_datetime(out["bucket"])
-    elif granularity == "Yearly":
-        out["bucket"] = out["date"].dt.year
-    else:
-        out["bucket"] = out["date"]
-    return out
+# -----------------------
+# Session KPIs. `facts` is a sessions frame with the session mart attached
+# (utils.mart.session_facts), so each KPI is a reduction over its columns.
+# -----------------------
+
+def compute_bounce_rate(facts: pd.DataFrame) -> float:
+    return float(facts["is_bounce"].mean()) if len(facts) > 0 else np.nan
 
-def compute_bounce_rate(sessions: pd.DataFrame, pageviews: pd.DataFrame) -> float:
-    pv_counts = (
-        pageviews.groupby("website_session_id", dropna=False)
-        .size()
-        .rename("pv_count")
-        .reset_index()
-    )
-    sess = sessions.merge(pv_counts, on="website_session_id", how="left").fillna({"pv_count": 0})
-    total = len(sess)
-    if total == 0:
-        return np.nan
-    single = (sess["pv_count"] == 1).sum()
-    return float(single) / total
-
-def compute_conversion_rate(sessions: pd.DataFrame, orders: pd.DataFrame) -> float:
-    valid_session_ids = set(sessions["website_session_id"])
-    ordered_sessions = set(orders["website_session_id"].dropna())
-    conversions = len(valid_session_ids.intersection(ordered_sessions))
-    total_sessions = len(valid_session_ids)
-    return float(conversions) / total_sessions if total_sessions > 0 else np.nan
-
-def revenue_metrics(orders: pd.DataFrame, refunds: pd.DataFrame, sessions: pd.DataFrame):
-    gross_rev = float(orders["price_usd"].sum()) if "price_usd" in orders.columns else 0.0
-    refund_amt = float(refunds["refund_amount_usd"].sum()) if "refund_amount_usd" in refunds.columns else 0.0
+def compute_conversion_rate(facts: pd.DataFrame) -> float:
+    return float(facts["converted"].mean()) if len(facts) > 0 else np.nan
+
+def revenue_metrics(facts: pd.DataFrame):
+    gross_rev = float(facts["revenue"].sum())
+    refund_amt = float(facts["refunds"].sum())
     net_rev = gross_rev - refund_amt
+    net = facts["revenue"] - facts["refunds"]
 
-    if "is_repeat_session" in sessions.columns:
-        new_sessions = sessions[sessions["is_repeat_session"] == False]
-        repeat_sessions = sessions[sessions["is_repeat_session"] == True]
+    if "is_repeat_session" in facts.columns:
+        repeat = (facts["is_repeat_session"] == True).to_numpy()
+        new = (facts["is_repeat_session"] == False).to_numpy()
     else:
-        new_sessions = sessions
-        repeat_sessions = sessions.iloc[0:0]
+        repeat = np.zeros(len(facts), dtype=bool)
+        new = ~repeat
 
-    total_sessions = len(sessions)
-    new_rev_per_session = net_rev / len(new_sessions) if len(new_sessions) > 0 else np.nan
-    repeat_rev_per_session = net_rev / len(repeat_sessions) if len(repeat_sessions) > 0 else np.nan
+    total_sessions = len(facts)
+    new_rev_per_session = float(net[new].sum()) / new.sum() if new.any() else np.nan
+    repeat_rev_per_session = float(net[repeat].sum()) / repeat.sum() if repeat.any() else np.nan
     rev_per_session = net_rev / total_sessions if total_sessions > 0 else np.nan
 
     return {
@@ -115,21 +103,77 @@ def revenue_metrics(orders: pd.DataFrame, refunds: pd.DataFrame, sessions: pd.Da
         "rev_per_session_repeat": repeat_rev_per_session,
     }
 
-def gsearch_metrics(sessions: pd.DataFrame, orders: pd.DataFrame):
-    g_sessions = sessions[sessions["utm_source"] == "gsearch"]
-    g_ids = set(g_sessions["website_session_id"])
-    ordered_ids = set(orders["website_session_id"].dropna())
-    g_conv = len(g_ids.intersection(ordered_ids)) / len(g_sessions) if len(g_sessions) > 0 else np.nan
-    return {"gsearch_conversion_rate": g_conv, "gsearch_sessions": len(g_sessions)}
-
-def hour_weekday_session_volume(sessions: pd.DataFrame):
-    s = sessions.copy()
-    s["created_at"] = pd.to_datetime(s["created_at"], errors="coerce")
-    s["hour"] = s["created_at"].dt.hour
-    s["weekday"] = s["created_at"].dt.day_name()
-    by_hour = s.groupby("hour").size().rename("sessions").reset_index()
-    by_weekday = s.groupby("weekday").size().rename("sessions").reset_index()
-    order = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
-    by_weekday["weekday"] = pd.Categorical(by_weekday["weekday"], categories=order, ordered=True)
-    by_weekday = by_weekday.sort_values("weekday")
-    return by_hour, by_weekday
\ No newline at end of file
+def gsearch_metrics(facts: pd.DataFrame):
+    g = facts[(facts["utm_source"] == "gsearch").to_numpy()]
+    g_conv = float(g["converted"].mean()) if len(g) > 0 else np.nan
+    return {"gsearch_conversion_rate": g_conv, "gsearch_sessions": len(g)}
+
+def hour_weekday_session_volume(sessions: pd.DataFrame, start=None, end=None):
+    """
+    Sessions per hour of day and per weekday between start and end: totals
+    ("sessions") and averages per calendar day ("avg_sessions", each weekday
+    divided by how often it occurs in the window), plus the 24 x 7 matrix of
+    averages (hours by weekdays).
+    """
+    totals, days = hour_weekday_counts(sessions, start, end)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        by_hour = pd.DataFrame({
+            "hour": np.arange(24),
+            "sessions": totals.sum(axis=1),
+            "avg_sessions": totals.sum(axis=1) / days.sum(),
+        })
+        by_weekday = pd.DataFrame({
+            "weekday": pd.Categorical(WEEKDAYS, categories=WEEKDAYS, ordered=True),
+            "sessions": totals.sum(axis=0),
+            "avg_sessions": totals.sum(axis=0) / days,
+        })
+        heatmap = pd.DataFrame(totals / days, index=pd.RangeIndex(24, name="hour"),
+                               columns=pd.Index(WEEKDAYS, name="weekday"))
+    return by_hour, by_weekday, heatmap
+
+# -----------------------
+# Page aggregations. Each runs in pandas, or in embedded DuckDB when
+# COMPUTE_ENGINE = "duckdb" (see utils.duck); both return the same frames.
+# -----------------------
+
+def _session_attr(df: pd.DataFrame, sessions: pd.DataFrame, col: str):
+    """sessions[col] of the session of each row of df (missing where that session is not in sessions)."""
+    rows = join_rows(id_codes(df["website_session_id"]), id_codes(sessions["website_session_id"]), "website_session_id")
+    return sessions[col].array.take(rows, allow_fill=True)
+
+def channel_summary(sessions: pd.DataFrame, orders: pd.DataFrame, by: str = "utm_source") -> pd.DataFrame:
+    """Sessions, orders, revenue, average order value and conversion rate per channel."""
+    if duck.enabled():
+        return duck.channel_summary(sessions, orders, by)
+    sess = sessions.groupby(by, observed=True).agg(sessions=("website_session_id", "nunique")).reset_index()
+    ords = orders.assign(**{by: _session_attr(orders, sessions, by)})
+    ords = ords.groupby(by, observed=True).agg(
+        orders=("order_id", "nunique"),
+        revenue=("price_usd", "sum"),
+        avg_order_value=("price_usd", "mean")
+    ).reset_index()
+    out = sess.merge(ords, on=by, how="outer")
+    out = out.fillna({c: 0 for c in out.columns if c != by})
+    out["conversion_rate"] = out["orders"] / out["sessions"]
+    return out
+
+def monthly_trends(sessions: pd.DataFrame, orders: pd.DataFrame, by: str = "utm_source"):
+    """Monthly sessions, orders and revenue per channel, as three long frames."""
+    if duck.enabled():
+        return duck.monthly_trends(sessions, orders, by)
+    s = sessions.assign(month=pd.to_datetime(sessions["created_at"]).dt.to_period("M").dt.to_timestamp())
+    o = orders.assign(month=pd.to_datetime(orders["created_at"]).dt.to_period("M").dt.to_timestamp())
+    o = o.assign(**{by: _session_attr(orders, sessions, by)})
+    sess_trend = s.groupby([by, "month"], observed=True).size().reset_index(name="sessions")
+    ord_trend = o.groupby([by, "month"], observed=True).size().reset_index(name="orders")
+    rev_trend = o.groupby([by, "month"], observed=True)["price_usd"].sum().reset_index(name="revenue")
+    return sess_trend, ord_trend, rev_trend
+
+def funnel_reach(pageviews: pd.DataFrame, steps: dict, cumulative: bool = False) -> pd.DataFrame:
+    """
+    Sessions reaching each step (a step is a list of URLs).
+    With cumulative=True a session counts for a step only if it also reached every earlier step.
+    """
+    if duck.enabled():
+        return duck.funnel_reach(pageviews, steps, cumulative)
+    return session_steps(pageviews, steps).funnel(cumulative=cumulative)
@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+
+from .config import ATTRIBUTION_HALF_LIFE_DAYS, ATTRIBUTION_LOOKBACK_DAYS, ATTRIBUTION_POSITION_ENDS, MARKOV_CHANNEL
+from .ids import id_codes, id_flags, id_space
+from .timeseries import NAT
+
+# -----------------------
+# Multi-touch attribution. Sessions with a channel are sorted once into
+# per-user timelines (user code, then time). The touches of an order are a
+# contiguous run of that order: its buyer's sessions from the start of the
+# lookback window up to the order, found with two searchsorted calls.
+# Runs are expanded with cumulative offsets into (order, touch) pairs, one
+# per touch that can share the order's credit, so the work grows with the
+# touches inside the window instead of with every session x order of a user.
+# Each model weighs the pairs and one bincount per model sums revenue per channel.
+# -----------------------
+
+MODELS = {
+    "first_touch": "First Touch",
+    "last_touch": "Last Touch",
+    "linear": "Linear",
+    "position_based": "Position-Based",
+    "time_decay": "Time Decay",
+}
+DAY_S = 86_400
+
+
+def _seconds(s: pd.Series) -> np.ndarray:
+    ns = s.to_numpy(dtype="datetime64[ns]").view("i8")
+    return np.where(ns == NAT, NAT, ns // 10**9)
+
+
+def touch_pairs(sessions: pd.DataFrame, orders: pd.DataFrame, by: str = "utm_source",
+                lookback_days: float = ATTRIBUTION_LOOKBACK_DAYS) -> dict:
+    """
+    (order, touch) pairs: for every order with a known buyer, the buyer's
+    sessions with a `by` value from lookback_days before the order up to the
+    order, in time order. Arrays: order (row in orders), touch (row in
+    sessions), pos (0-based index of the touch within its order), k (touches
+    of the order) and age (seconds from touch to order).
+    """
+    users = id_codes(sessions["user_id"])
+    ts = _seconds(sessions["created_at"])
+    touch = np.flatnonzero((users >= 0) & (ts != NAT) & sessions[by].notna().to_numpy())
+    touch = touch[np.lexsort((ts[touch], users[touch]))]
+
+    buyers = id_codes(orders["user_id"])
+    ots = _seconds(orders["created_at"])
+    placed = np.flatnonzero((buyers >= 0) & (ots != NAT))
+    if not len(touch) or not len(placed):
+        empty = np.empty(0, dtype=np.intp)
+        return {"order": empty, "touch": empty, "pos": empty, "k": empty, "age": empty}
+
+    # Timeline keys: user * span + time since t0 (from 1, so 0 sits below every session of a user)
+    t0 = min(ts[touch].min(), ots[placed].min())
+    span = max(ts[touch].max(), ots[placed].max()) - t0 + 2
+    keys = users[touch].astype(np.int64) * span + (ts[touch] - t0 + 1)
+    base = buyers[placed].astype(np.int64) * span
+    until = ots[placed] - t0 + 1
+    since = np.zeros_like(until) if lookback_days is None else np.maximum(until - int(lookback_days * DAY_S), 0)
+    hi = np.searchsorted(keys, base + until, side="right")
+    lo = np.searchsorted(keys, base + since, side="left")
+
+    k = hi - lo
+    pair_order = np.repeat(np.arange(len(placed)), k)
+    pos = np.arange(len(pair_order)) - np.repeat(np.cumsum(k) - k, k)
+    pair_touch = touch[lo[pair_order] + pos]
+    return {
+        "order": placed[pair_order],
+        "touch": pair_touch,
+        "pos": pos,
+        "k": k[pair_order],
+        "age": ots[placed][pair_order] - ts[pair_touch],
+    }
+
+
+def credit_weights(pairs: dict, model: str, half_life_days: float = ATTRIBUTION_HALF_LIFE_DAYS,
+                   position_ends: float = ATTRIBUTION_POSITION_ENDS) -> np.ndarray:
+    """Share of its order's credit each pair gets under `model` (shares of an order sum to 1)."""
+    pos, k = pairs["pos"], pairs["k"]
+    if model == "first_touch":
+        return (pos == 0).astype(np.float64)
+    if model == "last_touch":
+        return (pos == k - 1).astype(np.float64)
+    if model == "linear":
+        return 1.0 / k
+    if model == "position_based":
+        ends = np.where(k == 2, 0.5, position_ends)
+        middle = (1 - 2 * position_ends) / np.maximum(k - 2, 1)
+        w = np.where((pos == 0) | (pos == k - 1), ends, middle)
+        return np.where(k == 1, 1.0, w)
+    if model == "time_decay":
+        w = np.exp2(-pairs["age"] / (half_life_days * DAY_S))
+        _, order = np.unique(pairs["order"], return_inverse=True)
+        return w / np.bincount(order, weights=w)[order]
+    raise ValueError(f"Unknown attribution model: {model}")
+
+
+def attribute_revenue(sessions: pd.DataFrame, orders: pd.DataFrame, by: str = "utm_source",
+                      models=tuple(MODELS), lookback_days: float = ATTRIBUTION_LOOKBACK_DAYS,
+                      half_life_days: float = ATTRIBUTION_HALF_LIFE_DAYS) -> pd.DataFrame:
+    """
+    Order revenue per `by` channel under each model, as "<model>_revenue"
+    columns. Orders without a touch in their lookback window are not credited.
+    """
+    pairs = touch_pairs(sessions, orders, by, lookback_days)
+    channel, uniques = pd.factorize(sessions[by], sort=True)
+    price = orders["price_usd"].fillna(0).to_numpy(dtype="float64")[pairs["order"]]
+    key = channel[pairs["touch"]]
+    out = pd.DataFrame({by: uniques})
+    for m in models:
+        w = credit_weights(pairs, m, half_life_days)
+        out[f"{m}_revenue"] = np.bincount(key, weights=price * w, minlength=len(uniques))
+    return out
+
+
+# -----------------------
+# Markov-chain attribution. Every user's channel path (sessions in time
+# order, up to the first order for buyers) becomes transitions between
+# states: start, one state per channel, conversion and null (no order).
+# Transition counts come from one bincount over src * N + dst. The
+# conversion probability from start is an absorbing-chain solve,
+# (I - Q) x = r. Removing a channel sends the transitions into it to null.
+# The chain and every removal are solved in one batched np.linalg.solve.
+# The revenue of the buyers whose path reaches conversion is split in
+# proportion to the removal effects.
+# -----------------------
+
+NO_CHANNEL = "(none)"
+
+
+def _channel_codes(sessions: pd.DataFrame, by: list):
+    """Channel code of every session, and the `by` values plus a "channel" label of each code."""
+    groups = sessions.groupby(by, dropna=False, observed=True, sort=True)
+    channels = groups.size().index.to_frame(index=False)
+    channels.insert(0, "channel", channels.astype(object).fillna(NO_CHANNEL).astype(str).agg(" / ".join, axis=1))
+    return groups.ngroup().to_numpy(), channels
+
+
+def channel_transitions(sessions: pd.DataFrame, orders: pd.DataFrame, by: list = MARKOV_CHANNEL):
+    """
+    (counts, channels, converters): N x N transition counts over states
+    [start, *channels, conversion, null], one row per channel state (see
+    _channel_codes), and the user codes whose path reaches conversion.
+    """
+    users = id_codes(sessions["user_id"])
+    ts = _seconds(sessions["created_at"])
+    channel, channels = _channel_codes(sessions, by)
+    c = len(channels)
+    n_states = c + 3
+    start, conv, null = 0, c + 1, c + 2
+
+    # First order of every buyer
+    buyers = id_codes(orders["user_id"])
+    ots = _seconds(orders["created_at"])
+    placed = (buyers >= 0) & (ots != NAT)
+    first_order = np.full(len(id_space("user_id")), np.iinfo(np.int64).max)
+    np.minimum.at(first_order, buyers[placed], ots[placed])
+    converts = first_order < np.iinfo(np.int64).max
+
+    keep = np.flatnonzero((users >= 0) & (ts != NAT))
+    keep = keep[ts[keep] <= first_order[users[keep]]]  # buyers' paths stop at their first order
+    keep = keep[np.lexsort((ts[keep], users[keep]))]
+    u, state = users[keep], channel[keep] + 1
+    if not len(keep):
+        return np.zeros((n_states, n_states)), channels, np.empty(0, dtype=np.intp)
+
+    head = np.r_[True, u[1:] != u[:-1]]
+    tail = np.r_[u[1:] != u[:-1], True]
+    src = np.concatenate([np.full(head.sum(), start), state[:-1][~tail[:-1]], state[tail]])
+    dst = np.concatenate([state[head], state[1:][~head[1:]], np.where(converts[u[tail]], conv, null)])
+    counts = np.bincount(src * n_states + dst, minlength=n_states * n_states).reshape(n_states, n_states)
+    last = u[tail]
+    return counts.astype(np.float64), channels, last[converts[last]]
+
+
+def removal_effects(counts: np.ndarray) -> tuple[float, np.ndarray]:
+    """(conversion probability, removal effect of each channel) of a transition count matrix."""
+    n_states = len(counts)
+    c = n_states - 3
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = np.nan_to_num(counts / counts.sum(axis=1, keepdims=True))
+    transient = c + 1  # start and the channels
+    q = p[:transient, :transient]
+    r = p[:transient, c + 1]
+
+    # System 0 is the full chain; system i drops every transition into channel i
+    qs = np.repeat(q[None], c + 1, axis=0)
+    qs[np.arange(1, c + 1), :, np.arange(1, c + 1)] = 0
+    x = np.linalg.solve(np.eye(transient) - qs, np.broadcast_to(r, (c + 1, transient))[..., None])[..., 0]
+    base = x[0, 0]
+    effect = 1 - x[1:, 0] / base if base > 0 else np.zeros(c)
+    return float(base), effect
+
+
+def markov_attribution(sessions: pd.DataFrame, orders: pd.DataFrame, by: list = MARKOV_CHANNEL) -> pd.DataFrame:
+    """
+    One row per channel (the `by` columns plus a "channel" label): its
+    removal effect and "markov_revenue", the order revenue of the buyers whose
+    path reaches conversion split in proportion to the removal effects. The
+    chain's conversion probability is in attrs["conversion_probability"] and
+    the revenue of the other orders in attrs["unattributed_revenue"].
+    """
+    counts, channels, converters = channel_transitions(sessions, orders, by)
+    base, effect = removal_effects(counts)
+    buyers = id_codes(orders["user_id"])
+    credited = np.where(buyers >= 0, id_flags(converters, "user_id")[buyers], False)
+    price = orders["price_usd"].fillna(0).to_numpy(dtype="float64")
+    revenue = float(price[credited].sum())
+    share = effect / effect.sum() if effect.sum() > 0 else np.zeros(len(effect))
+    out = channels.copy()
+    out["removal_effect"] = effect
+    out["markov_revenue"] = revenue * share
+    out.attrs["conversion_probability"] = base
+    out.attrs["unattributed_revenue"] = float(price.sum()) - revenue
+    return out
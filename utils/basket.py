@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+from .config import CROSS_SELL_TOP_K
+from .ids import id_codes
+
+# -----------------------
+# Basket co-occurrence. Order items become the sparse order x product
+# incidence matrix X (one nonzero per distinct order and product, kept as
+# coordinates sorted by order). The co-occurrence matrix C = Xᵀ·X counts
+# orders with both products i and j; its diagonal counts the orders holding
+# each product. C is built without densifying X: every order with k products
+# expands into its k x k product pairs (cumulative offsets, no Python loop),
+# and one bincount over i * P + j sums them, so the work grows with the pairs
+# actually bought together. Support, confidence and lift are elementwise
+# over C.
+# -----------------------
+
+
+class Baskets:
+    """Products bought together in the orders of an order items frame."""
+
+    def __init__(self, items: pd.DataFrame, product: str = "product_name"):
+        orders = id_codes(items["order_id"])
+        codes, labels = pd.factorize(items[product].array, sort=True)
+        ok = (orders >= 0) & (codes >= 0)
+        p = len(labels)
+        cells = np.unique(orders[ok].astype(np.int64) * p + codes[ok])
+
+        self.labels = pd.Index(labels, name=product)
+        self.order, self.product = np.divmod(cells, max(p, 1))  # nonzeros of X, by order
+        new = np.r_[True, self.order[1:] != self.order[:-1]] if len(cells) else np.empty(0, dtype=bool)
+        self.offsets = np.r_[np.flatnonzero(new), len(cells)]   # X[o] is product[offsets[o]:offsets[o + 1]]
+        self.counts = self._gram()
+
+    def __len__(self):
+        """Orders with at least one product."""
+        return len(self.offsets) - 1
+
+    def _gram(self) -> np.ndarray:
+        p = len(self.labels)
+        k = np.diff(self.offsets)
+        per = np.repeat(k, k)                              # products in the order of each nonzero
+        first = np.repeat(self.offsets[:-1], k)            # first nonzero of that order
+        a = np.repeat(np.arange(len(self.product)), per)
+        b = np.repeat(first, per) + np.arange(len(a)) - np.repeat(np.cumsum(per) - per, per)
+        key = self.product[a] * p + self.product[b]
+        return np.bincount(key, minlength=p * p).reshape(p, p)
+
+    @property
+    def orders(self) -> np.ndarray:
+        """Orders holding each product (the diagonal of Xᵀ·X)."""
+        return np.diag(self.counts)
+
+    def matrix(self) -> pd.DataFrame:
+        """Xᵀ·X as a frame, products on both axes."""
+        return pd.DataFrame(self.counts, index=self.labels, columns=self.labels.rename(None))
+
+    def _rules(self, a: np.ndarray, b: np.ndarray) -> dict:
+        together = self.counts[a, b]
+        n = max(len(self), 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {
+                "orders": together,
+                "support": together / n,
+                "confidence": together / self.orders[a],
+                "lift": together * n / (self.orders[a] * self.orders[b]),
+            }
+
+    def pairs(self) -> pd.DataFrame:
+        """
+        Every pair bought together (product_a before product_b in label order):
+        orders, support, confidence of each direction and lift, most orders first.
+        """
+        a, b = np.nonzero(np.triu(self.counts, 1))
+        rules = self._rules(a, b)
+        out = pd.DataFrame({"product_a": self.labels[a], "product_b": self.labels[b],
+                            "orders": rules["orders"], "support": rules["support"],
+                            "confidence_ab": rules["confidence"],
+                            "confidence_ba": self._rules(b, a)["confidence"], "lift": rules["lift"]})
+        return out.sort_values("orders", ascending=False, kind="stable", ignore_index=True)
+
+    def complements(self, k: int = CROSS_SELL_TOP_K) -> pd.DataFrame:
+        """
+        The top k complements of each product (most likely to be in the same
+        order, ties by lift) with orders, support, confidence and lift.
+        """
+        a, b = np.nonzero(self.counts * (1 - np.eye(len(self.labels), dtype=self.counts.dtype)))
+        rules = self._rules(a, b)
+        order = np.lexsort((-rules["lift"], -rules["confidence"], a))
+        a, b = a[order], b[order]
+        rank = np.arange(len(a)) - np.searchsorted(a, a)
+        keep = rank < k
+        out = pd.DataFrame({"product": self.labels[a[keep]], "complement": self.labels[b[keep]],
+                            "rank": rank[keep] + 1})
+        for name, values in rules.items():
+            out[name] = values[order][keep]
+        return out
+
+    def heatmap(self) -> pd.DataFrame:
+        """Pair counts (upper triangle of Xᵀ·X) for the products that were bought with another."""
+        upper = np.triu(self.counts, 1)
+        rows, cols = upper.any(axis=1), upper.any(axis=0)
+        return pd.DataFrame(upper[np.ix_(rows, cols)], index=self.labels[rows].rename("product_a"),
+                            columns=self.labels[cols].rename("product_b"))
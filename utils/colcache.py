@@ -0,0 +1,57 @@
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# -----------------------
+# Arrays derived from a column (bucket codes, interned ids), cached per
+# underlying buffer. Shallow copies and copy-on-write projections of a frame
+# share their column buffers, so they share what was derived from them; an
+# entry is dropped as soon as a buffer it was derived from is released.
+# -----------------------
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _root(a: np.ndarray) -> np.ndarray:
+    while isinstance(a.base, np.ndarray):
+        a = a.base
+    return a
+
+
+def column_buffers(s: pd.Series) -> list[np.ndarray]:
+    """The ndarrays holding a column's values (and NA mask), without copying where pandas allows it."""
+    arr = s.array
+    bufs = [getattr(arr, attr, None) for attr in ("_data", "_mask", "_ndarray")]
+    bufs = [b for b in bufs if isinstance(b, np.ndarray)]
+    return bufs or [s.to_numpy()]
+
+
+def _forget(root_id: int):
+    with _lock:
+        for key in [k for k in _cache if root_id in k[0]]:
+            del _cache[key]
+
+
+def derived(s: pd.Series, tag, compute):
+    """compute(s), cached for as long as the buffers behind s live; tag names the derivation."""
+    bufs = column_buffers(s)
+    roots = [_root(b) for b in bufs]
+    key = (
+        tuple(id(r) for r in roots),
+        tuple((b.__array_interface__["data"][0], len(b), b.strides, b.dtype.str) for b in bufs),
+        tag,
+    )
+    with _lock:
+        value = _cache.get(key)
+    if value is None:
+        value = compute(s)
+        with _lock:
+            known = {i for k in _cache for i in k[0]}
+            for r in roots:
+                if id(r) not in known:
+                    weakref.finalize(r, _forget, id(r))
+            _cache[key] = value
+    return value
@@ -78,5 +78,98 @@ UTM_CAMPAIGN = ["brand", "unspecified", "pilot", "nonbrand", "desktop_targeted"]
 DEVICE_TYPE = ["desktop", "mobile"]
 HTTP_REFERRER = ["direct", "https://www.socialbook.com", "https://www.gsearch.com", "https://www.bsearch.com"]
 
+# Conversion funnel: step -> pageview URLs, in funnel order
+FUNNEL_GROUPS = {
+    "Landers": ["/lander-1", "/lander-2", "/lander-3", "/lander-4", "/lander-5", "/home"],
+    "Products": ["/products",
+                 "/the-birthday-sugar-panda",
+                 "/the-forever-love-bear",
+                 "/the-hudson-river-mini-bear",
+                 "/the-original-mr-fuzzy"],
+    "Cart": ["/cart"],
+    "Shipping": ["/shipping"],
+    "Billing": ["/billing", "/billing-2"],
+    "Thank You": ["/thank-you-for-your-order"],
+}
+
 # Default date window (override in UI)
-DEFAULT_DATE_DAYS = 180
\ No newline at end of file
+DEFAULT_DATE_DAYS = 180
+
+# Local snapshot cache (Parquet files partitioned by month of created_at)
+SNAPSHOT_DIR = ".cache/snapshots"
+SNAPSHOT_MAX_AGE_HOURS = 12
+# "incremental" appends rows past each table's created_at/primary-key watermark;
+# "full" reloads the whole table whenever the source has changed
+SNAPSHOT_REFRESH = "incremental"
+# Set to False to always read straight from the database (filters are then pushed into SQL)
+SNAPSHOT_ENABLED = True
+
+# Compact in-memory schema: integer ids, categorical dimensions, float32 money
+COMPACT_SCHEMA = True
+
+# Database connection pool (per process, shared by every session)
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 5
+DB_POOL_PRE_PING = True
+DB_POOL_RECYCLE_SECONDS = 1800
+# Most queries allowed in flight against the database at once, across all users
+DB_MAX_CONCURRENT_QUERIES = 8
+# Threads a single load_tables() call uses to fetch its tables
+LOAD_MAX_WORKERS = 4
+# Distinct (table, filters, columns) loads kept in memory, shared across sessions
+TABLE_CACHE_MAX_ENTRIES = 64
+
+# Aggregation engine: "pandas" or "duckdb" (embedded, in-process; falls back to
+# pandas when the duckdb package is not installed)
+COMPUTE_ENGINE = "pandas"
+DUCKDB_THREADS = 4
+DUCKDB_MEMORY_LIMIT = "2GB"
+# Where DuckDB spills joins and aggregations that do not fit in DUCKDB_MEMORY_LIMIT
+DUCKDB_TEMP_DIR = ".cache/duckdb"
+# Row cap on results of the admin SQL scratchpad
+SQL_SCRATCHPAD_MAX_ROWS = 5000
+
+# Tables that streaming folds (utils.stream) read chunk by chunk straight from the
+# source query instead of loading whole, e.g. {"website_pageviews"}
+STREAM_TABLES = set()
+STREAM_CHUNKSIZE = 200_000
+
+# SQLAlchemy URL used instead of the SQL Server connection in st.secrets, e.g. a
+# local dataset from `python -m utils.synthetic --scale 10`:
+#   DATABASE_URL = "sqlite:///.cache/synthetic_10x.sqlite"
+DATABASE_URL = None
+
+# Table-load records kept for the admin diagnostics panel (also written to the log)
+DIAGNOSTICS_MAX_RECORDS = 500
+
+# Serve filtered loads from one resident copy of each table through a filter
+# index (utils.index) instead of reading every filter combination separately
+INDEXED_FILTERS = True
+# Columns with more distinct values than this are filtered by mask, not bitmaps
+INDEX_MAX_BITMAP_VALUES = 256
+
+# Filtered frames memoized per user session (utils.memo), and the cap on what all
+# sessions together may hold; past it a session evicts its own oldest entries
+MEMO_MAX_ENTRIES = 24
+MEMO_MAX_BYTES = 1024 * 2**20
+
+# Calendar feature columns derived from created_at when a table is loaded
+# (utils.timeseries.calendar_features); -1 where created_at is missing
+CALENDAR_COLUMNS = ["day", "hour", "weekday", "iso_week", "month", "year"]
+
+# Page-variant experiments (utils.experiments): confidence level of the Wilson and
+# bootstrap intervals, and bootstrap resamples drawn per variant and group
+EXPERIMENT_CONFIDENCE = 0.95
+EXPERIMENT_RESAMPLES = 4000
+
+# Multi-touch attribution (utils.attribution): sessions up to this many days before an
+# order share its credit (None: every earlier session), the half-life of time-decay
+# credit, and the share position-based attribution gives each of the first and last touch
+ATTRIBUTION_LOOKBACK_DAYS = 30
+ATTRIBUTION_HALF_LIFE_DAYS = 7
+ATTRIBUTION_POSITION_ENDS = 0.4
+# Session columns whose combination is a channel state of Markov-chain attribution
+MARKOV_CHANNEL = ["utm_source", "utm_campaign"]
+
+# Complements listed per product in cross-sell analysis (utils.basket)
+CROSS_SELL_TOP_K = 3
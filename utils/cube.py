@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .db import load_table, table_version
+from .ids import id_codes
+from .mart import MART_TABLES, SESSION_COL, session_mart
+from .timeseries import bucket_totals
+
+# -----------------------
+# Daily session cube: one row per day x utm_source x utm_campaign x
+# device_type x is_repeat_session, with additive measures taken from the
+# session mart (orders and revenue are attributed to the session's day).
+# It is materialized once per data version; cube_query() answers KPI and
+# trend questions by filtering and rolling up a few thousand rows.
+# -----------------------
+
+DIMS = ["utm_source", "utm_campaign", "device_type", "is_repeat_session"]
+MEASURES = ["sessions", "bounces", "conversions", "orders", "revenue"]
+
+
+def build_cube(sessions: pd.DataFrame, mart: pd.DataFrame) -> pd.DataFrame:
+    s = sessions.dropna(subset=[SESSION_COL, "created_at"]).drop_duplicates(subset=[SESSION_COL])
+    facts = mart.take(id_codes(s[SESSION_COL]))
+    cells = pd.DataFrame({
+        "day": s["created_at"].dt.normalize().to_numpy(),
+        **{d: s[d].array for d in DIMS},
+        "sessions": np.ones(len(s), dtype=np.int64),
+        "bounces": facts["is_bounce"].to_numpy(dtype=np.int64),
+        "conversions": facts["converted"].to_numpy(dtype=np.int64),
+        "orders": facts["orders"].to_numpy(dtype=np.int64),
+        "revenue": facts["revenue"].to_numpy(dtype=np.float64),
+    })
+    return cells.groupby(["day"] + DIMS, observed=True, dropna=False, sort=True)[MEASURES].sum().reset_index()
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _cube(versions: tuple) -> pd.DataFrame:
+    sessions = load_table("website_sessions", columns=(SESSION_COL, "created_at", *DIMS))
+    return build_cube(sessions, session_mart())
+
+
+def session_cube() -> pd.DataFrame:
+    """The cube for the current data version of its source tables."""
+    return _cube(tuple(table_version(t) for t in MART_TABLES))
+
+
+def _with_rates(df: pd.DataFrame) -> pd.DataFrame:
+    sessions = df["sessions"].where(df["sessions"] > 0)
+    orders = df["orders"].where(df["orders"] > 0)
+    df["bounce_rate"] = df["bounces"] / sessions
+    df["conversion_rate"] = df["conversions"] / sessions
+    df["avg_order_value"] = df["revenue"] / orders
+    df["revenue_per_session"] = df["revenue"] / sessions
+    return df
+
+
+def cube_query(F: dict = None, by: list = (), granularity: str = None, where: dict = None,
+               dropna: bool = True) -> pd.DataFrame:
+    """
+    Measures (plus bounce_rate, conversion_rate, avg_order_value and
+    revenue_per_session) rolled up to the `by` dimensions, and to a time
+    "bucket" at `granularity` (see utils.timeseries), over the cells selected by
+    a sidebar_filters() dict F and by extra {dimension: values} selections.
+    The date window is applied at day grain; dropna=False keeps missing
+    dimension values as their own group.
+    """
+    c = session_cube()
+    mask = np.ones(len(c), dtype=bool)
+    F = F or {}
+    if F.get("start_ts") is not None:
+        mask &= (c["day"] >= pd.Timestamp(F["start_ts"]).normalize()).to_numpy()
+    if F.get("end_ts") is not None:
+        mask &= (c["day"] <= pd.Timestamp(F["end_ts"])).to_numpy()
+    selections = [(d, F[d]) for d in DIMS if F.get(d)] + list((where or {}).items())
+    for d, vals in selections:
+        mask &= c[d].isin(list(vals)).fillna(False).to_numpy(dtype=bool)
+    keys = list(by)
+    if granularity:
+        out = bucket_totals(c, "day", granularity, values=MEASURES, by=keys, mask=mask, dropna=dropna)
+        out = out.sort_values(keys + ["bucket"], kind="stable", ignore_index=True)
+        return _with_rates(out[keys + ["bucket"]].assign(**{m: out[m].astype(c[m].dtype) for m in MEASURES}))
+
+    c = c[mask]
+    if not keys:
+        return _with_rates(c[MEASURES].sum().to_frame().T.astype({m: c[m].dtype for m in MEASURES}))
+    out = c.groupby(keys, observed=True, dropna=dropna)[MEASURES].sum().reset_index()
+    return _with_rates(out)
@@ -1,18 +1,51 @@
+import contextlib
+import hashlib
+import logging
+import threading
 import urllib.parse
+import weakref
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import column, create_engine, func, literal_column, select, table
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from . import diagnostics, snapshot
+from .index import FilterIndex
+from .timeseries import calendar_features
+from .config import (
+    COMPACT_SCHEMA, SNAPSHOT_ENABLED, SNAPSHOT_REFRESH,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE_SECONDS,
+    DB_MAX_CONCURRENT_QUERIES, LOAD_MAX_WORKERS, TABLE_CACHE_MAX_ENTRIES,
+    STREAM_TABLES, STREAM_CHUNKSIZE, DATABASE_URL as CONFIG_DATABASE_URL, INDEXED_FILTERS, CALENDAR_COLUMNS,
+    PRODUCT_NAMES, PAGEVIEW_URLS, UTM_SOURCE, UTM_CAMPAIGN, UTM_CONTENT, DEVICE_TYPE, HTTP_REFERRER
+)
+from .query import apply_predicates, build_select, parquet_filters, table_predicates, window_bounds
+
+log = logging.getLogger(__name__)
+
+# Loaded frames are shared by every session in the process. With copy-on-write
+# a page can derive and modify frames freely without ever writing into them.
+pd.set_option("mode.copy_on_write", True)
 
 # -----------------------
 # CONFIG - values from st.secrets
+# A URL under [database] (or DATABASE_URL in utils/config.py) replaces the SQL
+# Server connection, e.g. a SQLite file written by utils.synthetic.
 # -----------------------
-db = st.secrets["database"]
-SERVER = db["SERVER"]
-PORT = db["PORT"]
-DATABASE = db["DATABASE"]
-USERNAME = db["USERNAME"]
-PASSWORD = db["PASSWORD"]
-SCHEMA = db["SCHEMA"]
+try:
+    db = dict(st.secrets["database"])
+except (FileNotFoundError, KeyError):
+    db = {}
+DATABASE_URL = db.get("URL") or CONFIG_DATABASE_URL
+SERVER = db.get("SERVER")
+PORT = db.get("PORT")
+DATABASE = db.get("DATABASE")
+USERNAME = db.get("USERNAME")
+PASSWORD = db.get("PASSWORD")
+SCHEMA = db.get("SCHEMA", None if DATABASE_URL else "dbo")
 
 TABLE_NAMES = {
     "products": "Products",
@@ -23,6 +56,15 @@ TABLE_NAMES = {
     "order_item_refunds": "OrderItemRefunds"
 }
 
+PRIMARY_KEYS = {
+    "products": "product_id",
+    "website_sessions": "website_session_id",
+    "website_pageviews": "website_pageview_id",
+    "orders": "order_id",
+    "order_items": "order_item_id",
+    "order_item_refunds": "order_item_refund_id"
+}
+
 PARSE_DATES = {
     "products": ["created_at"],
     "website_sessions": ["created_at"],
@@ -74,6 +116,65 @@ DTYPES_HINTS = {
     }
 }
 
+# Compact in-memory schema (COMPACT_SCHEMA = True): "id" columns become the
+# narrowest nullable integer that holds them, "category" columns are seeded
+# with the vocabularies from utils/config.py, money is stored as float32.
+COMPACT_DTYPES_HINTS = {
+    "products": {"product_id": "id", "product_name": "category"},
+    "website_pageviews": {
+        "website_pageview_id": "id",
+        "website_session_id": "id",
+        "pageview_url": "category"
+    },
+    "order_item_refunds": {
+        "order_item_refund_id": "id",
+        "order_item_id": "id",
+        "order_id": "id",
+        "refund_amount_usd": "float32"
+    },
+    "website_sessions": {
+        "website_session_id": "id",
+        "user_id": "id",
+        "is_repeat_session": "boolean",
+        "utm_source": "category",
+        "utm_campaign": "category",
+        "utm_content": "category",
+        "device_type": "category",
+        "http_referer": "category"
+    },
+    "orders": {
+        "order_id": "id",
+        "website_session_id": "id",
+        "user_id": "id",
+        "primary_product_id": "id",
+        "items_purchased": "Int16",
+        "price_usd": "float32",
+        "cogs_usd": "float32"
+    },
+    "order_items": {
+        "order_item_id": "id",
+        "order_id": "id",
+        "product_id": "id",
+        "is_primary_item": "boolean",
+        "price_usd": "float32",
+        "cogs_usd": "float32"
+    }
+}
+
+CATEGORY_VOCAB = {
+    "product_name": PRODUCT_NAMES,
+    "pageview_url": PAGEVIEW_URLS,
+    "utm_source": UTM_SOURCE,
+    "utm_campaign": UTM_CAMPAIGN,
+    "utm_content": UTM_CONTENT,
+    "device_type": DEVICE_TYPE,
+    "http_referer": HTTP_REFERRER,
+}
+
+NULL_TOKENS = ["", "NA", "NULL"]
+TRUE_TOKENS = ["1", "true", "t", "yes", "y"]
+FALSE_TOKENS = ["0", "false", "f", "no", "n"]
+
 # -----------------------
 # Build connection engine
 # -----------------------
@@ -86,8 +187,85 @@ def get_engine():
     """
 
     # --- Streamlit Cloud (pymssql, no ODBC dependency) ---
-    connection_url = f"mssql+pyodbc://{db['USERNAME']}:{db['PASSWORD']}@{db['SERVER']},{db['PORT']}/{db['DATABASE']}?driver=ODBC+Driver+17+for+SQL+Server"
-    return create_engine(connection_url)
+    connection_url = DATABASE_URL or f"mssql+pyodbc://{USERNAME}:{PASSWORD}@{SERVER},{PORT}/{DATABASE}?driver=ODBC+Driver+17+for+SQL+Server"
+    return create_engine(
+        connection_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+    )
+
+
+@st.cache_resource
+def _query_slots() -> threading.BoundedSemaphore:
+    """Process-wide cap on queries in flight, shared by every session and loader thread."""
+    return threading.BoundedSemaphore(DB_MAX_CONCURRENT_QUERIES)
+
+
+# One lock per table so concurrent loads never sync the same snapshot twice
+_sync_locks = defaultdict(threading.Lock)
+
+# Bumped by every refresh_tables(), which changes or drops the in-process table copies
+_refresh_generation = 0
+
+# Live snapshot version of each table, by (table_key, _refresh_generation); see table_version()
+_snapshot_versions = {}
+
+def _clean_strings(s: pd.Series):
+    """
+    Strip and null-out string values via their distinct values only.
+    Returns (codes, uniques): codes index into uniques, -1 marks a missing value.
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    cleaned = pd.Index(uniques.astype(str)).str.strip()
+    cleaned = cleaned.where(~cleaned.isin(NULL_TOKENS))
+    kept, remap = pd.factorize(cleaned, use_na_sentinel=True)
+    codes = np.where(codes >= 0, kept[np.maximum(codes, 0)], -1)
+    return codes, pd.Index(remap)
+
+
+def _to_string(s: pd.Series) -> pd.Series:
+    codes, uniques = _clean_strings(s)
+    values = pd.array(uniques, dtype="string").take(codes, allow_fill=True)
+    return pd.Series(values, index=s.index, name=s.name)
+
+
+def _to_category(s: pd.Series, vocab: list[str] = None) -> pd.Series:
+    """
+    Categorical seeded with vocab; values outside it are added, never dropped.
+    Categories are kept sorted so grouped output orders like the plain strings did.
+    """
+    codes, uniques = _clean_strings(s)
+    categories = pd.Index(sorted(set(vocab or []) | set(uniques)))
+    mapped = categories.get_indexer(uniques)
+    codes = np.where(codes >= 0, mapped[np.maximum(codes, 0)], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=s.index, name=s.name)
+
+
+def _to_boolean(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+        num = pd.to_numeric(s, errors="coerce")
+        out = pd.Series(pd.NA, index=s.index, dtype="boolean")
+        out[num == 1] = True
+        out[num == 0] = False
+        return out
+    codes, uniques = _clean_strings(s)
+    lowered = uniques.str.lower()
+    lookup = np.where(lowered.isin(TRUE_TOKENS), 1, np.where(lowered.isin(FALSE_TOKENS), 0, -1))
+    flags = np.where(codes >= 0, lookup[np.maximum(codes, 0)], -1)
+    return pd.Series(pd.array(flags == 1, dtype="boolean"), index=s.index, name=s.name).mask(flags < 0)
+
+
+def _to_id(s: pd.Series) -> pd.Series:
+    """Narrowest nullable integer that holds the ids; non-numeric ids stay strings."""
+    num = pd.to_numeric(s, errors="coerce")
+    if num.isna().sum() > s.isna().sum():
+        return _to_string(s)
+    lo, hi = num.min(), num.max()
+    fits32 = pd.isna(lo) or (np.iinfo(np.int32).min <= lo and hi <= np.iinfo(np.int32).max)
+    return num.astype("Int32" if fits32 else "Int64")
+
 
 def _apply_hints(df: pd.DataFrame, table_key: str) -> pd.DataFrame:
     """Apply dtype and parsing hints to a DataFrame."""
@@ -96,57 +274,386 @@ def _apply_hints(df: pd.DataFrame, table_key: str) -> pd.DataFrame:
         if c in df.columns:
             df[c] = pd.to_datetime(df[c], errors="coerce")
 
-    hints = DTYPES_HINTS.get(table_key, {})
+    hints = (COMPACT_DTYPES_HINTS if COMPACT_SCHEMA else DTYPES_HINTS).get(table_key, {})
     for col, hint in hints.items():
         if col not in df.columns:
             continue
         try:
             if hint in ("string", "str"):
-                df[col] = df[col].astype("string")
-            elif hint == "Int64":
-                df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+                df[col] = _to_string(df[col])
+            elif hint == "category":
+                df[col] = _to_category(df[col], CATEGORY_VOCAB.get(col))
+            elif hint == "id":
+                df[col] = _to_id(df[col])
+            elif hint in ("Int64", "Int32", "Int16"):
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype(hint)
             elif hint in ("float", "numeric"):
                 df[col] = pd.to_numeric(df[col], errors="coerce")
+            elif hint == "float32":
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
             elif hint in ("boolean", "bool"):
-                df[col] = df[col].map(
-                    lambda v: True if str(v).strip().lower() in ("1", "true", "t", "yes", "y")
-                    else (False if str(v).strip().lower() in ("0", "false", "f", "no", "n") else pd.NA)
-                ).astype("boolean")
+                df[col] = _to_boolean(df[col])
         except Exception:
             pass
 
-    for c in df.select_dtypes(include=["object", "string"]).columns:
-        df[c] = (
-            df[c].astype("string")
-                 .str.strip()
-                 .replace({"": pd.NA, "NA": pd.NA, "NULL": pd.NA})
-        )
+    # Remaining untyped text columns get the same cleanup as hinted strings
+    for c in df.select_dtypes(include=["object"]).columns:
+        df[c] = _to_string(df[c])
     return df
 
 
-@st.cache_data(show_spinner=False)
-def load_table(table_key: str, where_clause: str = None, chunksize: int = None) -> pd.DataFrame:
-    """Load a single table into a DataFrame."""
+def _source_stats(table_key: str) -> tuple[int, str]:
+    """Row count and newest created_at of a source table."""
     engine = get_engine()
-    table = TABLE_NAMES[table_key]
-    q = f"SELECT * FROM {SCHEMA}.{table}"
-    if where_clause:
-        q += f" WHERE {where_clause}"
-
-    if chunksize:
-        parts = []
-        for chunk in pd.read_sql_query(q, engine, chunksize=chunksize):
-            parts.append(_apply_hints(chunk, table_key))
-        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
-    else:
-        df = pd.read_sql_query(q, engine)
+    tbl = table(TABLE_NAMES[table_key], schema=SCHEMA)
+    q = select(func.count().label("n"), func.max(literal_column("created_at")).label("max_ts")).select_from(tbl)
+    with diagnostics.stage("source_check"), _query_slots():
+        row = pd.read_sql_query(q, engine).iloc[0]
+    return int(row["n"]), str(row["max_ts"])
+
+
+def _version_stamp(table_key: str, n: int, max_ts: str) -> str:
+    """Data-version stamp of a source table, derived from its row count and newest created_at."""
+    stamp = f"{table_key}|{n}|{max_ts}|{'compact' if COMPACT_SCHEMA else 'wide'}"
+    return hashlib.sha1(stamp.encode()).hexdigest()[:12]
+
+
+def _read_sql(q, chunksize: int = None, stream: bool = False):
+    """
+    Run a query and yield its result as DataFrames: one, or one per chunksize rows.
+    Statement execution and row transfer are timed separately. A query holds one
+    of the _query_slots() while it runs; a streamed one (stream=True) only while
+    its statement executes or a chunk is fetched, never while the caller works
+    on a chunk, so the caller may run other queries in between.
+    """
+    whole = contextlib.nullcontext() if stream else _query_slots()
+    step = _query_slots if stream else contextlib.nullcontext
+    with whole, get_engine().connect() as conn:
+        if stream:
+            conn = conn.execution_options(stream_results=True)
+        with step(), diagnostics.stage("sql"):
+            result = conn.execute(q)
+        columns = list(result.keys())
+        while True:
+            with step(), diagnostics.stage("fetch"):
+                rows = result.fetchmany(chunksize) if chunksize else result.fetchall()
+                df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+            if not chunksize:
+                yield df
+                return
+            if not rows:
+                return
+            yield df
+
+
+def _hinted(df: pd.DataFrame, table_key: str) -> pd.DataFrame:
+    with diagnostics.stage("hints"):
         return _apply_hints(df, table_key)
 
 
-@st.cache_data(show_spinner=False)
-def load_tables(keys: list[str], where_clause: str = None):
-    """Load multiple tables into a dict of DataFrames."""
-    dfs = {}
-    for k in keys:
-        dfs[k] = load_table(k, where_clause=where_clause)
-    return dfs
\ No newline at end of file
+def _query_table(table_key: str, predicates: tuple = (), columns: tuple = None,
+                 chunksize: int = None) -> pd.DataFrame:
+    """Run a parameterized SELECT against the source database and apply dtype hints."""
+    q = build_select(TABLE_NAMES[table_key], SCHEMA, predicates, columns)
+    parts = [_hinted(chunk, table_key) for chunk in _read_sql(q, chunksize)]
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+def _fetch_increment(table_key: str, watermark: dict, chunksize: int = None) -> pd.DataFrame:
+    """Fetch the rows created at or after the watermark that the snapshot does not hold yet."""
+    wm_ts = pd.Timestamp(watermark["created_at"])
+    df = _query_table(table_key, (("created_at", ">=", wm_ts),), chunksize=chunksize)
+    if df.empty:
+        return df
+    pk = PRIMARY_KEYS[table_key]
+    seen = set(watermark.get("boundary_keys", []))
+    already = (df["created_at"] <= wm_ts) & df[pk].astype("string").isin(seen)
+    return df[~already].reset_index(drop=True)
+
+
+def _sync_snapshot(table_key: str, chunksize: int = None, force: bool = False):
+    """
+    Bring the local snapshot of a table up to date with the source.
+
+    Returns (manifest, df, new_rows). df is the full table when it had to be
+    fetched or rebuilt in memory anyway, and None when the snapshot on disk is
+    current. With SNAPSHOT_REFRESH = "incremental" only rows past the stored
+    watermark are fetched and appended (returned as new_rows, else None); if the
+    snapshot's row count plus the new rows disagrees with the source (rows
+    updated or deleted upstream) the table is reloaded in full.
+    """
+    with _sync_locks[table_key]:
+        return _sync_snapshot_locked(table_key, chunksize, force)
+
+
+def _sync_snapshot_locked(table_key: str, chunksize: int = None, force: bool = False):
+    manifest = snapshot.read_manifest(table_key)
+    if not force and snapshot.is_fresh(manifest):
+        return manifest, None, None
+
+    n, max_ts = _source_stats(table_key)
+    version = _version_stamp(table_key, n, max_ts)
+    if manifest and manifest.get("version") == version:
+        snapshot.touch(table_key)
+        return manifest, None, None
+
+    pk = PRIMARY_KEYS.get(table_key)
+    if manifest and manifest.get("watermark") and SNAPSHOT_REFRESH == "incremental":
+        new_rows = _fetch_increment(table_key, manifest["watermark"], chunksize)
+        if manifest.get("rows", 0) + len(new_rows) == n:
+            log.info("Appending %d new rows to %s", len(new_rows), table_key)
+            try:
+                with diagnostics.stage("snapshot_write"):
+                    manifest = snapshot.append_snapshot(table_key, manifest, new_rows, version, pk)
+                _forget_version(table_key)
+                return manifest, None, new_rows
+            except Exception:
+                log.warning("Could not append to snapshot for %s", table_key, exc_info=True)
+            # The snapshot on disk stays behind; serve the extended table from memory
+            with diagnostics.stage("snapshot_read"):
+                current = snapshot.read_snapshot(table_key, manifest)
+            return manifest, snapshot.concat_frames([current, new_rows]), None
+        log.info("Row count of %s drifted from its snapshot; reloading in full", table_key)
+
+    df = _query_table(table_key, chunksize=chunksize)
+    try:
+        with diagnostics.stage("snapshot_write"):
+            manifest = snapshot.write_snapshot(table_key, df, version, pk_col=pk)
+        _forget_version(table_key)
+    except Exception:
+        log.warning("Could not write snapshot for %s", table_key, exc_info=True)
+    return manifest, df, None
+
+
+def _load_via_snapshot(table_key: str, predicates: tuple = (), columns: tuple = None,
+                       chunksize: int = None) -> pd.DataFrame:
+    """
+    Serve a load from the local Parquet snapshot.
+    The database is only queried when the snapshot is missing or stale.
+    """
+    manifest, df, _ = _sync_snapshot(table_key, chunksize)
+    if df is None:
+        start_ts, end_ts = window_bounds(predicates)
+        with diagnostics.stage("snapshot_read"):
+            return snapshot.read_snapshot(table_key, manifest, start_ts, end_ts,
+                                          columns=columns, filters=parquet_filters(predicates))
+    df = apply_predicates(df, predicates)
+    return df[list(columns)] if columns else df
+
+
+def refresh_tables(keys: list[str] = None) -> dict:
+    """
+    Check the given tables (default: all) against the source right away, pulling
+    new rows into their snapshots. Resident copies (see _table_index) take the
+    new rows in place; if one cannot, the in-process table caches are dropped.
+    Returns the row count of each refreshed table.
+    """
+    global _refresh_generation
+    rows = {}
+    stale = not SNAPSHOT_ENABLED  # resident copies then come from the database, not the snapshot
+    for k in keys or list(TABLE_NAMES):
+        with diagnostics.track_load(k, kind="refresh", cache_hit=False) as rec:
+            before = (snapshot.read_manifest(k) or {}).get("version")
+            manifest, df, new_rows = _sync_snapshot(k, force=True)
+            rows[k] = rec["rows"] = len(df) if df is not None else (manifest or {}).get("rows", 0)
+            if not stale:
+                stale = not _update_residents(k, before, manifest, df, new_rows)
+    _shared_table.clear()
+    if stale:
+        _table_index.clear()
+    _refresh_generation += 1
+    _snapshot_versions.clear()
+    return rows
+
+
+def _forget_version(table_key: str):
+    """Drop the remembered snapshot version of a table (a new one was published)."""
+    for key in [k for k in list(_snapshot_versions) if k[0] == table_key]:
+        _snapshot_versions.pop(key, None)
+
+
+def table_version(table_key: str) -> str:
+    """
+    Data version of a table as loads currently see it: the live snapshot version
+    plus a counter bumped by refresh_tables(), which also updates or drops the loaded copies.
+    The snapshot version is read from its manifest once and then kept in memory
+    until a sync publishes a new one or refresh_tables() runs.
+    """
+    key = (table_key, _refresh_generation)
+    version = _snapshot_versions.get(key)
+    if version is None:
+        manifest = snapshot.read_manifest(table_key) if SNAPSHOT_ENABLED else None
+        version = _snapshot_versions[key] = (manifest or {}).get("version", "live")
+    return f"{version}.{_refresh_generation}"
+
+
+def _with_calendar(table_key: str, df: pd.DataFrame, calendar: list) -> pd.DataFrame:
+    """df plus the given CALENDAR_COLUMNS derived from its created_at."""
+    if not calendar or "created_at" not in df.columns:
+        return df
+    with diagnostics.stage("calendar"):
+        features = calendar_features(df["created_at"])
+        return df.assign(**{c: features[c] for c in calendar})
+
+
+@st.cache_resource(show_spinner=False, max_entries=TABLE_CACHE_MAX_ENTRIES)
+def _shared_table(table_key: str, predicates: tuple = (), columns: tuple = None,
+                  chunksize: int = None) -> pd.DataFrame:
+    """
+    One process-wide frame per distinct load, shared by every session without copying.
+    Tables with a created_at also carry the CALENDAR_COLUMNS derived from it.
+    """
+    diagnostics.mark_computed()
+    calendar = [c for c in (columns or CALENDAR_COLUMNS) if c in CALENDAR_COLUMNS] if table_key in PARSE_DATES else []
+    read = columns
+    if columns and calendar:
+        read = tuple(dict.fromkeys([c for c in columns if c not in CALENDAR_COLUMNS] + ["created_at"]))
+    if SNAPSHOT_ENABLED:
+        df = _load_via_snapshot(table_key, predicates, read, chunksize)
+    else:
+        df = _query_table(table_key, predicates, read, chunksize)
+    df = _with_calendar(table_key, df, calendar)
+    return df[list(columns)] if columns and calendar else df
+
+
+class _Resident:
+    """Filter index over the resident copy of a table, and the snapshot version it was built from."""
+
+    def __init__(self, index: FilterIndex, version: str):
+        self.index = index
+        self.version = version
+
+
+# Live resident copies by (table_key, chunksize); entries go when the cache drops them
+_residents = weakref.WeakValueDictionary()
+
+
+@st.cache_resource(show_spinner=False, max_entries=TABLE_CACHE_MAX_ENTRIES)
+def _table_index(table_key: str, chunksize: int = None) -> _Resident:
+    """Filter index over the resident (unfiltered, all-column) copy of a table."""
+    diagnostics.mark_computed()
+    df = _shared_table(table_key, chunksize=chunksize)
+    resident = _Resident(FilterIndex(df), (snapshot.read_manifest(table_key) or {}).get("version"))
+    _residents[(table_key, chunksize)] = resident
+    return resident
+
+
+def _update_residents(table_key: str, before: str, manifest: dict, df: pd.DataFrame, new_rows: pd.DataFrame) -> bool:
+    """
+    Bring the resident copies of a table to what a refresh left in its snapshot:
+    appended rows extend the frame and its index, a full reload replaces them.
+    False when a copy was built from another snapshot version than the one refreshed.
+    """
+    calendar = CALENDAR_COLUMNS if table_key in PARSE_DATES else []
+    version = (manifest or {}).get("version")
+    for (key, _), resident in list(_residents.items()):
+        if key != table_key or resident.version == version:
+            continue
+        if df is not None:
+            resident.index = FilterIndex(_with_calendar(table_key, df, calendar))
+        elif new_rows is not None and resident.version == before:
+            added = _with_calendar(table_key, new_rows, calendar)
+            resident.index = resident.index.extended(snapshot.concat_frames([resident.index.df, added]))
+        else:
+            return False
+        resident.version = version
+    return True
+
+
+def load_table(table_key: str, predicates: tuple = (), columns: tuple = None,
+               chunksize: int = None) -> pd.DataFrame:
+    """
+    Load a single table into a DataFrame.
+    With INDEXED_FILTERS, predicates (see utils.query) and columns are applied
+    in memory through the filter index of the table's resident copy. Otherwise
+    they are pushed down to the snapshot reader, or into the SQL WHERE clause and
+    SELECT list when snapshots are off.
+    The result is a copy-on-write view of shared data: changing it never
+    touches what other sessions see. It records the predicates it satisfies in
+    df.attrs["predicates"], so utils.agg.filter_* can skip work already done.
+    """
+    with diagnostics.track_load(table_key, predicates=len(predicates), columns=len(columns or ())):
+        if INDEXED_FILTERS:
+            index = _table_index(table_key, chunksize).index
+            with diagnostics.stage("filter"):
+                df = index.frame(predicates, columns)
+        else:
+            df = _shared_table(table_key, predicates, columns, chunksize).copy(deep=False)
+        diagnostics.add_result(df)
+    if predicates:
+        df.attrs["predicates"] = predicates
+    return df
+
+
+def load_tables(keys: list[str], F: dict = None, columns: dict = None,
+                max_workers: int = LOAD_MAX_WORKERS):
+    """
+    Load multiple tables into a dict of DataFrames.
+    F is a sidebar_filters() dict; each table receives the filters that
+    utils.agg.filter_* would apply to it. columns maps table key -> needed columns.
+    Tables are fetched concurrently on up to max_workers threads; the number of
+    queries running against the database is further capped process-wide.
+    """
+    columns = columns or {}
+    product_ids = None
+    if F and F.get("product_names") and "order_items" in keys:
+        products = load_table("products", columns=("product_id", "product_name"))
+        product_ids = products.loc[products["product_name"].isin(F["product_names"]), "product_id"].tolist()
+
+    jobs = {
+        k: dict(
+            predicates=table_predicates(k, F, product_ids),
+            columns=tuple(columns[k]) if columns.get(k) else None,
+        )
+        for k in keys
+    }
+    if max_workers <= 1 or len(jobs) <= 1:
+        return {k: load_table(k, **kw) for k, kw in jobs.items()}
+
+    # Worker threads share the page's script-run context so st.cache_data behaves as on the main thread
+    ctx = get_script_run_ctx()
+
+    def _load(k):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return load_table(k, **jobs[k])
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs)), thread_name_prefix="load_tables") as pool:
+        futures = {k: pool.submit(_load, k) for k in jobs}
+        return {k: futures[k].result() for k in jobs}
+
+
+def iter_table(table_key: str, predicates: tuple = (), columns: tuple = None,
+               order_by: tuple = None, chunksize: int = STREAM_CHUNKSIZE):
+    """
+    Yield a table as DataFrame chunks (dtype hints applied), ordered by order_by.
+    Tables in STREAM_TABLES are streamed from a server-side cursor and are never
+    held in memory as a whole; any other table is served from load_table as one chunk.
+    """
+    if table_key not in STREAM_TABLES:
+        df = load_table(table_key, predicates, columns)
+        yield df.sort_values(list(order_by), kind="stable") if order_by else df
+        return
+
+    q = build_select(TABLE_NAMES[table_key], SCHEMA, predicates, columns)
+    if order_by:
+        # Primary key last so rows sharing a timestamp keep a stable order
+        keys = list(order_by) + [c for c in [PRIMARY_KEYS.get(table_key)] if c and c not in order_by]
+        q = q.order_by(*[column(c) for c in keys])
+    # The record is only active while a chunk is fetched, not while the caller folds it
+    rec = diagnostics.new_record(table_key, kind="stream", cache_hit=False)
+    chunks = _read_sql(q, chunksize, stream=True)
+    try:
+        while True:
+            with diagnostics.active(rec):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                chunk = _hinted(chunk, table_key)
+                diagnostics.add_result(chunk)
+            yield chunk
+    finally:
+        chunks.close()
+        diagnostics.finish(rec)
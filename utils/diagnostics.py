@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+from .config import DIAGNOSTICS_MAX_RECORDS
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# Load-path instrumentation. A record is opened per load_table() call (and per
+# streamed table) on the calling thread; the load path adds stage timings to
+# it (source check, sql, fetch, hints, snapshot read/write, calendar columns,
+# index filter). On a cache hit the total is the cache lookup itself. Finished
+# records go to the log and to a process-wide ring buffer for the admin panel.
+# -----------------------
+
+STAGES = ["source_check", "sql", "fetch", "hints", "snapshot_read", "snapshot_write", "calendar", "filter"]
+
+_local = threading.local()
+_records = deque(maxlen=DIAGNOSTICS_MAX_RECORDS)
+_lock = threading.Lock()
+
+# Filtered-frame memo (utils.memo), summed over every session in the process
+_memo = {"entries": 0, "bytes": 0, "hits": 0, "misses": 0}
+
+
+def _current():
+    return getattr(_local, "record", None)
+
+
+def new_record(table_key: str, kind: str = "load", **info) -> dict:
+    return {
+        "at": pd.Timestamp.now(),
+        "table": table_key,
+        "kind": kind,
+        "cache_hit": True,
+        "rows": None,
+        "bytes": None,
+        "stages": dict.fromkeys(STAGES, 0.0),
+        "total_s": 0.0,
+        **info,
+    }
+
+
+@contextmanager
+def active(rec: dict):
+    """Make rec the current record on this thread for the duration of the block."""
+    previous = _current()
+    _local.record = rec
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        rec["total_s"] += time.perf_counter() - t0
+        _local.record = previous
+
+
+def finish(rec: dict):
+    """Log a finished record and keep it for the diagnostics panel."""
+    with _lock:
+        _records.append(rec)
+    stages = " ".join(f"{k}_ms={v * 1000:.1f}" for k, v in rec["stages"].items() if v)
+    log.info(
+        "%s table=%s cache=%s rows=%s bytes=%s total_ms=%.1f %s",
+        rec["kind"], rec["table"], "hit" if rec["cache_hit"] else "miss",
+        rec["rows"], rec["bytes"], rec["total_s"] * 1000, stages,
+        extra={"load_metrics": rec},
+    )
+
+
+@contextmanager
+def track_load(table_key: str, kind: str = "load", **info):
+    """Open, activate and finally emit a record for one table load; yields the record."""
+    rec = new_record(table_key, kind, **info)
+    try:
+        with active(rec):
+            yield rec
+    finally:
+        finish(rec)
+
+
+@contextmanager
+def stage(name: str):
+    """Add the time spent in the block to `name` on the current record (no-op outside a load)."""
+    rec = _current()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if rec is not None:
+            rec["stages"][name] = rec["stages"].get(name, 0.0) + time.perf_counter() - t0
+
+
+def mark_computed():
+    """Called from inside a cached loader: the current load missed the cache."""
+    rec = _current()
+    if rec is not None:
+        rec["cache_hit"] = False
+
+
+def add_result(df: pd.DataFrame):
+    """
+    Add a loaded (or streamed) frame's rows to the current record, and its
+    memory footprint when it was actually built rather than served from cache.
+    """
+    rec = _current()
+    if rec is not None:
+        rec["rows"] = (rec["rows"] or 0) + len(df)
+        if not rec["cache_hit"]:
+            rec["bytes"] = (rec["bytes"] or 0) + int(df.memory_usage(deep=True).sum())
+
+
+def memo_lookup(hit: bool):
+    with _lock:
+        _memo["hits" if hit else "misses"] += 1
+
+
+def memo_resize(entries: int, nbytes: int):
+    """Account for filtered frames entering (positive) or leaving (negative) a session memo."""
+    with _lock:
+        _memo["entries"] += entries
+        _memo["bytes"] += nbytes
+
+
+def memo_stats() -> dict:
+    with _lock:
+        return dict(_memo)
+
+
+def recent_loads() -> pd.DataFrame:
+    """The buffered load records, newest first, one column per stage (milliseconds)."""
+    with _lock:
+        records = list(_records)
+    if not records:
+        return pd.DataFrame()
+    df = pd.DataFrame([
+        {
+            "at": r["at"], "table": r["table"], "kind": r["kind"],
+            "cache": "hit" if r["cache_hit"] else "miss",
+            "rows": r["rows"], "MB": None if r["bytes"] is None else r["bytes"] / 2**20,
+            "total_ms": r["total_s"] * 1000,
+            **{f"{k}_ms": v * 1000 for k, v in r["stages"].items()},
+        }
+        for r in records
+    ])
+    return df.iloc[::-1].reset_index(drop=True)
+
+
+def diagnostics_panel():
+    """Admin-only sidebar panel summarising recent table loads."""
+    loads = recent_loads()
+    memo = memo_stats()
+    with st.sidebar.expander("🩺 Diagnostics"):
+        lookups = memo["hits"] + memo["misses"]
+        st.caption(
+            f"Filter memo: {memo['entries']} frames, {memo['bytes'] / 2**20:.1f} MB across sessions"
+            + (f", {memo['hits'] / lookups:.0%} hits" if lookups else "")
+        )
+        if loads.empty:
+            st.caption("No table loads recorded yet.")
+            return
+        hit_rate = (loads["cache"] == "hit").mean()
+        c1, c2 = st.columns(2)
+        c1.metric("Loads", len(loads))
+        c2.metric("Cache hits", f"{hit_rate:.0%}")
+
+        misses = loads[loads["cache"] == "miss"]
+        if not misses.empty:
+            st.caption("Cold loads by table (mean ms)")
+            cols = ["total_ms"] + [f"{s}_ms" for s in STAGES]
+            by_table = misses.groupby("table")[cols].mean().round(1)
+            by_table.insert(0, "loads", misses.groupby("table").size())
+            by_table["rows"] = misses.groupby("table")["rows"].max()
+            by_table["MB"] = misses.groupby("table")["MB"].max().round(2)
+            st.dataframe(by_table, use_container_width=True)
+
+        st.caption("Recent loads")
+        st.dataframe(
+            loads.head(50)[["at", "table", "kind", "cache", "rows", "MB", "total_ms"]].round(2),
+            use_container_width=True, hide_index=True,
+        )
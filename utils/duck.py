@@ -0,0 +1,157 @@
+import os
+
+import pandas as pd
+import streamlit as st
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+from .config import COMPUTE_ENGINE, DUCKDB_MEMORY_LIMIT, DUCKDB_TEMP_DIR, DUCKDB_THREADS
+
+# -----------------------
+# Embedded DuckDB engine. Frames are registered as views on a per-call cursor
+# of one in-process database, so concurrent sessions never see each other's
+# tables. Large joins spill to DUCKDB_TEMP_DIR instead of running out of memory.
+# -----------------------
+
+
+def available() -> bool:
+    return duckdb is not None
+
+
+def enabled() -> bool:
+    """True when COMPUTE_ENGINE selects duckdb and the package is installed."""
+    return COMPUTE_ENGINE == "duckdb" and duckdb is not None
+
+
+@st.cache_resource
+def _database():
+    os.makedirs(DUCKDB_TEMP_DIR, exist_ok=True)
+    return duckdb.connect(config={
+        "threads": DUCKDB_THREADS,
+        "memory_limit": DUCKDB_MEMORY_LIMIT,
+        "temp_directory": DUCKDB_TEMP_DIR,
+    })
+
+
+def connect(frames: dict):
+    """A fresh cursor with each frame in `frames` registered under its key."""
+    con = _database().cursor()
+    for name, df in frames.items():
+        con.register(name, df)
+    return con
+
+
+def query(sql: str, frames: dict, params: list = None) -> pd.DataFrame:
+    """Run one SQL statement over the given frames and return the result as a DataFrame."""
+    con = connect(frames)
+    try:
+        return con.execute(sql, params or []).df()
+    finally:
+        con.close()
+
+
+def _restore_dtype(out: pd.DataFrame, col: str, like: pd.Series) -> pd.DataFrame:
+    """Give a key column coming back from SQL the dtype it had going in (e.g. categorical)."""
+    if col in out.columns:
+        out[col] = out[col].astype(like.dtype)
+    return out
+
+
+# -----------------------
+# Aggregations (pandas equivalents live in utils.agg)
+# -----------------------
+
+def channel_summary(sessions: pd.DataFrame, orders: pd.DataFrame, by: str = "utm_source") -> pd.DataFrame:
+    sql = f"""
+        WITH s AS (
+            SELECT {by} AS k, count(DISTINCT website_session_id) AS sessions
+            FROM sessions WHERE {by} IS NOT NULL GROUP BY 1
+        ), o AS (
+            SELECT s.{by} AS k, count(DISTINCT o.order_id) AS orders,
+                   sum(o.price_usd) AS revenue, avg(o.price_usd) AS avg_order_value
+            FROM orders o JOIN sessions s USING (website_session_id)
+            WHERE s.{by} IS NOT NULL GROUP BY 1
+        )
+        SELECT coalesce(s.k, o.k) AS {by},
+               coalesce(s.sessions, 0) AS sessions,
+               coalesce(o.orders, 0) AS orders,
+               coalesce(o.revenue, 0) AS revenue,
+               coalesce(o.avg_order_value, 0) AS avg_order_value
+        FROM s FULL OUTER JOIN o ON s.k = o.k
+        ORDER BY 1
+    """
+    out = query(sql, {"sessions": sessions, "orders": orders})
+    out["conversion_rate"] = out["orders"] / out["sessions"]
+    return _restore_dtype(out, by, sessions[by])
+
+
+def monthly_trends(sessions: pd.DataFrame, orders: pd.DataFrame, by: str = "utm_source"):
+    frames = {"sessions": sessions, "orders": orders}
+    sess_trend = query(f"""
+        SELECT {by}, date_trunc('month', created_at) AS month, count(*) AS sessions
+        FROM sessions WHERE {by} IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY 1, 2 ORDER BY 1, 2
+    """, frames)
+    ord_trend = query(f"""
+        SELECT s.{by}, date_trunc('month', o.created_at) AS month,
+               count(*) AS orders, sum(o.price_usd) AS revenue
+        FROM orders o JOIN sessions s USING (website_session_id)
+        WHERE s.{by} IS NOT NULL AND o.created_at IS NOT NULL
+        GROUP BY 1, 2 ORDER BY 1, 2
+    """, frames)
+    for df in (sess_trend, ord_trend):
+        df["month"] = df["month"].astype("datetime64[ns]")
+        _restore_dtype(df, by, sessions[by])
+    return sess_trend, ord_trend[[by, "month", "orders"]], ord_trend[[by, "month", "revenue"]]
+
+
+def funnel_reach(pageviews: pd.DataFrame, steps: dict, cumulative: bool = False) -> pd.DataFrame:
+    names = list(steps)
+    flags = ",\n".join(
+        f"bool_or(list_contains(${i + 1}, CAST(pageview_url AS VARCHAR))) AS s{i}"
+        for i in range(len(names))
+    )
+    counts = ", ".join(
+        f"count(*) FILTER (WHERE {' AND '.join(f's{j}' for j in (range(i + 1) if cumulative else [i]))})"
+        for i in range(len(names))
+    )
+    sql = f"""
+        WITH hits AS (
+            SELECT website_session_id, {flags}
+            FROM pageviews WHERE website_session_id IS NOT NULL GROUP BY 1
+        )
+        SELECT {counts} FROM hits
+    """
+    row = query(sql, {"pageviews": pageviews}, [list(steps[n]) for n in names]).iloc[0]
+    return pd.DataFrame({"step": names, "sessions": [int(v) for v in row]})
+
+
+# -----------------------
+# Read-only scratchpad
+# -----------------------
+
+def readonly_query(sql: str, frames: dict, max_rows: int) -> pd.DataFrame:
+    """
+    Run a single SELECT/WITH statement over the given frames.
+    The statement gets its own throwaway database with file and network access
+    switched off, so it can only read the registered tables.
+    """
+    statements = duckdb.extract_statements(sql)
+    if len(statements) != 1:
+        raise ValueError("Enter exactly one statement.")
+    if statements[0].type != duckdb.StatementType.SELECT:
+        raise ValueError("Only SELECT / WITH queries are allowed.")
+    stmt = statements[0].query.strip().rstrip(";")
+
+    con = duckdb.connect(config={"threads": DUCKDB_THREADS, "memory_limit": DUCKDB_MEMORY_LIMIT})
+    try:
+        for name, df in frames.items():
+            con.register(name, df)
+        con.execute("SET enable_external_access = false")
+        con.execute("SET lock_configuration = true")
+        return con.execute(f"SELECT * FROM ({stmt}) LIMIT {int(max_rows)}").df()
+    finally:
+        con.close()
@@ -0,0 +1,84 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from .config import EXPERIMENT_CONFIDENCE, EXPERIMENT_RESAMPLES
+from .funnel import session_steps
+
+# -----------------------
+# Page-variant experiments. Each session is assigned to the variant URL it
+# saw first and converts when it reaches a goal URL after that first
+# exposure (funnel engine, utils.funnel). Conversion is summarized per
+# variant, optionally per day or per channel. Each rate gets a Wilson interval,
+# plus a bootstrap over all variants and groups at once. Resampling the
+# sessions of a group is the same as drawing Binomial(n, rate) conversions,
+# so every resample of every group and variant comes from one rng.binomial call.
+# -----------------------
+
+GOAL = "goal"
+
+
+def assign_variants(pageviews: pd.DataFrame, sessions: pd.DataFrame, variants: list, goal) -> pd.DataFrame:
+    """
+    One row per session in `sessions` that saw a variant: the session's columns
+    plus "variant" (first seen) and "converted" (reached a goal URL afterwards).
+    """
+    goal = [goal] if isinstance(goal, str) else list(goal)
+    steps = session_steps(pageviews, {**{v: [v] for v in variants}, GOAL: goal}).within(sessions)
+    variant = steps.first_of(variants)
+    exposed = variant.codes >= 0
+    seen = steps.first[:len(variants)].min(axis=0)
+    converted = steps.has(GOAL) & (steps.first[len(variants)] >= seen)
+    out = sessions.take(steps.rows[exposed])
+    return out.assign(variant=variant[exposed], converted=converted[exposed])
+
+
+def wilson_interval(conversions, n, level: float = EXPERIMENT_CONFIDENCE):
+    """Wilson score interval (low, high) of conversions / n; NaN where n is 0."""
+    conversions = np.asarray(conversions, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = conversions / n
+        centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z / (1 + z * z / n) * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return centre - half, centre + half
+
+
+def summarize_experiment(assigned: pd.DataFrame, by: str = None, control: str = None,
+                         level: float = EXPERIMENT_CONFIDENCE, resamples: int = EXPERIMENT_RESAMPLES,
+                         seed: int = 0) -> pd.DataFrame:
+    """
+    Sessions, conversions and conversion_rate per variant (and per `by`
+    group), with the Wilson interval (ci_low, ci_high). With resamples > 0 it
+    also adds bootstrap percentiles (boot_low, boot_high), the lift over the
+    control variant (default: the first) and the bootstrap probability of
+    beating the control.
+    """
+    keys = ([by] if by else []) + ["variant"]
+    out = assigned.groupby(keys, observed=True).agg(
+        sessions=("converted", "size"), conversions=("converted", "sum")).reset_index()
+    out["conversion_rate"] = out["conversions"] / out["sessions"]
+    out["ci_low"], out["ci_high"] = wilson_interval(out["conversions"], out["sessions"], level)
+    if not resamples or out.empty:
+        return out
+
+    n = out["sessions"].to_numpy(dtype=np.int64)
+    rate = out["conversion_rate"].to_numpy(dtype=np.float64)
+    draws = np.random.default_rng(seed).binomial(n[:, None], rate[:, None], size=(len(out), resamples)) / n[:, None]
+    tail = (1 - level) / 2 * 100
+    out["boot_low"], out["boot_high"] = np.percentile(draws, [tail, 100 - tail], axis=1)
+
+    # Each row against the control variant of its own group
+    control = control if control is not None else assigned["variant"].cat.categories[0]
+    is_ctrl = (out["variant"] == control).to_numpy()
+    group = pd.factorize(out[by])[0] if by else np.zeros(len(out), dtype=np.intp)
+    ctrl_row = np.full(group.max() + 1, -1)
+    ctrl_row[group[is_ctrl]] = np.flatnonzero(is_ctrl)
+    ctrl = ctrl_row[group]
+    has_ctrl = ctrl >= 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["lift"] = np.where(has_ctrl, rate / rate[ctrl] - 1, np.nan)
+    out["p_beats_control"] = np.where(has_ctrl & ~is_ctrl, (draws > draws[ctrl]).mean(axis=1), np.nan)
+    return out
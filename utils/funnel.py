@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+from .colcache import derived
+from .db import table_version
+from .ids import id_codes, id_flags, join_rows
+from .mart import SESSION_COL
+
+# -----------------------
+# Funnel engine. Every session that visited at least one step (a named list of
+# URLs) gets a bitmask of the steps it visited and the order of its first visit
+# to each step, built in one pass over pageviews. Funnels are bit tests on the
+# masks: a session reaches step j of a cumulative funnel when all bits up to j
+# are set, and with strict=True only if it also first visited the steps in
+# funnel order. Any subset of the steps, in any order, can be asked for, and
+# counts split by a session column or by a step variant come from one bincount.
+# The steps of a pageviews frame are cached per underlying buffer
+# (utils.colcache), like bucket and id codes.
+# -----------------------
+
+MAX_STEPS = 64
+UNSEEN = np.iinfo(np.int64).max
+
+
+class SessionSteps:
+    """Visited steps of the sessions that reached at least one step, in session code order."""
+
+    def __init__(self, names: list, codes: np.ndarray, mask: np.ndarray, first: np.ndarray,
+                 sessions: pd.DataFrame = None, rows: np.ndarray = None):
+        self.names = list(names)
+        self.codes = codes    # session code of each entry
+        self.mask = mask      # bit i set: step i visited
+        self.first = first    # (steps x entries) rank of the first visit, UNSEEN if none
+        self.sessions = sessions
+        self.rows = rows      # row of each entry in `sessions`
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _index(self, names) -> list[int]:
+        names = self.names if names is None else [names] if isinstance(names, str) else list(names)
+        unknown = [n for n in names if n not in self.names]
+        if unknown:
+            raise KeyError(f"Unknown funnel steps: {unknown}")
+        return [self.names.index(n) for n in names]
+
+    def has(self, name: str) -> np.ndarray:
+        """True for every entry that visited the step."""
+        return (self.mask & np.uint64(1 << self._index(name)[0])) != 0
+
+    def within(self, sessions: pd.DataFrame) -> "SessionSteps":
+        """The entries whose session is in `sessions` (e.g. the sidebar-filtered sessions), linked to their rows."""
+        key = id_codes(sessions[SESSION_COL])
+        keep = id_flags(key, SESSION_COL)[self.codes]
+        codes = self.codes[keep]
+        return SessionSteps(self.names, codes, self.mask[keep], self.first[:, keep],
+                            sessions, join_rows(codes, key, SESSION_COL))
+
+    def first_of(self, names) -> pd.Categorical:
+        """Which of the steps each entry visited first (NaN if none), e.g. the variant a session was shown."""
+        idx = self._index(names)
+        first = self.first[idx]
+        pick = np.where(first.min(axis=0) == UNSEEN, -1, first.argmin(axis=0))
+        return pd.Categorical.from_codes(pick, categories=[self.names[i] for i in idx])
+
+    def reached(self, names=None, cumulative: bool = True, strict: bool = False) -> np.ndarray:
+        """(entries x steps) booleans: entry reached each of the steps, in the given order."""
+        idx = self._index(names)
+        bits = np.array([1 << i for i in idx], dtype=np.uint64)
+        if cumulative or strict:
+            bits = np.bitwise_or.accumulate(bits)
+        out = (self.mask[:, None] & bits) == bits
+        if strict and len(idx) > 1:
+            first = self.first[idx]
+            out[:, 1:] &= np.logical_and.accumulate(first[1:] >= first[:-1], axis=0).T
+        return out
+
+    def funnel(self, names=None, cumulative: bool = True, strict: bool = False, by=None) -> pd.DataFrame:
+        """
+        Sessions reaching each step. by splits the counts: a column of the
+        sessions given to within(), or values aligned with the entries (such
+        as first_of()); entries without a value are left out.
+        """
+        names = self.names if names is None else [names] if isinstance(names, str) else list(names)
+        reached = self.reached(names, cumulative, strict)
+        if by is None:
+            return pd.DataFrame({"step": names, "sessions": reached.sum(axis=0).astype(np.int64)})
+        label = by
+        if isinstance(by, str):
+            if self.sessions is None:
+                raise ValueError("Splitting by a session column needs within(sessions) first")
+            by = self.sessions[label].array.take(self.rows, allow_fill=True)
+        group, uniques = pd.factorize(by, sort=True)
+        k = len(names)
+        key = (group[:, None] * k + np.arange(k))[reached & (group >= 0)[:, None]]
+        counts = np.bincount(key, minlength=len(uniques) * k)
+        g, j = np.divmod(np.arange(len(uniques) * k), k)
+        name = label if isinstance(label, str) else getattr(by, "name", None) or "group"
+        return pd.DataFrame({name: uniques.take(g), "step": np.array(names, dtype=object)[j], "sessions": counts})
+
+
+def build_session_steps(pageviews: pd.DataFrame, steps: dict) -> SessionSteps:
+    names = list(steps)
+    if len(names) > MAX_STEPS:
+        raise ValueError(f"A funnel has at most {MAX_STEPS} steps, got {len(names)}")
+    pos = id_codes(pageviews[SESSION_COL])
+    codes, uniques = pd.factorize(pageviews["pageview_url"].array)
+    lut = np.zeros(len(uniques) + 1, dtype=np.uint64)  # last slot: missing url
+    for i, urls in enumerate(steps.values()):
+        lut[:-1][pd.Index(uniques).isin(list(urls))] |= np.uint64(1 << i)
+    bits = lut[codes]
+
+    keep = np.flatnonzero((pos >= 0) & (bits != 0))
+    ts = pageviews["created_at"].to_numpy(dtype="datetime64[ns]").view("i8")[keep]
+    order = keep[np.lexsort((ts, pos[keep]))]  # by session, then time; ties keep table order
+    spos, sbits = pos[order], bits[order]
+    new = np.r_[True, spos[1:] != spos[:-1]] if len(spos) else np.empty(0, dtype=bool)
+    starts = np.flatnonzero(new)
+    slot = np.cumsum(new) - 1
+
+    # Position in the (session, time) order ranks visits within a session
+    first = np.full((len(names), len(starts)), UNSEEN, dtype=np.int64)
+    for i in range(len(names)):
+        hit = np.flatnonzero(sbits & np.uint64(1 << i))
+        s = slot[hit]
+        head = np.r_[True, s[1:] != s[:-1]] if len(s) else np.empty(0, dtype=bool)
+        first[i, s[head]] = hit[head]
+    mask = np.bitwise_or.reduceat(sbits, starts) if len(starts) else np.empty(0, dtype=np.uint64)
+    return SessionSteps(names, spos[starts], mask, first)
+
+
+def session_steps(pageviews: pd.DataFrame, steps: dict) -> SessionSteps:
+    """SessionSteps of a pageviews frame for {step name: URLs}, cached per frame."""
+    key = tuple((name, tuple(urls)) for name, urls in steps.items())
+    return derived(pageviews[SESSION_COL], ("steps", table_version("website_sessions"), key),
+                   lambda _: build_session_steps(pageviews, steps))
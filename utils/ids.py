@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .colcache import derived
+from .db import load_table, table_version
+
+# -----------------------
+# ID interning. Each kind of id (website_session_id, user_id, order_id,
+# order_item_id, product_id) gets one dictionary per data version, built from
+# the table that owns it, mapping every id to a dense integer code. An id has
+# the same code in every table, so joins become array indexing and membership
+# tests boolean lookups over the code space. The codes of a column are cached
+# per underlying buffer (utils.colcache); -1 marks a missing id, or one the
+# owning table does not hold.
+# -----------------------
+
+ID_OWNERS = {
+    "website_session_id": "website_sessions",
+    "user_id": "website_sessions",
+    "order_id": "orders",
+    "order_item_id": "order_items",
+    "product_id": "products",
+}
+# Columns holding ids of another kind
+ID_ALIASES = {"primary_product_id": "product_id"}
+
+
+@st.cache_resource(show_spinner=False, max_entries=2 * len(ID_OWNERS))
+def _id_space(kind: str, version: str) -> pd.Index:
+    ids = load_table(ID_OWNERS[kind], columns=(kind,))[kind]
+    return pd.Index(ids.dropna().unique(), name=kind).sort_values()
+
+
+def _kind(kind: str) -> str:
+    return ID_ALIASES.get(kind, kind)
+
+
+def id_space(kind: str) -> pd.Index:
+    """Every id of a kind, in code order."""
+    kind = _kind(kind)
+    return _id_space(kind, table_version(ID_OWNERS[kind]))
+
+
+def id_codes(s: pd.Series, kind: str = None) -> np.ndarray:
+    """Code of every id in s; kind defaults to the column name."""
+    kind = _kind(kind or s.name)
+    version = table_version(ID_OWNERS[kind])
+    space = _id_space(kind, version)
+    return derived(s, ("id", kind, version), lambda col: space.get_indexer(col.array))
+
+
+def id_flags(codes: np.ndarray, kind: str) -> np.ndarray:
+    """Boolean over the code space, True for every code in `codes`."""
+    flags = np.zeros(len(id_space(kind)), dtype=bool)
+    flags[codes[codes >= 0]] = True
+    return flags
+
+
+def id_rows(codes: np.ndarray, kind: str) -> np.ndarray:
+    """Row holding each code of the space (-1 for none), for a frame keyed by unique `codes`."""
+    rows = np.full(len(id_space(kind)), -1, dtype=np.intp)
+    ok = codes >= 0
+    rows[codes[ok]] = np.flatnonzero(ok)
+    return rows
+
+
+def join_rows(codes: np.ndarray, key_codes: np.ndarray, kind: str) -> np.ndarray:
+    """For each code, the row of the frame keyed by unique `key_codes` with the same id (-1 for none)."""
+    rows = id_rows(key_codes, kind)
+    return np.where(codes >= 0, rows[codes], -1)
+
+
+def isin_ids(s: pd.Series, ids: pd.Series) -> np.ndarray:
+    """s.isin(ids) for two id columns of the same kind, as a boolean lookup."""
+    codes = id_codes(s)
+    flags = id_flags(id_codes(ids, s.name), s.name)
+    return np.where(codes >= 0, flags[codes], False)
+
+
+def first_last(codes: np.ndarray, ts: np.ndarray, n: int):
+    """Row of the earliest and of the latest entry per code (-1 where there is none)."""
+    order = np.lexsort((ts, codes))  # stable: ties keep table order
+    scodes = codes[order]
+    starts = np.flatnonzero(np.r_[True, scodes[1:] != scodes[:-1]]) if len(scodes) else np.empty(0, dtype=np.intp)
+    ends = np.r_[starts[1:], len(scodes)] - 1
+    first = np.full(n, -1, dtype=np.intp)
+    last = np.full(n, -1, dtype=np.intp)
+    first[scodes[starts]] = order[starts]
+    last[scodes[ends]] = order[ends]
+    return first, last
@@ -0,0 +1,157 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .config import INDEX_MAX_BITMAP_VALUES
+from .query import predicate_mask
+
+# -----------------------
+# Filter index over one loaded table, built once and shared like the table.
+# Row positions are laid out by created_at, so a date window is two binary
+# searches. Low-cardinality columns get one packed bitmap per value over that
+# layout: an "in" predicate ORs the bitmaps of its values, predicates on
+# different columns AND together, and only the bytes inside the window are
+# touched. Anything else falls back to utils.query masks on the selected rows.
+# New rows (an incremental refresh) give a new index that reuses the layout
+# and the bitmaps built so far when they come after every row it holds.
+# -----------------------
+
+NAT = np.iinfo(np.int64).min
+
+
+class FilterIndex:
+    def __init__(self, df: pd.DataFrame, ts_col: str = "created_at"):
+        self.df = df
+        self.n = len(df)
+        self.ts_col = ts_col if ts_col in df.columns and pd.api.types.is_datetime64_dtype(df[ts_col]) else None
+        self.order = None  # layout position -> row, None when the table is already in time order
+        self.ts = None
+        if self.ts_col:
+            ts = df[self.ts_col].to_numpy(dtype="datetime64[ns]").view("i8")
+            if self.n > 1 and not (ts[1:] >= ts[:-1]).all():
+                self.order = np.argsort(ts, kind="stable")
+                ts = ts[self.order]
+            self.ts = ts  # NaT sorts first
+        self._bitmaps = {}
+        self._lock = threading.Lock()
+
+    def extended(self, df: pd.DataFrame) -> "FilterIndex":
+        """
+        Index over df, this index's table with rows appended. The time layout
+        and built bitmaps are extended when the new rows sort after every
+        existing row; otherwise the index is built anew.
+        """
+        if self.ts_col is None or self.order is not None or self.ts_col not in df.columns:
+            return FilterIndex(df, self.ts_col or "created_at")
+        new_ts = df[self.ts_col].iloc[self.n:].to_numpy(dtype="datetime64[ns]").view("i8")
+        last = self.ts[-1] if self.n else NAT
+        if len(new_ts) and (new_ts[0] < last or not (new_ts[1:] >= new_ts[:-1]).all()):
+            return FilterIndex(df, self.ts_col)
+
+        out = FilterIndex.__new__(FilterIndex)
+        out.df, out.n, out.ts_col, out.order = df, len(df), self.ts_col, None
+        out.ts = np.r_[self.ts, new_ts]
+        out._lock = threading.Lock()
+        with self._lock:
+            built = dict(self._bitmaps)
+        out._bitmaps = {col: self._append_bitmaps(bitmaps, df[col].iloc[self.n:]) for col, bitmaps in built.items()}
+        return out
+
+    def _append_bitmaps(self, bitmaps: dict | None, values: pd.Series) -> dict | None:
+        """Bitmaps of a column extended with the values of the appended rows."""
+        if bitmaps is None:
+            return None
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        keys = list(bitmaps) + [v for v in uniques if v not in bitmaps]
+        if len(keys) > INDEX_MAX_BITMAP_VALUES:
+            return None
+        head, rem = divmod(self.n, 8)
+        empty = np.zeros((self.n + 7) // 8, dtype=np.uint8)
+        new_bits = {v: codes == i for i, v in enumerate(uniques)}
+        no_bits = np.zeros(len(values), dtype=bool)
+        out = {}
+        for v in keys:
+            bm = bitmaps.get(v, empty)
+            tail = np.unpackbits(bm[head:])[:rem]  # bits already in the last, partly filled byte
+            out[v] = np.r_[bm[:head], np.packbits(np.r_[tail, new_bits.get(v, no_bits)])]
+        return out
+
+    def _column_bitmaps(self, col: str) -> dict | None:
+        with self._lock:
+            if col not in self._bitmaps:
+                self._bitmaps[col] = self._build_bitmaps(col)
+            return self._bitmaps[col]
+
+    def _build_bitmaps(self, col: str) -> dict | None:
+        """{value: packed bitmap over the time layout}; None for columns with too many values."""
+        codes, uniques = pd.factorize(self.df[col], use_na_sentinel=True)
+        if len(uniques) > INDEX_MAX_BITMAP_VALUES:
+            return None
+        if self.order is not None:
+            codes = codes[self.order]
+        return {v: np.packbits(codes == i) for i, v in enumerate(uniques)}
+
+    def _window(self, start: int | None, end: int | None) -> tuple[int, int]:
+        if start is None and end is None:
+            return 0, self.n
+        lo = np.searchsorted(self.ts, NAT + 1 if start is None else start, side="left")
+        hi = self.n if end is None else np.searchsorted(self.ts, end, side="right")
+        return int(lo), int(hi)
+
+    def select(self, predicates: tuple) -> np.ndarray | None:
+        """
+        Positions (in table order) of the rows matching every predicate, or None
+        when all rows match. Predicates on missing columns are ignored, as in
+        utils.query.apply_predicates.
+        """
+        start = end = None
+        dims, rest = [], []
+        for col, op, val in predicates:
+            if col not in self.df.columns:
+                continue
+            if col == self.ts_col and op == ">=":
+                v = pd.Timestamp(val).value
+                start = v if start is None else max(start, v)
+            elif col == self.ts_col and op == "<=":
+                v = pd.Timestamp(val).value
+                end = v if end is None else min(end, v)
+            elif op == "in" and self._column_bitmaps(col) is not None:
+                dims.append((col, val))
+            else:
+                rest.append((col, op, val))
+
+        lo, hi = self._window(start, end)
+        if lo >= hi:
+            return np.empty(0, dtype=np.intp)
+        if not dims and not rest and lo == 0 and hi == self.n:
+            return None
+
+        if dims:
+            b0, b1 = lo // 8, (hi + 7) // 8
+            mask = None
+            for col, vals in dims:
+                bitmaps = self._column_bitmaps(col)
+                col_mask = np.zeros(b1 - b0, dtype=np.uint8)
+                for v in vals:
+                    bm = bitmaps.get(v)
+                    if bm is not None:
+                        col_mask |= bm[b0:b1]
+                mask = col_mask if mask is None else np.bitwise_and(mask, col_mask, out=mask)
+            bits = np.unpackbits(mask)[lo - b0 * 8: hi - b0 * 8]
+            pos = lo + np.flatnonzero(bits)
+        else:
+            pos = np.arange(lo, hi)
+
+        rows = pos if self.order is None else np.sort(self.order[pos])
+        if rest:
+            rows = rows[predicate_mask(self.df.iloc[rows], tuple(rest))]
+        return rows
+
+    def frame(self, predicates: tuple = (), columns: tuple = None) -> pd.DataFrame:
+        """The matching rows (and columns) as a copy-on-write frame with a fresh RangeIndex."""
+        df = self.df[list(columns)] if columns else self.df
+        rows = self.select(predicates)
+        if rows is None:
+            return df.copy(deep=False)
+        return df.take(rows).reset_index(drop=True)
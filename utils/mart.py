@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .config import FUNNEL_GROUPS
+from .db import load_table, table_version
+from .ids import first_last, id_codes, id_space, join_rows
+
+# -----------------------
+# Session mart: one row per website_session_id with the facts pages keep
+# deriving from pageviews and orders. It is built once per data version from
+# the unfiltered tables, so every fact covers the whole session; row i is the
+# session with interned code i (utils.ids), so pages attach it to their
+# filtered sessions by array indexing with session_facts().
+# -----------------------
+
+SESSION_COL = "website_session_id"
+MART_TABLES = ("website_sessions", "website_pageviews", "orders", "order_item_refunds")
+
+STEPS = list(FUNNEL_GROUPS)
+STEP_OF_URL = {url: i for i, urls in enumerate(FUNNEL_GROUPS.values()) for url in urls}
+
+
+def build_session_mart(pageviews: pd.DataFrame, orders: pd.DataFrame, refunds: pd.DataFrame) -> pd.DataFrame:
+    """
+    Columns: pv_count, is_bounce, entry_url, exit_url, funnel_step (deepest
+    FUNNEL_GROUPS step reached), orders, converted, revenue, items, refunds.
+    Indexed by website_session_id, in session code order.
+    """
+    key = id_space(SESSION_COL)
+    n = len(key)
+
+    # Pageviews
+    pos = id_codes(pageviews[SESSION_COL])
+    keep = pos >= 0
+    pos = pos[keep]
+    ts = pageviews["created_at"].to_numpy(dtype="datetime64[ns]").view("i8")[keep]
+    urls = pageviews["pageview_url"].array[keep]
+    pv_count = np.bincount(pos, minlength=n)
+    first, last = first_last(pos, ts, n)
+
+    codes, uniques = pd.factorize(urls)
+    step_of = np.array([STEP_OF_URL.get(u, -1) for u in uniques] + [-1], dtype=np.int8)
+    deepest = np.full(n, -1, dtype=np.int8)
+    np.maximum.at(deepest, pos, step_of[codes])
+
+    # Orders and refunds
+    opos = id_codes(orders[SESSION_COL])
+    ok = opos >= 0
+    price = orders["price_usd"].fillna(0).to_numpy(dtype="float64")
+    items = (orders["items_purchased"].fillna(0).to_numpy(dtype="float64")
+             if "items_purchased" in orders.columns else np.ones(len(orders)))
+    n_orders = np.bincount(opos[ok], minlength=n)
+
+    refund_order = join_rows(id_codes(refunds["order_id"]), id_codes(orders["order_id"]), "order_id")
+    rpos = np.where(refund_order >= 0, opos[refund_order], -1)
+    rok = rpos >= 0
+    refund_amt = refunds["refund_amount_usd"].fillna(0).to_numpy(dtype="float64")
+
+    return pd.DataFrame({
+        "pv_count": pv_count,
+        "is_bounce": pv_count == 1,
+        "entry_url": urls.take(first, allow_fill=True),
+        "exit_url": urls.take(last, allow_fill=True),
+        "funnel_step": pd.Categorical.from_codes(deepest, categories=STEPS, ordered=True),
+        "orders": n_orders,
+        "converted": n_orders > 0,
+        "revenue": np.bincount(opos[ok], weights=price[ok], minlength=n),
+        "items": np.bincount(opos[ok], weights=items[ok], minlength=n).astype(np.int64),
+        "refunds": np.bincount(rpos[rok], weights=refund_amt[rok], minlength=n),
+    }, index=key)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _session_mart(versions: tuple) -> pd.DataFrame:
+    return build_session_mart(
+        load_table("website_pageviews", columns=(SESSION_COL, "created_at", "pageview_url")),
+        load_table("orders"),
+        load_table("order_item_refunds", columns=("order_id", "refund_amount_usd")),
+    )
+
+
+def session_mart() -> pd.DataFrame:
+    """The mart for the current data version of its source tables."""
+    return _session_mart(tuple(table_version(t) for t in MART_TABLES))
+
+
+def session_facts(sessions: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+    """sessions with the mart columns (all, or `columns`) of each of its sessions attached."""
+    mart = session_mart()
+    codes = id_codes(sessions[SESSION_COL])
+    return sessions.assign(**{c: mart[c].array.take(codes, allow_fill=True) for c in columns or mart.columns})
+
+
+# -----------------------
+# Home KPIs: whole-data totals, computed once per data version.
+# -----------------------
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _home_kpis(versions: tuple) -> dict:
+    orders = load_table("orders", columns=("order_id", "user_id", "price_usd"))
+    mart = session_mart()
+    total_orders = len(orders)
+    revenue = float(orders["price_usd"].sum())
+    buyers = id_codes(orders["user_id"])
+    orders_per_buyer = np.bincount(buyers[buyers >= 0])
+    orders_per_buyer = orders_per_buyer[orders_per_buyer > 0]
+    return {
+        "sessions": len(mart),
+        "orders": total_orders,
+        "revenue": revenue,
+        "conversion_rate": float(mart["converted"].mean()) if len(mart) else np.nan,
+        "avg_order_value": revenue / total_orders if total_orders > 0 else 0,
+        "repeat_rate": float((orders_per_buyer >= 2).mean()) if len(orders_per_buyer) else np.nan,
+    }
+
+
+def home_kpis() -> dict:
+    """Sessions, orders, revenue, conversion rate, average order value and repeat-buyer rate over all data."""
+    return _home_kpis(tuple(table_version(t) for t in MART_TABLES))
@@ -0,0 +1,146 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+from . import diagnostics
+from .agg import filter_order_items, filter_orders, filter_pageviews, filter_sessions
+from .config import MEMO_MAX_BYTES, MEMO_MAX_ENTRIES
+from .db import load_table, load_tables, table_version
+from .query import filters_key
+
+# -----------------------
+# Per-session memo of filtered tables. Every page calls sidebar_filters() and
+# then filters the same tables with the same F; the memo keeps each filtered
+# table, keyed by a canonical hash of F plus the table's data version, so the
+# work is done once per session and reused across pages and reruns.
+# Each session holds an LRU of at most MEMO_MAX_ENTRIES frames; the bytes held
+# by all sessions together are accounted in utils.diagnostics and capped at
+# MEMO_MAX_BYTES.
+# -----------------------
+
+SESSION_KEY = "_filtered_memo"
+
+
+def _release(sizes: dict):
+    """Give back what a discarded session memo still held."""
+    diagnostics.memo_resize(-len(sizes), -sum(sizes.values()))
+
+
+class FrameMemo:
+    """LRU of frames for one session."""
+
+    def __init__(self, max_entries: int = MEMO_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._frames = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        weakref.finalize(self, _release, self._sizes)
+
+    def get(self, key):
+        with self._lock:
+            df = self._frames.get(key)
+            if df is not None:
+                self._frames.move_to_end(key)
+        diagnostics.memo_lookup(df is not None)
+        return df
+
+    def put(self, key, df: pd.DataFrame):
+        nbytes = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            self._drop(key)
+            self._frames[key] = df
+            self._sizes[key] = nbytes
+            diagnostics.memo_resize(1, nbytes)
+            while len(self._frames) > self.max_entries:
+                self._drop(next(iter(self._frames)))
+            while len(self._frames) > 1 and diagnostics.memo_stats()["bytes"] > MEMO_MAX_BYTES:
+                self._drop(next(iter(self._frames)))
+
+    def _drop(self, key):
+        if key in self._frames:
+            del self._frames[key]
+            diagnostics.memo_resize(-1, -self._sizes.pop(key))
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._frames):
+                self._drop(key)
+
+
+def session_memo() -> FrameMemo:
+    if SESSION_KEY not in st.session_state:
+        st.session_state[SESSION_KEY] = FrameMemo()
+    return st.session_state[SESSION_KEY]
+
+
+def _filter_items(items: pd.DataFrame, F: dict) -> pd.DataFrame:
+    return filter_order_items(items, load_table("products", columns=("product_id", "product_name")), F)
+
+
+# Filter step applied to each table after loading, and the columns it adds
+FILTER_STEPS = {
+    "website_sessions": (filter_sessions, []),
+    "website_pageviews": (filter_pageviews, []),
+    "orders": (filter_orders, []),
+    "order_items": (_filter_items, ["product_name"]),
+}
+
+
+def _version(table_key: str) -> str:
+    if table_key == "order_items":
+        return f"{table_version(table_key)}+{table_version('products')}"
+    return table_version(table_key)
+
+
+def filtered_tables(keys: list[str], F: dict, columns: dict = None) -> dict:
+    """
+    load_tables() followed by the matching utils.agg.filter_* step, memoized per
+    session. Frames are kept with all their columns and handed out as
+    copy-on-write projections onto `columns` (plus any columns the filter step adds).
+    """
+    columns = columns or {}
+    memo = session_memo()
+    fkey = filters_key(F)
+    memo_keys = {k: (k, fkey, _version(k)) for k in keys}
+    out, missing = {}, []
+    for k in keys:
+        df = memo.get(memo_keys[k])
+        if df is None:
+            missing.append(k)
+        else:
+            out[k] = df
+
+    if missing:
+        loaded = load_tables(missing, F=F)
+        for k in missing:
+            df = loaded[k]
+            step = FILTER_STEPS.get(k)
+            if step:
+                df = step[0](df, F)
+            memo.put(memo_keys[k], df)
+            out[k] = df
+
+    for k, df in out.items():
+        cols = columns.get(k)
+        if cols:
+            added = FILTER_STEPS[k][1] if k in FILTER_STEPS else []
+            df = df[list(cols) + [c for c in added if c not in cols]]
+        out[k] = df.copy(deep=False)
+    return {k: out[k] for k in keys}
+
+
+def memoized(name, F: dict, tables: list[str], compute) -> pd.DataFrame:
+    """
+    compute() (a frame derived from filtered tables), kept in the session memo
+    under `name`, the filters and the data versions of `tables`.
+    """
+    memo = session_memo()
+    key = (name, filters_key(F), tuple(_version(t) for t in tables))
+    df = memo.get(key)
+    if df is None:
+        df = compute()
+        memo.put(key, df)
+    return df
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from .colcache import derived
+from .db import table_version
+from .ids import id_codes
+from .mart import SESSION_COL
+
+# -----------------------
+# Clickstream paths. Pageviews are laid out clustered by session, in time
+# order (CSR): `pages` holds each pageview's URL as a small integer code and
+# pages[offsets[i]:offsets[i + 1]] is the path of session i. A path, or its
+# first k pages, is hashed per session with one reduceat over the rows, so
+# counting paths creates no per-session Python objects; only the distinct
+# paths are decoded back to URLs. Distinct paths collide with probability
+# about n**2 / 2**65. Transitions between consecutive pages (or page groups)
+# are counted with one bincount over source * N + target.
+# -----------------------
+
+_MULT = np.uint64(0x9E3779B97F4A7C15)  # odd 64-bit multiplier; arithmetic wraps mod 2**64
+
+
+class Clickstream:
+    """Pageviews of the sessions in a frame, as session paths in CSR layout."""
+
+    def __init__(self, pageviews: pd.DataFrame, url: str = "pageview_url", ts: str = "created_at",
+                 ordered: bool = False):
+        """ordered=True: rows already come clustered by session, in time order (ts is then not read)."""
+        pos = id_codes(pageviews[SESSION_COL])
+        keep = np.flatnonzero(pos >= 0)
+        if not ordered:
+            t = pageviews[ts].to_numpy(dtype="datetime64[ns]").view("i8")[keep]
+            keep = keep[np.lexsort((t, pos[keep]))]  # ties keep table order
+        codes, urls = pd.factorize(pageviews[url].array)
+        spos = pos[keep]
+        new = np.r_[True, spos[1:] != spos[:-1]] if len(spos) else np.empty(0, dtype=bool)
+        starts = np.flatnonzero(new)
+
+        self.rows = keep                                    # source row of each pageview
+        self.pages = codes[keep].astype(np.int32)           # URL code, -1 where missing
+        self.offsets = np.r_[starts, len(spos)].astype(np.int64)
+        self.sessions = spos[starts]                        # session code of each path
+        self.urls = np.r_[np.asarray(urls, dtype=object), [np.nan]]  # code -1 decodes to NaN
+        self.weights = None                                 # sessions each path stands for (None: one)
+
+    @classmethod
+    def from_paths(cls, paths: pd.Series) -> "Clickstream":
+        """Clickstream of distinct paths (tuples of URLs) weighted by their session counts."""
+        cs = cls.__new__(cls)
+        flat = pd.Series([u for p in paths.index for u in p], dtype=object)
+        codes, urls = pd.factorize(flat)
+        cs.pages = codes.astype(np.int32)
+        cs.offsets = np.r_[0, np.cumsum([len(p) for p in paths.index])].astype(np.int64)
+        cs.rows = np.arange(len(flat))
+        cs.sessions = np.full(len(paths), -1, dtype=np.intp)
+        cs.urls = np.r_[np.asarray(urls, dtype=object), [np.nan]]
+        cs.weights = paths.to_numpy(dtype=np.int64)
+        return cs
+
+    def __len__(self):
+        return len(self.sessions)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def depth(self) -> np.ndarray:
+        """0-based position of every pageview within its session."""
+        return np.arange(len(self.pages)) - np.repeat(self.offsets[:-1], self.lengths)
+
+    def path_keys(self, k: int = None) -> np.ndarray:
+        """uint64 hash of each session's path (its first k pages when k is given)."""
+        if not len(self):
+            return np.empty(0, dtype=np.uint64)
+        depth = self.depth
+        powers = np.cumprod(np.r_[np.uint64(1), np.full(int(self.lengths.max()), _MULT, dtype=np.uint64)])
+        terms = (self.pages + 2).astype(np.uint64) * powers[depth]
+        if k is not None:
+            terms[depth >= k] = 0
+        return np.add.reduceat(terms, self.offsets[:-1])
+
+    def path(self, i: int, k: int = None) -> tuple:
+        """Path of session i (first k pages when k is given) as URLs."""
+        end = self.offsets[i + 1] if k is None else min(self.offsets[i + 1], self.offsets[i] + k)
+        return tuple(self.urls[self.pages[self.offsets[i]:end]])
+
+    def path_counts(self, k: int = None, n: int = None) -> pd.Series:
+        """
+        Sessions per distinct path (tuple of URLs), or per first-k-pages prefix,
+        most frequent first (ties: first seen first); the top n only when n is given.
+        """
+        keys = self.path_keys(k)
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        counts = np.bincount(inverse, weights=self.weights, minlength=len(first)).astype(np.int64)
+        top = np.lexsort((first, -counts))[:n]
+        paths = [self.path(i, k) for i in first[top]]
+        return pd.Series(counts[top], index=pd.Index(paths, tupleize_cols=False), dtype="int64")
+
+    def transitions(self, nodes: dict = None, max_depth: int = None, slices: dict = None) -> pd.DataFrame:
+        """
+        Sessions moving from each page to the next, as rows (source, target, count).
+        nodes maps URLs to the nodes counted (e.g. page groups; URLs without a
+        node are left out), by default every URL is its own node. max_depth
+        keeps the first max_depth pages of each session. slices ({name: boolean
+        per session}) counts every slice in the same pass, into a "slice" column;
+        a session may belong to several slices.
+        """
+        if nodes is None:
+            labels = pd.Index(self.urls[:-1])
+            node = self.pages
+        else:
+            labels = pd.Index(pd.unique(pd.Series(list(nodes.values()), dtype=object)))
+            url_node = labels.get_indexer(pd.Series(self.urls[:-1], dtype=object).map(nodes))
+            node = np.r_[url_node, -1][self.pages]
+        n = len(labels)
+
+        depth = self.depth
+        ok = (depth[1:] > 0) & (node[:-1] >= 0) & (node[1:] >= 0)  # next pageview is in the same session
+        if max_depth is not None:
+            ok &= depth[1:] < max_depth
+        t = np.flatnonzero(ok)
+        key = node[t].astype(np.int64) * n + node[t + 1]
+        path = np.repeat(np.arange(len(self)), self.lengths)[t]
+
+        names = [None] if slices is None else list(slices)
+        if slices is not None:
+            member = np.column_stack([np.asarray(slices[s], dtype=bool) for s in names])
+            t, s = np.nonzero(member[path])
+            key = s * (n * n) + key[t]
+            path = path[t]
+        weights = None if self.weights is None else self.weights[path]
+        counts = np.bincount(key, weights=weights, minlength=len(names) * n * n).astype(np.int64)
+
+        cells = np.flatnonzero(counts)
+        s, cell = np.divmod(cells, n * n)
+        src, dst = np.divmod(cell, n)
+        out = pd.DataFrame({"source": labels[src], "target": labels[dst], "count": counts[cells]})
+        if slices is not None:
+            out.insert(0, "slice", np.array(names, dtype=object)[s])
+        return out
+
+
+def clickstream(pageviews: pd.DataFrame) -> Clickstream:
+    """Clickstream of a pageviews frame, cached per frame."""
+    return derived(pageviews[SESSION_COL], ("clickstream", table_version("website_sessions")),
+                   lambda _: Clickstream(pageviews))
+
+
+# -----------------------
+# Roll-ups of a path count Series (one entry per distinct path)
+# -----------------------
+
+def path_prefixes(paths: pd.Series, k: int) -> pd.Series:
+    """Sessions per first-k-pages prefix, most frequent first."""
+    prefixes = pd.Index([p[:k] for p in paths.index], tupleize_cols=False)
+    return paths.groupby(prefixes, sort=False).sum().sort_values(ascending=False, kind="stable")
+
+
+def exit_pages(paths: pd.Series) -> pd.Series:
+    """Sessions per exit page (last URL of the path), most frequent first."""
+    exits = pd.Index([p[-1] for p in paths.index], name="pageview_url")
+    return paths.groupby(exits, sort=False).sum().sort_values(ascending=False, kind="stable")
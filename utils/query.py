@@ -0,0 +1,127 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, column, literal_column, select, table
+
+# -----------------------
+# Predicates are (column, op, value) tuples with op in ">=", "<=", "in".
+# The same tuples render to parameterized SQLAlchemy Core clauses, to pyarrow
+# row filters for the Parquet snapshots, and to pandas masks for frames that
+# are already in memory. They are hashable, so they can key st.cache_data.
+# -----------------------
+
+# Sidebar filter key -> column, per table. Mirrors utils.agg.filter_* so that
+# pushing a filter down never changes what a page ends up showing.
+DIMENSION_FILTERS = {
+    "website_sessions": [
+        ("utm_source", "utm_source"),
+        ("utm_campaign", "utm_campaign"),
+        ("utm_content", "utm_content"),
+        ("device_type", "device_type"),
+        ("http_referer", "http_referer"),
+    ],
+    "website_pageviews": [("pageview_urls", "pageview_url")],
+}
+
+# Tables whose rows are restricted to the selected created_at window
+WINDOWED_TABLES = {
+    "website_sessions", "website_pageviews", "orders", "order_items", "order_item_refunds",
+}
+
+
+def table_predicates(table_key: str, F: dict, product_ids=None) -> tuple:
+    """Translate a sidebar_filters() dict into predicates for one table."""
+    if not F:
+        return ()
+    preds = []
+    if table_key in WINDOWED_TABLES:
+        if F.get("start_ts") is not None:
+            preds.append(("created_at", ">=", pd.Timestamp(F["start_ts"])))
+        if F.get("end_ts") is not None:
+            preds.append(("created_at", "<=", pd.Timestamp(F["end_ts"])))
+    for key, col in DIMENSION_FILTERS.get(table_key, []):
+        vals = F.get(key) or []
+        if vals:
+            preds.append((col, "in", tuple(sorted(vals))))
+    if table_key == "order_items" and F.get("product_names") and product_ids is not None:
+        preds.append(("product_id", "in", tuple(sorted(product_ids))))
+    return tuple(preds)
+
+
+def filters_key(F: dict) -> str:
+    """
+    Canonical hash of the row-selecting part of a sidebar_filters() dict: the
+    window and every non-empty selection, order-insensitive. Display-only keys
+    such as granularity do not change it.
+    """
+    keys = ["start_ts", "end_ts", "product_names"] + sorted({k for dims in DIMENSION_FILTERS.values() for k, _ in dims})
+    canon = {}
+    for k in keys:
+        v = (F or {}).get(k)
+        if k in ("start_ts", "end_ts"):
+            canon[k] = None if v is None else pd.Timestamp(v).isoformat()
+        elif v:
+            canon[k] = sorted(str(x) for x in v)
+    return hashlib.sha1(json.dumps(canon, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def window_bounds(predicates: tuple):
+    """The created_at window implied by the predicates, as (start_ts, end_ts)."""
+    start_ts = end_ts = None
+    for col, op, val in predicates:
+        if col == "created_at" and op == ">=":
+            start_ts = val
+        elif col == "created_at" and op == "<=":
+            end_ts = val
+    return start_ts, end_ts
+
+
+def build_select(table_name: str, schema: str = None, predicates: tuple = (), columns: tuple = None):
+    """SELECT [columns] FROM schema.table WHERE <predicates>, with every value bound as a parameter."""
+    tbl = table(table_name, *[column(c) for c in columns or ()], schema=schema)
+    stmt = select(*[tbl.c[c] for c in columns]) if columns else select(literal_column("*")).select_from(tbl)
+    clauses = []
+    for col, op, val in predicates:
+        c = column(col)
+        if op == ">=":
+            clauses.append(c >= val.to_pydatetime() if isinstance(val, pd.Timestamp) else c >= val)
+        elif op == "<=":
+            clauses.append(c <= val.to_pydatetime() if isinstance(val, pd.Timestamp) else c <= val)
+        elif op == "in":
+            clauses.append(c.in_(list(val)))
+        else:
+            raise ValueError(f"Unsupported predicate operator: {op}")
+    if clauses:
+        stmt = stmt.where(and_(*clauses))
+    return stmt
+
+
+def parquet_filters(predicates: tuple):
+    """Predicates in the list-of-tuples form accepted by pd.read_parquet(filters=...)."""
+    if not predicates:
+        return None
+    return [(col, op, list(val) if op == "in" else val) for col, op, val in predicates]
+
+
+def predicate_mask(df: pd.DataFrame, predicates: tuple) -> np.ndarray:
+    """Boolean row mask of the predicates; those on missing columns are ignored."""
+    mask = pd.Series(True, index=df.index)
+    for col, op, val in predicates:
+        if col not in df.columns:
+            continue
+        if op == ">=":
+            mask &= df[col] >= val
+        elif op == "<=":
+            mask &= df[col] <= val
+        elif op == "in":
+            mask &= df[col].isin(list(val))
+    return mask.fillna(False).astype(bool).to_numpy()
+
+
+def apply_predicates(df: pd.DataFrame, predicates: tuple) -> pd.DataFrame:
+    """Evaluate predicates against a frame already in memory."""
+    if not predicates or df.empty:
+        return df
+    return df[predicate_mask(df, predicates)].reset_index(drop=True)
@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from .config import SNAPSHOT_DIR, SNAPSHOT_MAX_AGE_HOURS
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# Layout
+#   <SNAPSHOT_DIR>/<table_key>/manifest.json
+#   <SNAPSHOT_DIR>/<table_key>/<version>/month=YYYY-MM.parquet
+# The manifest points at the live version directory and is swapped atomically,
+# so readers never see a half-written snapshot.
+# -----------------------
+
+MANIFEST = "manifest.json"
+NO_MONTH = "none"
+
+
+def _table_dir(table_key: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, table_key)
+
+
+def _month_label(ts: pd.Timestamp) -> str:
+    return f"{ts.year:04d}-{ts.month:02d}"
+
+
+def read_manifest(table_key: str) -> dict | None:
+    """Return the manifest of the live snapshot, or None if there is none."""
+    path = os.path.join(_table_dir(table_key), MANIFEST)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(table_key: str, manifest: dict):
+    path = os.path.join(_table_dir(table_key), MANIFEST)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def is_fresh(manifest: dict | None) -> bool:
+    """A snapshot is fresh while its last source check is younger than SNAPSHOT_MAX_AGE_HOURS."""
+    if not manifest:
+        return False
+    return (time.time() - manifest.get("checked_at", 0)) < SNAPSHOT_MAX_AGE_HOURS * 3600
+
+
+def touch(table_key: str):
+    """Mark the live snapshot as checked against the source just now."""
+    manifest = read_manifest(table_key)
+    if manifest:
+        manifest["checked_at"] = time.time()
+        _write_manifest(table_key, manifest)
+
+
+def concat_frames(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate frames, widening categoricals to a shared category list so they stay categorical."""
+    frames = [f for f in frames if f is not None]
+    if len(frames) > 1:
+        for col in frames[0].columns:
+            dtypes = [f[col].dtype for f in frames if col in f.columns]
+            if all(isinstance(d, pd.CategoricalDtype) for d in dtypes) and len(set(dtypes)) > 1:
+                categories = dtypes[0].categories
+                for d in dtypes[1:]:
+                    categories = categories.append(d.categories.difference(categories))
+                frames = [
+                    f.assign(**{col: f[col].cat.set_categories(categories)}) if col in f.columns else f
+                    for f in frames
+                ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _partition_labels(df: pd.DataFrame, ts_col: str) -> pd.Series:
+    if ts_col not in df.columns:
+        return pd.Series(NO_MONTH, index=df.index)
+    ts = pd.to_datetime(df[ts_col], errors="coerce")
+    return ts.dt.strftime("%Y-%m").fillna(NO_MONTH)
+
+
+def _write_partition(part: pd.DataFrame, out_dir: str, label: str) -> dict:
+    fname = f"month={label}.parquet"
+    part.reset_index(drop=True).to_parquet(os.path.join(out_dir, fname), index=False)
+    return {"file": fname, "rows": int(len(part))}
+
+
+def _watermark(df: pd.DataFrame, ts_col: str, pk_col: str | None, previous: dict | None = None) -> dict | None:
+    """
+    Newest created_at seen, the largest primary key, and the keys sitting exactly on
+    the newest timestamp (so rows sharing it are not fetched twice).
+    """
+    if ts_col not in df.columns or pk_col not in df.columns or df.empty:
+        return previous
+    max_ts = df[ts_col].max()
+    if pd.isna(max_ts):
+        return previous
+    boundary = df.loc[df[ts_col] == max_ts, pk_col].dropna().astype(str).tolist()
+    if previous and previous.get("created_at"):
+        prev_ts = pd.Timestamp(previous["created_at"])
+        if prev_ts > max_ts:
+            return previous
+        if prev_ts == max_ts:
+            boundary = sorted(set(previous.get("boundary_keys", [])) | set(boundary))
+    keys = df[pk_col].dropna()
+    numeric_keys = pd.to_numeric(keys, errors="coerce")
+    max_pk = numeric_keys.max() if numeric_keys.notna().all() else keys.max()
+    return {
+        "created_at": max_ts.isoformat(),
+        "pk": None if pd.isna(max_pk) else str(max_pk),
+        "boundary_keys": boundary,
+    }
+
+
+def _publish(table_key: str, tmp_dir: str, version: str, ts_col: str,
+             partitions: dict, watermark: dict | None) -> dict:
+    """Move a finished version directory into place and point the manifest at it."""
+    table_dir = _table_dir(table_key)
+    version_dir = os.path.join(table_dir, version)
+    shutil.rmtree(version_dir, ignore_errors=True)
+    os.replace(tmp_dir, version_dir)
+
+    previous = read_manifest(table_key)
+    now = time.time()
+    manifest = {
+        "table": table_key,
+        "version": version,
+        "ts_col": ts_col,
+        "rows": int(sum(p["rows"] for p in partitions.values())),
+        "partitions": partitions,
+        "watermark": watermark,
+        "written_at": now,
+        "checked_at": now,
+    }
+    _write_manifest(table_key, manifest)
+
+    if previous and previous.get("version") != version:
+        shutil.rmtree(os.path.join(table_dir, previous["version"]), ignore_errors=True)
+    return manifest
+
+
+def _new_tmp_dir(table_key: str, version: str) -> str:
+    tmp_dir = os.path.join(_table_dir(table_key), f"{version}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+
+def write_snapshot(table_key: str, df: pd.DataFrame, version: str,
+                   ts_col: str = "created_at", pk_col: str = None) -> dict:
+    """Write df as a new snapshot version, one Parquet file per month of ts_col."""
+    tmp_dir = _new_tmp_dir(table_key, version)
+    partitions = {}
+    try:
+        for label, part in df.groupby(_partition_labels(df, ts_col), sort=True):
+            partitions[label] = _write_partition(part, tmp_dir, label)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return _publish(table_key, tmp_dir, version, ts_col, partitions, _watermark(df, ts_col, pk_col))
+
+
+def append_snapshot(table_key: str, manifest: dict, new_rows: pd.DataFrame, version: str,
+                    pk_col: str = None) -> dict:
+    """
+    Publish a new snapshot version holding the live one plus new_rows.
+    Only the month partitions that receive rows are rewritten; untouched
+    partitions are hard-linked from the previous version.
+    """
+    ts_col = manifest.get("ts_col", "created_at")
+    old_dir = os.path.join(_table_dir(table_key), manifest["version"])
+    tmp_dir = _new_tmp_dir(table_key, version)
+    partitions = dict(manifest["partitions"])
+    touched = set()
+    try:
+        for label, part in new_rows.groupby(_partition_labels(new_rows, ts_col), sort=True):
+            if label in partitions:
+                existing = pd.read_parquet(os.path.join(old_dir, partitions[label]["file"]))
+                part = concat_frames([existing, part])
+            partitions[label] = _write_partition(part, tmp_dir, label)
+            touched.add(label)
+
+        for label, info in partitions.items():
+            if label in touched:
+                continue
+            src = os.path.join(old_dir, info["file"])
+            dst = os.path.join(tmp_dir, info["file"])
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    watermark = _watermark(new_rows, ts_col, pk_col, previous=manifest.get("watermark"))
+    return _publish(table_key, tmp_dir, version, ts_col, partitions, watermark)
+
+
+def read_snapshot(table_key: str, manifest: dict, start_ts=None, end_ts=None,
+                  columns: list = None, filters: list = None) -> pd.DataFrame:
+    """
+    Read the live snapshot, skipping month partitions outside [start_ts, end_ts].
+    Rows in the boundary months are trimmed to the exact window; columns and
+    pyarrow-style filters are pushed into the Parquet reader.
+    """
+    version_dir = os.path.join(_table_dir(table_key), manifest["version"])
+    lo = _month_label(pd.Timestamp(start_ts)) if start_ts is not None else None
+    hi = _month_label(pd.Timestamp(end_ts)) if end_ts is not None else None
+    windowed = lo is not None or hi is not None
+
+    files = []
+    for label, part in sorted(manifest["partitions"].items()):
+        if windowed and label == NO_MONTH:
+            continue
+        if lo is not None and label < lo:
+            continue
+        if hi is not None and label > hi:
+            continue
+        files.append(os.path.join(version_dir, part["file"]))
+
+    columns = list(columns) if columns else None
+    if not files:
+        # Keep the schema of the table even when the window selects nothing
+        any_part = next(iter(manifest["partitions"].values()), None)
+        if any_part is None:
+            return pd.DataFrame()
+        return pd.read_parquet(os.path.join(version_dir, any_part["file"]), columns=columns).iloc[0:0]
+
+    filters = list(filters or [])
+    ts_col = manifest.get("ts_col")
+    if start_ts is not None:
+        filters.append((ts_col, ">=", pd.Timestamp(start_ts)))
+    if end_ts is not None:
+        filters.append((ts_col, "<=", pd.Timestamp(end_ts)))
+
+    parts = [pd.read_parquet(f, columns=columns, filters=filters or None) for f in files]
+    return concat_frames(parts)
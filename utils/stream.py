@@ -0,0 +1,269 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .config import SNAPSHOT_MAX_AGE_HOURS
+from .db import iter_table, load_table, table_version
+from .ids import id_codes, id_flags
+from .paths import Clickstream
+
+# -----------------------
+# Mergeable partial aggregators. Each one sees a table chunk by chunk through
+# update(), can absorb another partial of the same kind through merge(), and
+# produces its final value with result(). State grows with the result (groups,
+# sessions, distinct paths), never with the number of rows streamed through.
+# -----------------------
+
+SESSION_COL = "website_session_id"
+
+
+def _plain_index(s: pd.Series) -> pd.Series:
+    """Drop categorical group keys to plain values so partials from different chunks line up."""
+    idx = s.index
+    if isinstance(idx, pd.MultiIndex):
+        s.index = pd.MultiIndex.from_arrays(
+            [idx.get_level_values(i).astype(object) for i in range(idx.nlevels)], names=idx.names
+        )
+    elif isinstance(idx, pd.CategoricalIndex):
+        s.index = idx.astype(object)
+    return s
+
+
+class Count:
+    """Row count, overall or per group of `by` columns."""
+
+    def __init__(self, by=None):
+        self.by = [by] if isinstance(by, str) else by
+        self._parts = []
+        self._total = 0
+
+    def _partial(self, chunk: pd.DataFrame) -> pd.Series:
+        return chunk.groupby(self.by, observed=True, sort=False).size()
+
+    def update(self, chunk: pd.DataFrame):
+        if self.by is None:
+            self._total += self._partial_total(chunk)
+            return
+        self._parts.append(_plain_index(self._partial(chunk)))
+        if len(self._parts) > 32:
+            self._parts = [self._combine()]
+
+    def _partial_total(self, chunk: pd.DataFrame):
+        return len(chunk)
+
+    def merge(self, other: "Count"):
+        self._total += other._total
+        self._parts += other._parts
+
+    def _combine(self) -> pd.Series:
+        if not self._parts:
+            return pd.Series(dtype="int64")
+        levels = list(range(len(self.by)))
+        return pd.concat(self._parts).groupby(level=levels).sum()
+
+    def result(self):
+        if self.by is None:
+            return self._total
+        return self._combine()
+
+
+class Sum(Count):
+    """Sum of one column, overall or per group of `by` columns."""
+
+    def __init__(self, col: str, by=None):
+        super().__init__(by)
+        self.col = col
+        self._total = 0.0
+
+    def _partial(self, chunk: pd.DataFrame) -> pd.Series:
+        return chunk.groupby(self.by, observed=True, sort=False)[self.col].sum()
+
+    def _partial_total(self, chunk: pd.DataFrame):
+        return float(chunk[self.col].sum())
+
+
+class DistinctCount:
+    """
+    Approximate number of distinct values of a column (HyperLogLog), overall or
+    per group. 2**precision one-byte registers per group; the standard error is
+    about 1.04 / sqrt(2**precision), i.e. under 1% at the default precision.
+    """
+
+    def __init__(self, col: str, by: str = None, precision: int = 14):
+        self.col, self.by, self.p = col, by, precision
+        self._registers = {}
+
+    def _update_registers(self, key, values: pd.Series):
+        h = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        idx = (h >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = h & np.uint64((1 << (64 - self.p)) - 1)
+        # rank = position of the leftmost 1-bit in the remaining 64 - p bits
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (64 - self.p - bit_length + 1).astype(np.uint8)
+        reg = self._registers.setdefault(key, np.zeros(1 << self.p, dtype=np.uint8))
+        np.maximum.at(reg, idx, rank)
+
+    def update(self, chunk: pd.DataFrame):
+        chunk = chunk.dropna(subset=[self.col])
+        if self.by is None:
+            self._update_registers(None, chunk[self.col])
+            return
+        for key, part in chunk.groupby(self.by, observed=True, sort=False):
+            self._update_registers(key, part[self.col])
+
+    def merge(self, other: "DistinctCount"):
+        for key, reg in other._registers.items():
+            if key in self._registers:
+                np.maximum(self._registers[key], reg, out=self._registers[key])
+            else:
+                self._registers[key] = reg.copy()
+
+    def _estimate(self, reg: np.ndarray) -> int:
+        m = reg.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        est = alpha * m * m / np.sum(np.ldexp(1.0, -reg.astype(np.int64)))
+        zeros = int((reg == 0).sum())
+        if est <= 2.5 * m and zeros:
+            est = m * np.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(est))
+
+    def result(self):
+        if self.by is None:
+            reg = self._registers.get(None)
+            return 0 if reg is None else self._estimate(reg)
+        return pd.Series({k: self._estimate(r) for k, r in self._registers.items()}, dtype="int64").sort_index()
+
+
+class SessionPages:
+    """Pageviews per session, plus the entry page (earliest pageview) of each session."""
+
+    def __init__(self, url: str = "pageview_url", ts: str = "created_at"):
+        self.url, self.ts = url, ts
+        self._parts = []
+
+    def update(self, chunk: pd.DataFrame):
+        c = chunk.dropna(subset=[SESSION_COL])[[SESSION_COL, self.ts, self.url]]
+        if c.empty:
+            return
+        first = c.sort_values(self.ts, kind="stable").drop_duplicates(SESSION_COL).set_index(SESSION_COL)
+        first["pv_count"] = c.groupby(SESSION_COL, sort=False).size()
+        first[self.url] = first[self.url].astype(object)
+        self._parts.append(first)
+        if len(self._parts) > 32:
+            self._parts = [self._combine()]
+
+    def merge(self, other: "SessionPages"):
+        self._parts += other._parts
+
+    def _combine(self) -> pd.DataFrame:
+        if len(self._parts) == 1:
+            return self._parts[0]
+        allp = pd.concat(self._parts)
+        counts = allp.groupby(level=0)["pv_count"].sum()
+        first = allp.sort_values(self.ts, kind="stable")
+        first = first[~first.index.duplicated()].copy()
+        first["pv_count"] = counts
+        return first
+
+    def result(self) -> pd.DataFrame:
+        """One row per session: website_session_id, pv_count, entry_ts, entry_url."""
+        if not self._parts:
+            return pd.DataFrame(columns=[SESSION_COL, "pv_count", "entry_ts", "entry_url"])
+        df = self._combine().rename(columns={self.ts: "entry_ts", self.url: "entry_url"})
+        return df.sort_index().reset_index()[[SESSION_COL, "pv_count", "entry_ts", "entry_url"]]
+
+
+class SessionPaths:
+    """
+    Number of sessions following each full page path.
+    Expects chunks ordered by session, then time; the rows of the last session in
+    a chunk are held back until the next chunk shows whether that session goes on.
+    Partials can only be merged when they cover disjoint sets of sessions.
+    """
+
+    def __init__(self, url: str = "pageview_url"):
+        self.url = url
+        self._counts = Counter()
+        self._carry = None
+
+    def _count(self, rows: pd.DataFrame):
+        if rows.empty:
+            return
+        self._counts.update(Clickstream(rows, url=self.url, ordered=True).path_counts().to_dict())
+
+    def update(self, chunk: pd.DataFrame):
+        chunk = chunk.dropna(subset=[SESSION_COL])[[SESSION_COL, self.url]]
+        if self._carry is not None and not self._carry.empty:
+            chunk = pd.concat([self._carry, chunk.astype({self.url: object})], ignore_index=True)
+        if chunk.empty:
+            return
+        open_session = chunk[SESSION_COL].iloc[-1]
+        done = (chunk[SESSION_COL] != open_session).to_numpy()
+        self._count(chunk[done])
+        self._carry = chunk[~done].astype({self.url: object})
+
+    def merge(self, other: "SessionPaths"):
+        other._flush()
+        self._counts.update(other._counts)
+
+    def _flush(self):
+        if self._carry is not None:
+            self._count(self._carry)
+            self._carry = None
+
+    def result(self) -> pd.Series:
+        """Sessions per path (a tuple of URLs)."""
+        self._flush()
+        if not self._counts:
+            return pd.Series(dtype="int64")
+        return pd.Series(list(self._counts.values()), index=pd.Index(list(self._counts.keys()), tupleize_cols=False))
+
+
+def fold(chunks, aggregators: dict) -> dict:
+    """Feed every chunk through every aggregator; returns {name: result}."""
+    for chunk in chunks:
+        for agg in aggregators.values():
+            agg.update(chunk)
+    return {name: agg.result() for name, agg in aggregators.items()}
+
+
+# -----------------------
+# Folds used by the pages
+# -----------------------
+
+def _of_sessions(chunks, session_predicates: tuple):
+    """The rows of each chunk whose session matches session_predicates."""
+    sessions = load_table("website_sessions", session_predicates, columns=(SESSION_COL,))
+    keep = id_flags(id_codes(sessions[SESSION_COL]), SESSION_COL)
+    for chunk in chunks:
+        codes = id_codes(chunk[SESSION_COL])
+        yield chunk[np.where(codes >= 0, keep[codes], False)]
+
+
+@st.cache_data(show_spinner=False, ttl=SNAPSHOT_MAX_AGE_HOURS * 3600)
+def _pageview_engagement(predicates: tuple, session_predicates: tuple, versions: tuple) -> dict:
+    chunks = iter_table(
+        "website_pageviews", predicates,
+        columns=(SESSION_COL, "created_at", "pageview_url"),
+        order_by=(SESSION_COL, "created_at"),
+    )
+    if session_predicates is not None:
+        chunks = _of_sessions(chunks, session_predicates)
+    return fold(chunks, {
+        "views": Count(),
+        "views_by_url": Count(by="pageview_url"),
+        "paths": SessionPaths(),
+    })
+
+
+def pageview_engagement(predicates: tuple = (), session_predicates: tuple = None) -> dict:
+    """
+    Pageview totals, views per URL and full-path counts, in a single ordered
+    pass over website_pageviews. With session_predicates (see utils.query) only
+    the pageviews of the sessions they select count. Per-session facts live in
+    utils.mart.
+    """
+    versions = (table_version("website_pageviews"), table_version("website_sessions"))
+    return _pageview_engagement(predicates, session_predicates, versions)
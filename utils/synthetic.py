@@ -0,0 +1,306 @@
+"""
+Synthetic stand-in for the SQL Server source.
+
+Writes Products, WebsiteSessions, WebsitePageViews, Orders, OrderItems and
+OrderItemRefunds to a local SQLite file, using the vocabularies and funnel
+URLs from utils.config. Scale 1 is roughly the size of the production data
+(~470k sessions, ~1.2M pageviews); the output is fully determined by the seed.
+
+    python -m utils.synthetic --scale 10 --out .cache/synthetic_10x.sqlite
+
+then point the app at it with DATABASE_URL in utils/config.py (or URL under
+[database] in .streamlit/secrets.toml):
+
+    DATABASE_URL = "sqlite:///.cache/synthetic_10x.sqlite"
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import DateTime, create_engine
+
+from .config import DEVICE_TYPE, PAGEVIEW_URLS, PRODUCT_NAMES, TABLE_NAMES, UTM_SOURCE
+
+# -----------------------
+# Shape of the data
+# -----------------------
+START = pd.Timestamp("2012-03-19")
+END = pd.Timestamp("2015-03-19")
+SESSIONS_PER_SCALE = 472_000
+BLOCK_SESSIONS = 250_000
+REPEAT_RATE = 0.17
+
+# product_id -> (launch date, product page, price, cogs); names come from config
+PRODUCTS = {
+    1: ("2012-03-19", "/the-original-mr-fuzzy", 49.99, 19.49),
+    2: ("2013-01-06", "/the-forever-love-bear", 59.99, 25.49),
+    3: ("2013-12-12", "/the-birthday-sugar-panda", 45.99, 14.49),
+    4: ("2014-02-05", "/the-hudson-river-mini-bear", 29.99, 9.49),
+}
+PRODUCT_NAME = {1: PRODUCT_NAMES[0], 2: PRODUCT_NAMES[1], 3: PRODUCT_NAMES[2], 4: PRODUCT_NAMES[3]}
+CROSS_SELL_FROM = pd.Timestamp("2013-09-25")
+BILLING_2_FROM = pd.Timestamp("2012-09-10")
+
+# utm_source -> (share, campaigns, contents, referer)
+CHANNELS = {
+    "gsearch": (0.68, ["nonbrand", "brand"], ["g_ad_1", "g_ad_2"], "https://www.gsearch.com"),
+    "bsearch": (0.16, ["nonbrand", "brand"], ["b_ad_1", "b_ad_2"], "https://www.bsearch.com"),
+    "socialbook": (0.03, ["pilot", "desktop_targeted"], ["social_ad_1", "social_ad_2"], "https://www.socialbook.com"),
+    "direct": (0.13, ["unspecified"], ["unspecified"], "direct"),
+}
+# nonbrand landers by date: the lander in use from each date on
+LANDERS = [("2012-03-19", "/home"), ("2012-06-19", "/lander-1"), ("2013-04-01", "/lander-2"),
+           ("2013-10-01", "/lander-3"), ("2014-04-01", "/lander-4"), ("2014-10-01", "/lander-5")]
+
+# Probability of moving on from each step (desktop, mobile)
+P_PRODUCTS = (0.60, 0.45)
+P_PRODUCT_PAGE = 0.74
+P_CART = 0.47
+P_SHIPPING = 0.68
+P_BILLING = 0.80
+P_THANK_YOU = {"/billing": 0.45, "/billing-2": 0.62}
+P_REFUND = {1: 0.06, 2: 0.02, 3: 0.04, 4: 0.01}
+
+assert set(CHANNELS) <= set(UTM_SOURCE)
+assert {p[1] for p in PRODUCTS.values()} <= set(PAGEVIEW_URLS)
+assert {"desktop", "mobile"} <= set(DEVICE_TYPE)
+
+
+def _timestamps(rng, n: int, q0: float, q1: float) -> np.ndarray:
+    """n sorted timestamps from quantiles [q0, q1) of a traffic curve that grows over time."""
+    u = np.sort(rng.uniform(q0, q1, n))
+    offset = np.sqrt(u) * (END - START).value
+    return (START.value + offset.astype(np.int64)) // 10**9 * 10**9
+
+
+def _choice_by_channel(rng, src: np.ndarray, idx: int) -> np.ndarray:
+    out = np.empty(len(src), dtype=object)
+    for name, spec in CHANNELS.items():
+        m = src == name
+        values = spec[idx]
+        out[m] = values if isinstance(values, str) else rng.choice(values, m.sum(), p=[0.8, 0.2] if len(values) == 2 else None)
+    return out
+
+
+def _sessions(rng, first_id: int, n: int, q0: float, q1: float, users_so_far: int) -> pd.DataFrame:
+    ts = _timestamps(rng, n, q0, q1)
+    names = list(CHANNELS)
+    src = rng.choice(names, n, p=[CHANNELS[c][0] for c in names])
+    campaign = _choice_by_channel(rng, src, 1)
+    content = _choice_by_channel(rng, src, 2)
+    referer = _choice_by_channel(rng, src, 3)
+    # a share of direct traffic is organic search
+    organic = (src == "direct") & (rng.random(n) < 0.6)
+    referer[organic] = rng.choice(["https://www.gsearch.com", "https://www.bsearch.com"], organic.sum(), p=[0.8, 0.2])
+
+    device = np.where(rng.random(n) < 0.3, "mobile", "desktop")
+    device[campaign == "desktop_targeted"] = "desktop"
+
+    # Repeat sessions reuse one of the users seen so far, skewed towards recent ones
+    repeat = rng.random(n) < REPEAT_RATE
+    if users_so_far == 0:
+        repeat[0] = False
+    users = users_so_far + np.cumsum(~repeat)
+    picked = 1 + np.floor(rng.random(n) ** 0.25 * users).astype(np.int64)
+    user_id = np.where(repeat, picked, users)
+
+    return pd.DataFrame({
+        "website_session_id": np.arange(first_id, first_id + n),
+        "created_at": ts.astype("datetime64[ns]"),
+        "user_id": user_id,
+        "is_repeat_session": repeat.astype(np.int8),
+        "utm_source": src,
+        "utm_campaign": campaign,
+        "utm_content": content,
+        "device_type": device,
+        "http_referer": referer,
+    })
+
+
+def _journeys(rng, sess: pd.DataFrame):
+    """Walk each session down the purchase funnel; returns (pageviews, product, order time, converted)."""
+    n = len(sess)
+    ts = sess["created_at"].to_numpy()
+    mobile = (sess["device_type"] == "mobile").to_numpy()
+
+    lander_dates = np.array([np.datetime64(d) for d, _ in LANDERS])
+    lander = np.array([u for _, u in LANDERS], dtype=object)[np.searchsorted(lander_dates, ts, side="right") - 1]
+    brand = sess["utm_campaign"].isin(["brand", "unspecified"]).to_numpy()
+    entry = np.where(brand, "/home", lander)
+
+    live = np.array([np.datetime64(PRODUCTS[p][0]) for p in PRODUCTS])
+    weights = (ts[:, None] >= live[None, :]).astype(float) * np.array([0.55, 0.25, 0.15, 0.05])
+    product = 1 + (rng.random(n)[:, None] * weights.sum(1, keepdims=True) > np.cumsum(weights, 1)).sum(1)
+    product_url = np.array([PRODUCTS[p][1] for p in PRODUCTS], dtype=object)[product - 1]
+
+    billing = np.where((ts >= np.datetime64(BILLING_2_FROM)) & (rng.random(n) < 0.9), "/billing-2", "/billing")
+    p_thank = np.where(billing == "/billing-2", P_THANK_YOU["/billing-2"], P_THANK_YOU["/billing"])
+
+    steps = [
+        np.full(n, True),
+        rng.random(n) < np.where(mobile, P_PRODUCTS[1], P_PRODUCTS[0]),
+        rng.random(n) < P_PRODUCT_PAGE,
+        rng.random(n) < P_CART,
+        rng.random(n) < P_SHIPPING,
+        rng.random(n) < P_BILLING,
+        rng.random(n) < p_thank,
+    ]
+    reached = np.cumprod(np.vstack(steps), axis=0).astype(bool)     # (7, n)
+    depth = reached.sum(0)
+
+    pages = np.vstack([
+        entry, np.full(n, "/products", dtype=object), product_url,
+        np.full(n, "/cart", dtype=object), np.full(n, "/shipping", dtype=object),
+        billing, np.full(n, "/thank-you-for-your-order", dtype=object),
+    ])
+    gaps = rng.exponential(75, size=(7, n)).astype(np.int64) * 10**9
+    gaps[0] = 0
+    pv_ts = ts[None, :].astype(np.int64) + np.cumsum(gaps, axis=0)
+
+    keep = reached.T.ravel()                                        # session-major order
+    pv = pd.DataFrame({
+        "created_at": pv_ts.T.ravel()[keep].astype("datetime64[ns]"),
+        "website_session_id": np.repeat(sess["website_session_id"].to_numpy(), depth),
+        "pageview_url": pages.T.ravel()[keep],
+    }).sort_values("created_at", kind="stable", ignore_index=True)
+    converted = reached[-1]
+    order_ts = pv_ts[-1].astype("datetime64[ns]")
+    return pv, product, order_ts, converted
+
+
+def _orders(rng, sess: pd.DataFrame, product, order_ts, converted, first_order_id: int, first_item_id: int):
+    by_time = np.argsort(order_ts[converted], kind="stable")
+    o = sess.loc[converted, ["website_session_id", "user_id"]].iloc[by_time].reset_index(drop=True)
+    m = len(o)
+    primary = product[converted][by_time]
+    created = order_ts[converted][by_time]
+
+    cross = (created >= np.datetime64(CROSS_SELL_FROM)) & (rng.random(m) < 0.25)
+    second = 1 + (primary + rng.integers(0, 3, m)) % 4                 # any product but the primary one
+    launched = created >= np.array([np.datetime64(PRODUCTS[p][0]) for p in PRODUCTS])[second - 1]
+    cross &= launched
+
+    price = np.array([PRODUCTS[p][2] for p in PRODUCTS])
+    cogs = np.array([PRODUCTS[p][3] for p in PRODUCTS])
+    order_id = np.arange(first_order_id, first_order_id + m)
+    orders = pd.DataFrame({
+        "order_id": order_id,
+        "created_at": created,
+        "website_session_id": o["website_session_id"],
+        "user_id": o["user_id"],
+        "primary_product_id": primary,
+        "items_purchased": 1 + cross.astype(np.int64),
+        "price_usd": np.round(price[primary - 1] + np.where(cross, price[second - 1], 0), 2),
+        "cogs_usd": np.round(cogs[primary - 1] + np.where(cross, cogs[second - 1], 0), 2),
+    })
+
+    item_order = np.concatenate([order_id, order_id[cross]])
+    item_product = np.concatenate([primary, second[cross]])
+    item_ts = np.concatenate([created, created[cross]])
+    is_primary = np.concatenate([np.ones(m, np.int8), np.zeros(cross.sum(), np.int8)])
+    sort = np.lexsort((1 - is_primary, item_order))
+    items = pd.DataFrame({
+        "order_item_id": np.arange(first_item_id, first_item_id + len(sort)),
+        "created_at": item_ts[sort],
+        "order_id": item_order[sort],
+        "product_id": item_product[sort],
+        "is_primary_item": is_primary[sort],
+        "price_usd": price[item_product[sort] - 1],
+        "cogs_usd": cogs[item_product[sort] - 1],
+    })
+    return orders, items
+
+
+def _refunds(rng, items: pd.DataFrame) -> pd.DataFrame:
+    """Refunded items; ids are assigned once all blocks are done."""
+    p = items["product_id"].map(P_REFUND).to_numpy()
+    r = items[rng.random(len(items)) < p]
+    delay = rng.integers(1, 30, len(r)).astype("timedelta64[D]")
+    return pd.DataFrame({
+        "order_item_refund_id": 0,
+        "created_at": r["created_at"].to_numpy() + delay,
+        "order_item_id": r["order_item_id"].to_numpy(),
+        "order_id": r["order_id"].to_numpy(),
+        "refund_amount_usd": r["price_usd"].to_numpy(),
+    })
+
+
+def generate(path: str, scale: float = 1, seed: int = 0, verbose: bool = True) -> dict:
+    """Write a synthetic dataset of the given scale to the SQLite file at path; returns row counts."""
+    rng = np.random.default_rng(seed)
+    n_sessions = int(SESSIONS_PER_SCALE * scale)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+
+    # Written through SQLAlchemy's DateTime type, so created_at is stored in the
+    # same text format the app binds its date predicates in (utils.query)
+    engine = create_engine(f"sqlite:///{os.path.abspath(path)}")
+    con = engine.connect()
+    con.exec_driver_sql("PRAGMA journal_mode = OFF")
+    con.exec_driver_sql("PRAGMA synchronous = OFF")
+
+    def write(table_key: str, df: pd.DataFrame):
+        df.to_sql(TABLE_NAMES[table_key], con, if_exists="append", index=False, chunksize=50_000,
+                  dtype={"created_at": DateTime()})
+        rows[table_key] += len(df)
+
+    rows = dict.fromkeys(TABLE_NAMES, 0)
+    write("products", pd.DataFrame({
+        "product_id": list(PRODUCTS),
+        "created_at": pd.to_datetime([PRODUCTS[p][0] for p in PRODUCTS]),
+        "product_name": [PRODUCT_NAME[p] for p in PRODUCTS],
+    }))
+
+    users_so_far = 0
+    refunds = []
+    t0 = time.time()
+    for start in range(0, n_sessions, BLOCK_SESSIONS):
+        n = min(BLOCK_SESSIONS, n_sessions - start)
+        sess = _sessions(rng, start + 1, n, start / n_sessions, (start + n) / n_sessions, users_so_far)
+        users_so_far = int(sess["user_id"].max())
+        pv, product, order_ts, converted = _journeys(rng, sess)
+        pv.insert(0, "website_pageview_id", np.arange(rows["website_pageviews"] + 1, rows["website_pageviews"] + len(pv) + 1))
+        orders, items = _orders(rng, sess, product, order_ts, converted,
+                                rows["orders"] + 1, rows["order_items"] + 1)
+
+        write("website_sessions", sess)
+        write("website_pageviews", pv)
+        write("orders", orders)
+        write("order_items", items)
+        refunds.append(_refunds(rng, items))
+        if verbose:
+            print(f"  {start + n:>12,} / {n_sessions:,} sessions  ({time.time() - t0:.0f}s)")
+
+    # Refunds land days after their orders, so ids follow created_at across blocks
+    refunds = pd.concat(refunds, ignore_index=True).sort_values("created_at", kind="stable")
+    refunds["order_item_refund_id"] = np.arange(1, len(refunds) + 1)
+    write("order_item_refunds", refunds)
+
+    for table_key, table_name in TABLE_NAMES.items():
+        con.exec_driver_sql(f'CREATE INDEX "ix_{table_name}_created_at" ON "{table_name}" (created_at)')
+    con.commit()
+    con.close()
+    engine.dispose()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic eCommerce dataset as a SQLite file.")
+    parser.add_argument("--scale", type=float, default=1, help="size relative to production: 1, 10, 100 (fractions allowed)")
+    parser.add_argument("--out", default=None, help="SQLite file to write (default: .cache/synthetic_<scale>x.sqlite)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    out = args.out or os.path.join(".cache", f"synthetic_{args.scale:g}x.sqlite")
+    print(f"Writing scale {args.scale:g} dataset to {out}")
+    rows = generate(out, args.scale, args.seed)
+    for table_key, n in rows.items():
+        print(f"  {TABLE_NAMES[table_key]:<18} {n:>14,}")
+    print(f'\nDATABASE_URL = "sqlite:///{out}"')
+
+
+if __name__ == "__main__":
+    main()
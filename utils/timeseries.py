@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from .colcache import derived
+
+# -----------------------
+# Time bucketing. A timestamp column is turned into integer bucket codes (day
+# number, Monday-based week number, month, year, hour of day, weekday) and
+# totals are reduced with bincount over those codes; the frame itself is never
+# copied or extended. Codes are cached per underlying timestamp array
+# (utils.colcache), so the filtered frames a session reuses (utils.memo) and
+# their copy-on-write projections share them across pages and reruns.
+# -----------------------
+
+from .config import CALENDAR_COLUMNS
+
+GRANULARITIES = ["Daily", "Weekly", "Monthly", "Yearly", "Hour", "Weekday"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+NAT = np.iinfo(np.int64).min
+DAY_NS = 86_400 * 10**9
+HOUR_NS = 3_600 * 10**9
+
+
+def _compute_codes(ts: np.ndarray, granularity: str) -> np.ndarray:
+    ns = ts.view("i8")
+    valid = ns != NAT
+    if granularity == "Monthly":
+        return ts.astype("datetime64[M]").view("i8")
+    if granularity == "Yearly":
+        return np.where(valid, ts.astype("datetime64[Y]").view("i8") + 1970, NAT)
+    if granularity == "Hour":
+        return np.where(valid, ns // HOUR_NS % 24, NAT)
+    day = ns // DAY_NS
+    if granularity == "Weekly":
+        codes = (day + 3) // 7  # 1970-01-01 was a Thursday
+    elif granularity == "Weekday":
+        codes = (day + 3) % 7
+    else:
+        codes = day
+    return np.where(valid, codes, NAT)
+
+
+def bucket_codes(ts: pd.Series, granularity: str) -> np.ndarray:
+    """int64 bucket code of every timestamp (NAT where it is missing); unknown granularities are Daily."""
+    if granularity not in GRANULARITIES:
+        granularity = "Daily"
+    if not pd.api.types.is_datetime64_dtype(ts):
+        ts = pd.to_datetime(ts, errors="coerce")
+    return derived(ts, ("bucket", granularity),
+                   lambda s: _compute_codes(s.to_numpy(dtype="datetime64[ns]"), granularity))
+
+
+def calendar_features(ts: pd.Series) -> dict:
+    """
+    CALENDAR_COLUMNS for a timestamp column: day (days since 1970-01-01), hour,
+    weekday (Monday = 0), ISO week, month and year, as compact integers.
+    """
+    arr = ts.to_numpy(dtype="datetime64[ns]")
+    missing = arr.view("i8") == NAT
+    day = arr.astype("datetime64[D]").view("i8")
+    weekday = (day + 3) % 7
+    thursday = (day - weekday + 3).astype("datetime64[D]")  # ISO weeks belong to the year of their Thursday
+    iso_week = (thursday - thursday.astype("datetime64[Y]").astype("datetime64[D]")).view("i8") // 7 + 1
+    features = {
+        "day": (day, np.int32),
+        "hour": (arr.view("i8") // HOUR_NS % 24, np.int8),
+        "weekday": (weekday, np.int8),
+        "iso_week": (iso_week, np.int8),
+        "month": (arr.astype("datetime64[M]").view("i8") % 12 + 1, np.int8),
+        "year": (arr.astype("datetime64[Y]").view("i8") + 1970, np.int16),
+    }
+    return {c: np.where(missing, -1, features[c][0]).astype(features[c][1]) for c in CALENDAR_COLUMNS}
+
+
+def weekday_counts(start, end) -> np.ndarray:
+    """How many of each weekday (Monday first) the dates from start to end, inclusive, contain."""
+    first = pd.Timestamp(start).normalize().value // DAY_NS
+    last = pd.Timestamp(end).normalize().value // DAY_NS
+    return np.bincount((np.arange(first, last + 1) + 3) % 7, minlength=7)
+
+
+def _calendar_column(df: pd.DataFrame, col: str, granularity: str) -> np.ndarray:
+    if col in df.columns:
+        return df[col].to_numpy()
+    codes = bucket_codes(df["created_at"], granularity)
+    return np.where(codes == NAT, -1, codes)
+
+
+def hour_weekday_counts(df: pd.DataFrame, start=None, end=None):
+    """
+    (totals, days): rows per hour (24) x weekday (7) from the calendar columns,
+    in one bincount, and how often each weekday occurs between start and end
+    (default: the first and last day in df).
+    """
+    hour = _calendar_column(df, "hour", "Hour")
+    weekday = _calendar_column(df, "weekday", "Weekday")
+    ok = (hour >= 0) & (weekday >= 0)
+    totals = np.bincount(hour[ok].astype(np.intp) * 7 + weekday[ok], minlength=24 * 7).reshape(24, 7)
+    if start is None or end is None:
+        day = _calendar_column(df, "day", "Daily")[ok]
+        if not len(day):
+            return totals, np.zeros(7, dtype=np.int64)
+        start = start if start is not None else pd.Timestamp(int(day.min()) * DAY_NS)
+        end = end if end is not None else pd.Timestamp(int(day.max()) * DAY_NS)
+    return totals, weekday_counts(start, end)
+
+
+def bucket_labels(codes: np.ndarray, granularity: str):
+    """Bucket labels for codes: period start timestamps, years, hours or weekday names."""
+    if granularity == "Monthly":
+        return pd.to_datetime(codes.astype("datetime64[M]"))
+    if granularity in ("Yearly", "Hour"):
+        return codes
+    if granularity == "Weekday":
+        return pd.Categorical.from_codes(codes, categories=WEEKDAYS, ordered=True)
+    if granularity == "Weekly":
+        codes = codes * 7 - 3
+    return pd.to_datetime(codes * DAY_NS)
+
+
+def bucket_totals(df: pd.DataFrame, ts_col: str, granularity: str, values=(), by=(),
+                  count: str = "count", mask: np.ndarray = None, dropna: bool = True) -> pd.DataFrame:
+    """
+    Row count (as `count`) and sums of `values` per time bucket and `by` group,
+    over the rows selected by `mask`. Rows are ordered by bucket, then by group;
+    empty combinations are left out, as in an observed groupby.
+    """
+    granularity = granularity if granularity in GRANULARITIES else "Daily"
+    by = [by] if isinstance(by, str) else list(by)
+    codes = bucket_codes(df[ts_col], granularity)
+    valid = codes != NAT
+    if mask is not None:
+        valid = valid & mask
+
+    group = np.zeros(len(df), dtype=np.int64)
+    uniques, sizes = [], []
+    for col in by:
+        g, u = pd.factorize(df[col], sort=True, use_na_sentinel=dropna)
+        if dropna:
+            valid &= g >= 0
+        group = group * max(len(u), 1) + g
+        uniques.append(u)
+        sizes.append(max(len(u), 1))
+    n_groups = int(np.prod(sizes)) if sizes else 1
+
+    lo = int(codes[valid].min()) if valid.any() else 0
+    hi = int(codes[valid].max()) if valid.any() else -1
+    key = (codes[valid] - lo) * n_groups + group[valid]
+    size = (hi - lo + 1) * n_groups
+    counts = np.bincount(key, minlength=size)
+    cells = np.flatnonzero(counts)
+
+    bucket, g = np.divmod(cells, n_groups)
+    out = {"bucket": bucket_labels(bucket + lo, granularity)}
+    for col, u, n in zip(reversed(by), reversed(uniques), reversed(sizes)):
+        g, pos = np.divmod(g, n)
+        out[col] = u.take(pos)
+    out = {"bucket": out["bucket"], **{col: out[col] for col in by}, count: counts[cells]}
+    for col in ([values] if isinstance(values, str) else values):
+        w = np.nan_to_num(df[col].to_numpy(dtype="float64", na_value=np.nan)[valid])
+        out[col] = np.bincount(key, weights=w, minlength=size)[cells]
+    return pd.DataFrame(out)